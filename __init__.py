@@ -1,7 +1,29 @@
 from .__version__ import __version__
-from .fns import FNS
+from .fns import FNS, LookupResult, DocResult
+from .client import Client, select_row
+from .afns import AsyncFNS
+from .cache import MemoryCache, SQLiteCache
+from .pdf_store import PdfStore
+from .extract import Extract, Section
+from .snapshot import Snapshot, SnapshotEntry, Change, diff_rows
+from .pdf_check import find_mark, find_mark_many, MarkResult
+from .limiter import Scheduler, default_scheduler
+from .coordination import Coordinator, SharedScheduler, SQLiteStore
+from .proxy import ProxyPool
+from .record import OrgRecord, parse_row, parse_dirs, parse_dirs_many
+from . import address
+from .address import Address
+from .address_index import AddressIndex, AddressMatch
+from .transport import make_session, Deadline
+from .errors import FNSError, FNSTimeoutError, FNSValueError
+from . import ids
+from . import log
+from .metrics import Metrics, NULL_METRICS, CallbackExporter, SpanRecorder, OtelExporter
+from .export import export, open_exporter, CsvExporter, JsonlExporter, ParquetExporter
 from .fl import (
+    FL,
     find_fl_inn,
     find_fl_inn_new,
+    find_fl_inn_many,
     fl_passport_prepare,
 )
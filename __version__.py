@@ -1,4 +1,101 @@
-__version__ = '0.24'
+__version__ = '0.49'
+
+# v0.49
+# - coordination.Coordinator: согласование процессов одного или нескольких хостов - общий token bucket, общая пауза после капчи, один запрос на все процессы для одинакового поиска
+# - coordination.SQLiteStore - хранилище с командами Redis get / set / delete в файле SQLite, подходит и redis.Redis
+# - параметр coordinator у FNS и Client, ключ --shared в командной строке
+
+# v0.48
+# - client.Client: транспорт и настройки без состояния запроса, один объект на весь пул потоков; info / records / info_many возвращают OrgRecord, doc_pdf / extract / check_valid - отдельные результаты
+# - FNS делает все запросы через свой Client (FNS.client, параметр client=), поля организации по-прежнему в объекте
+# - bench: сценарий Client.info на общем клиенте
+
+# v0.47
+# - record.parse_dirs: разбор поля 'g' одним регулярным выражением за проход, запятые в должностях и в фио последнего руководителя, без исключений на пустых и нестроковых значениях
+# - record.parse_dirs_many: пакетный разбор руководителей
+
+# v0.46
+# - extract.Extract: разбор pdf выписки в разделы и поля (участники, доли, ОКВЭД, лицензии, записи ЕГРЮЛ) по страницам по мере обращения
+# - FNS.get_extract; PdfStore.extract хранит полный разбор рядом с pdf
+# - fake_nalog.sample_extract - выписка в виде таблицы с номерами строк, колонками и колонтитулами
+
+# v0.45
+# - ids: проверка контрольных цифр ИНН (10/12), ОГРН и ОГРНИП, пакетно для списков и массивов numpy
+# - info, search, info_many, recheck_many и AsyncFNS.search отклоняют неверные ИНН/ОГРН без запроса в ФНС (errors.FNSValueError)
+# - FNS.is_inn проверяет контрольные цифры
+
+# v0.44
+# - address_index.AddressIndex: индекс организаций по адресу в SQLite, дополняется результатами info_many, выгрузками и записями ФНС
+# - same - организации в том же здании / помещении, similar - похожие адреса по триграммам
+
+# v0.43
+# - address: нормализация адреса за один проход по словам с поиском в таблице вариантов обозначений (УЛ, УЛ., УЛИЦА)
+# - address.parse / parse_many - части адреса (индекс, город, улица, дом, корпус, офис); FNS.addr_cut вызывает address.normalize
+
+# v0.42
+# - FNS.recheck_many и snapshot.Snapshot: инкрементальная повторная проверка, diff изменившихся полей
+# - выписка загружается и проверяется заново только при изменении n, a, g, e, v или по сроку; ключ --snapshot
+
+# v0.41
+# - proxy.ProxyPool: запросы FNS и FL распределяются по прокси, у каждого прокси своя скорость и пауза после капчи
+# - прокси с ошибками и капчами подряд временно выводятся из ротации; ключ --proxies командной строки
+
+# v0.40
+# - библиотека не пишет в stdout: вся диагностика через журнал 'FNS' с ленивым форматированием и полями extra (event, endpoint, ...)
+# - log.console() - вывод журнала в консоль, как print раньше; ключ -q/--quiet командной строки
+
+# v0.39
+# - metrics.Metrics: гистограммы времени запросов по эндпоинтам, повторы, капчи, раунды 'wait', паузы, байты, время проверки pdf
+# - экспорт в формате Prometheus, спаны (CallbackExporter, SpanRecorder, OtelExporter), параметр metrics в FNS, AsyncFNS, FL
+
+# v0.38
+# - FNS.get_doc_pdf_many: конвейерная загрузка выписок, общий опрос статусов, загрузка по готовности
+
+# v0.37
+# - таймаут каждого HTTP запроса (timeout) в FNS, AsyncFNS, FL
+# - общий срок операции deadline в info, search, get_doc_pdf, is_valid_org_check, info_many, find_fl_inn_new
+# - errors.FNSError, errors.FNSTimeoutError
+
+# v0.36
+# - fl.FL: клиент получения ИНН ФЛ с пулом keep-alive соединений, таймаутом, прокси и base_url
+# - transport.make_session: общая сессия для FNS и FL
+
+# v0.35
+# - пакетное получение ИНН ФЛ find_fl_inn_many: конвейер запросов и общий опрос ожидающих requestId
+
+# v0.34
+# - локальный имитатор сервисов ФНС fake_nalog.FakeNalog и бенчмарки python -m fns.bench (оп/с, p50/p99)
+# - параметр base_url у FNS и AsyncFNS
+
+# v0.33
+# - командная строка python -m fns: пакетная проверка ИНН из файла, параллельность, скорость, проверка выписок, продолжение по checkpoint
+# - FNS.info_many(check_valid=True) - проверка недостоверности в пуле потоков
+
+# v0.32
+# - потоковая выгрузка результатов проверок export: CSV, JSON Lines, Parquet, плоская и вложенная раскладка руководителей
+
+# v0.31
+# - компактная неизменяемая запись record.OrgRecord и функция разбора parse_row, FNS.record
+
+# v0.30
+# - общий планировщик запросов limiter.Scheduler: token bucket на хост, адаптивная скорость, пауза с разбросом после капчи
+# - все запросы FNS, AsyncFNS и fl.py идут через планировщик, фиксированные паузы убраны
+
+# v0.29
+# - быстрая проверка недостоверности pdf_check.find_mark без полного извлечения текста, страница и раздел отметки
+# - find_mark_many - проверка многих выписок в пуле процессов
+
+# v0.28
+# - хранилище pdf выписок PdfStore: get_doc_pdf, save_doc_pdf, is_valid_org_check не загружают свежую выписку повторно
+
+# v0.27
+# - кэш результатов поиска: MemoryCache (LRU в памяти) и SQLiteCache (файл), время жизни записей, счетчики попаданий
+
+# v0.26
+# - пакетная проверка FNS.info_many: пул потоков, общая сессия, удаление повторов, результаты по мере готовности
+
+# v0.25
+# - асинхронный клиент AsyncFNS (aiohttp) с ограничением количества одновременных запросов
 
 # v0.24
 # - исправлена ошибка find_fl_inn_new возвращал ключ 'code' вместо 'state'
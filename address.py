@@ -0,0 +1,198 @@
+#*- coding: utf-8 -*-
+"""Нормализация адресов ЕГРЮЛ/ЕГРИП
+
+    normalize('194358, САНКТ-ПЕТЕРБУРГ ГОРОД, УЛИЦА ШОСТАКОВИЧА,  3,  1,  ЛИТ.А ПОМЕЩЕНИЕ 8-Н')
+        '194358 САНКТ-ПЕТЕРБУРГ [УЛИЦА] ШОСТАКОВИЧА 3 1 [ЛИТЕРА] А [ПОМЕЩЕНИЕ] 8-Н'
+    parse(...)
+        Address(postcode='194358', region='', city='САНКТ-ПЕТЕРБУРГ', street='УЛИЦА ШОСТАКОВИЧА',
+                house='3', building='1 А', office='8-Н', text='194358 САНКТ-ПЕТЕРБУРГ ...')
+
+    Адрес разбирается за один проход по словам (между пробелами и запятыми) с поиском в заранее построенной
+    таблице _WORDS. Обозначение (УЛИЦА, УЛ., УЛ ...) распознается только целым словом или сокращением с точкой
+    в начале слова ('Г.МОСКВА', 'ЛИТ.А'), поэтому результат не зависит от порядка вариантов, а из вариантов
+    'ЛИТЕРА' / 'ЛИТЕР' / 'ЛИТ' всегда выбирается все слово целиком.
+    В нормализованной строке обозначения заменяются на [УЛИЦА], [ДОМ], ..., обозначение города опускается,
+    запятые и повторные пробелы - один пробел.
+"""
+from typing import NamedTuple
+
+
+# каноническое обозначение: (часть адреса, варианты написания)
+_KEYWORDS = {
+    'ОБЛАСТЬ': ('region', ('ОБЛАСТЬ', 'ОБЛ')),
+    'КРАЙ': ('region', ('КРАЙ',)),
+    'РЕСПУБЛИКА': ('region', ('РЕСПУБЛИКА', 'РЕСП')),
+    'РАЙОН': ('region', ('РАЙОН', 'Р-Н')),
+    'ГОРОД': ('city', ('ГОРОД', 'Г')),
+    'ПОСЕЛОК': ('city', ('ПОСЕЛОК', 'ПОС', 'П')),
+    'СЕЛО': ('city', ('СЕЛО',)),
+    'ДЕРЕВНЯ': ('city', ('ДЕРЕВНЯ', 'ДЕР')),
+    'УЛИЦА': ('street', ('УЛИЦА', 'УЛ')),
+    'ПРОСПЕКТ': ('street', ('ПРОСПЕКТ', 'ПР-КТ', 'ПР-Т', 'ПР')),
+    'ШОССЕ': ('street', ('ШОССЕ', 'Ш')),
+    'ПЕРЕУЛОК': ('street', ('ПЕРЕУЛОК', 'ПЕР')),
+    'НАБЕРЕЖНАЯ': ('street', ('НАБЕРЕЖНАЯ', 'НАБ')),
+    'БУЛЬВАР': ('street', ('БУЛЬВАР', 'Б-Р')),
+    'ПЛОЩАДЬ': ('street', ('ПЛОЩАДЬ', 'ПЛ')),
+    'ПРОЕЗД': ('street', ('ПРОЕЗД',)),
+    'ДОМ': ('house', ('ДОМ', 'Д')),
+    'ВЛАДЕНИЕ': ('house', ('ВЛАДЕНИЕ', 'ВЛД', 'ВЛ')),
+    'КОРПУС': ('building', ('КОРПУС', 'КОРП', 'К')),
+    'СТРОЕНИЕ': ('building', ('СТРОЕНИЕ', 'СТР')),
+    'ЛИТЕРА': ('building', ('ЛИТЕРА', 'ЛИТЕР', 'ЛИТ')),
+    'ОФИС': ('office', ('ОФИС', 'ОФ')),
+    'ПОМЕЩЕНИЕ': ('office', ('ПОМЕЩЕНИЕ', 'ПОМ')),
+    'КВАРТИРА': ('office', ('КВАРТИРА', 'КВ')),
+    'КОМНАТА': ('office', ('КОМНАТА', 'КОМ')),
+}
+
+# однобуквенные и двусмысленные сокращения распознаются только с точкой: 'П. ', 'Ш.', 'ПР.', 'К.'
+_DOT_ONLY = {'П', 'Ш', 'ПР', 'ПЛ', 'КОМ', 'ВЛ', 'К'}
+
+# обозначения, которые не попадают в нормализованную строку
+_SILENT = {'ГОРОД'}
+
+_PART = {canon: part for canon, (part, _) in _KEYWORDS.items()}
+_MARK = {canon: '' if canon in _SILENT else '[%s]' % canon for canon in _KEYWORDS}
+
+# таблица слов адреса: вариант написания ('УЛ', 'УЛ.', 'УЛИЦА') -> каноническое обозначение
+_WORDS = {v + '.': canon for canon, (_, variants) in _KEYWORDS.items() for v in variants}
+_WORDS.update((v, canon) for canon, (_, variants) in _KEYWORDS.items() for v in variants if v not in _DOT_ONLY)
+# слово -> метка в нормализованной строке
+_WORD_MARKS = {w: _MARK[canon] for w, canon in _WORDS.items()}
+
+
+class Address(NamedTuple):
+    """Части адреса (пустая строка - нет в адресе)
+
+        region, street - с каноническим обозначением ('УЛИЦА ШОСТАКОВИЧА'), city - без обозначения ('САНКТ-ПЕТЕРБУРГ'),
+        building - корпус, строение и литера через пробел, office - офис, помещение, квартира, комната,
+        text - нормализованная строка normalize()
+    """
+    postcode: str = ''
+    region: str = ''
+    city: str = ''
+    street: str = ''
+    house: str = ''
+    building: str = ''
+    office: str = ''
+    text: str = ''
+
+
+def _prepare(address):
+    return str(address).upper().replace('Ё', 'Е')
+
+
+def normalize(address):
+    """
+        Нормализованная строка адреса для сравнения
+    """
+    parts = []
+    append = parts.append
+    marks = _WORD_MARKS
+    for word in _prepare(address).replace(',', ' ').split():
+        mark = marks.get(word)
+        if mark is None:
+            i = word.find('.')
+            if i > 0:
+                # сокращение с точкой слитно со значением: 'Г.МОСКВА', 'ЛИТ.А'
+                mark = marks.get(word[:i + 1])
+                if mark is not None:
+                    word = word[i + 1:]
+                    if mark:
+                        append(mark)
+            append(word)
+        elif mark:
+            append(mark)
+    return ' '.join(parts)
+
+
+def normalize_many(addresses):
+    """
+        normalize для списка адресов, список строк в том же порядке
+    """
+    return [normalize(a) for a in addresses]
+
+
+def parse(address):
+    """
+        Разбор адреса на части, Address
+    """
+    parts = []
+    fields = {}
+    for chunk in _prepare(address).split(','):
+        segment = [[None, []]]  # часть между запятыми: [обозначение, слова]
+        for word in chunk.split():
+            canon = _WORDS.get(word)
+            if canon is None:
+                i = word.find('.')
+                if i > 0:
+                    canon = _WORDS.get(word[:i + 1])
+                    if canon is not None:
+                        word = word[i + 1:]
+                        if _MARK[canon]:
+                            parts.append(_MARK[canon])
+                        segment.append([canon, []])
+                parts.append(word)
+                segment[-1][1].append(word)
+            else:
+                if _MARK[canon]:
+                    parts.append(_MARK[canon])
+                segment.append([canon, []])
+        _segment(segment, fields)
+
+    fields.pop('_city_guess', None)
+    fields['text'] = ' '.join(parts)
+    return Address(**fields)
+
+
+def parse_many(addresses):
+    """
+        parse для списка адресов, список Address в том же порядке
+    """
+    return [parse(a) for a in addresses]
+
+
+def _segment(segment, fields):
+    head = segment[0][1]
+    for canon, words in segment[1:]:
+        if not words and head:
+            # обозначение после названия: 'САНКТ-ПЕТЕРБУРГ ГОРОД', 'ШОСТАКОВИЧА УЛ'
+            words, head = head, []
+        part = _PART[canon]
+        value = ' '.join(words)
+        if part in ('region', 'street'):
+            value = canon + ' ' + value if value else canon
+        elif not value:
+            continue
+        _put(fields, part, value)
+    if head:
+        _bare(fields, ' '.join(head))
+
+
+def _put(fields, part, value):
+    if part in ('building', 'office') and fields.get(part):
+        fields[part] += ' ' + value
+    elif part == 'city' and fields.get('city') and not fields.get('_city_guess'):
+        return  # первый явно обозначенный населенный пункт
+    else:
+        fields[part] = value
+        if part == 'city':
+            fields.pop('_city_guess', None)
+
+
+def _bare(fields, value):
+    # часть адреса без обозначения: индекс, город, улица или номера дома, корпуса, помещения по порядку
+    if 'postcode' not in fields and len(value) == 6 and value.isdigit():
+        fields['postcode'] = value
+    elif value[0].isdigit():
+        for part in ('house', 'building', 'office'):
+            if part not in fields:
+                fields[part] = value
+                return
+        fields['office'] += ' ' + value
+    elif 'city' not in fields and 'street' not in fields:
+        fields['city'] = value
+        fields['_city_guess'] = True
+    elif 'street' not in fields:
+        fields['street'] = value
@@ -0,0 +1,211 @@
+#*- coding: utf-8 -*-
+"""Индекс организаций по адресу регистрации (проверка адреса массовой регистрации)
+
+    index = AddressIndex('addresses.db')
+    index.add_many(fns.info_many(inns))      # LookupResult, FNS, OrgRecord, строки выгрузки или записи rows ФНС
+    index.same('194358, САНКТ-ПЕТЕРБУРГ ГОРОД, УЛИЦА ШОСТАКОВИЧА, 3, 1, ЛИТ. А')    # тот же дом
+    index.similar('САНКТ-ПЕТЕРБУРГ, ШОСТАКОВИЧА УЛ, Д. 3 К. 1')                     # похожие адреса
+
+    Адреса хранятся в нормализованном виде (address.parse). Для точного поиска - ключ здания
+    (город, улица, дом, корпус) и ключ с помещением, оба проиндексированы. Для нечеткого - инвертированный
+    индекс триграмм слов адреса: кандидаты отбираются по самым редким триграммам запроса, затем
+    сортируются по сходству Жаккара множеств триграмм. Индекс хранится в файле SQLite и дополняется
+    по одной организации: повторное добавление заменяет прежний адрес.
+"""
+import sqlite3
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+from .address import parse, _KEYWORDS
+from .record import parse_row
+from .export import to_row
+
+
+_STREETS = {canon for canon, (part, _) in _KEYWORDS.items() if part == 'street'}
+
+
+class AddressMatch(NamedTuple):
+    """Найденная организация: ключ (ОГРН или ИНН), исходный адрес, наименование, сходство адресов 0..1"""
+    key: str
+    address: str
+    title: str = ''
+    score: float = 1.0
+
+
+def place_key(addr, office=False):
+    """
+        Ключ здания из address.Address: город|улица без обозначения|дом|корпус (office=True - и помещение), '' если нет дома
+        Литера входит в корпус (address.Address.building): 'ДОМ 3 КОРПУС 1' и 'ДОМ 3 КОРПУС 1 ЛИТЕРА А' - разные здания
+    """
+    if not addr.house:
+        return ''
+    # улица без обозначения: 'МИРА' и 'УЛИЦА МИРА' - одна улица
+    street = addr.street.split(' ', 1)
+    street = street[-1] if street[0] in _STREETS else addr.street
+    parts = [addr.city, street, addr.house, addr.building]
+    if office:
+        parts.append(addr.office)
+    return '|'.join(parts)
+
+
+def trigrams(text):
+    """
+        Множество триграмм слов нормализованного адреса (слова с пробелом по краям)
+    """
+    grams = set()
+    update = grams.update
+    for word in text.replace('[', '').replace(']', '').split():
+        word = ' %s ' % word
+        update([word[i:i + 3] for i in range(len(word) - 2)])
+    return grams
+
+
+def _record(item):
+    # (ключ, адрес, наименование) из LookupResult, FNS, OrgRecord, строки выгрузки или записи rows ФНС
+    if isinstance(item, dict) and 'a' in item and 'address' not in item:
+        item = parse_row(item)
+    row = to_row(item)
+    return row['ogrn'] or row['inn'], row['address'], row['title_short'] or row['title_long']
+
+
+class AddressIndex(object):
+    """Индекс организаций по адресу в файле SQLite
+
+        path - путь к файлу базы (':memory:' - в памяти)
+        candidates - сколько кандидатов нечеткого поиска сравнивается по сходству
+        rare_grams - по скольким самым редким триграммам запроса отбираются кандидаты
+    """
+
+    def __init__(self, path, candidates=200, rare_grams=8):
+        self.path = path
+        self.candidates = candidates
+        self.rare_grams = rare_grams
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS address '
+                           '(key TEXT PRIMARY KEY, address TEXT, title TEXT, text TEXT, place TEXT, room TEXT)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS address_place ON address (place)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS address_room ON address (room)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS gram '
+                           '(gram TEXT, key TEXT, PRIMARY KEY (gram, key)) WITHOUT ROWID')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS gram_count (gram TEXT PRIMARY KEY, n INTEGER) WITHOUT ROWID')
+
+    def add(self, key, address, title=''):
+        """
+            Добавляет или заменяет адрес организации key (ОГРН или ИНН)
+        """
+        self.add_many([(key, address, title)])
+
+    def add_many(self, items):
+        """
+            Добавляет организации одной транзакцией, возвращает количество добавленных или измененных
+            items - кортежи (ключ, адрес, наименование) или LookupResult, FNS, OrgRecord,
+                    строки выгрузки export.to_row, записи rows ответа ФНС
+            Записи без ключа или адреса и с неизменившимся адресом пропускаются.
+        """
+        count = 0
+        counts = Counter()  # изменения gram_count за транзакцию
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for item in items:
+                    if isinstance(item, tuple) and not hasattr(item, '_fields'):
+                        key, address, title = (tuple(item) + ('',))[:3]
+                    else:
+                        key, address, title = _record(item)
+                    if key and address and self._put(key, address, title, counts):
+                        count += 1
+                self._update_counts(counts)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return count
+
+    def _put(self, key, address, title, counts):
+        old = self._conn.execute('SELECT address, text FROM address WHERE key = ?', (key,)).fetchone()
+        if old is not None and old[0] == address:
+            return False
+        if old is not None:
+            self._remove_grams(key, old[1], counts)
+        addr = parse(address)
+        self._conn.execute('INSERT OR REPLACE INTO address VALUES (?, ?, ?, ?, ?, ?)',
+                           (key, address, title, addr.text, place_key(addr), place_key(addr, office=True)))
+        grams = trigrams(addr.text)
+        self._conn.executemany('INSERT OR IGNORE INTO gram VALUES (?, ?)', [(g, key) for g in grams])
+        counts.update(grams)
+        return True
+
+    def _remove_grams(self, key, text, counts):
+        grams = trigrams(text)
+        self._conn.executemany('DELETE FROM gram WHERE gram = ? AND key = ?', [(g, key) for g in grams])
+        counts.subtract(grams)
+
+    def _update_counts(self, counts):
+        self._conn.executemany('INSERT INTO gram_count VALUES (?, ?) ON CONFLICT (gram) DO UPDATE SET n = n + ?',
+                               ((g, n, n) for g, n in counts.items() if n))
+
+    def delete(self, key):
+        with self._lock:
+            old = self._conn.execute('SELECT text FROM address WHERE key = ?', (key,)).fetchone()
+            if old is not None:
+                counts = Counter()
+                self._conn.execute('BEGIN')
+                self._remove_grams(key, old[0], counts)
+                self._update_counts(counts)
+                self._conn.execute('DELETE FROM address WHERE key = ?', (key,))
+                self._conn.execute('COMMIT')
+
+    def same(self, address, office=False):
+        """
+            Организации в том же здании (город, улица, дом, корпус), office=True - в том же помещении
+            Список AddressMatch, пустой если в адресе не найден дом
+        """
+        key = place_key(parse(address), office)
+        if not key:
+            return []
+        column = 'room' if office else 'place'
+        with self._lock:
+            rows = self._conn.execute('SELECT key, address, title FROM address WHERE %s = ?' % column,
+                                      (key,)).fetchall()
+        return [AddressMatch(*row) for row in rows]
+
+    def similar(self, address, limit=20, min_score=0.5):
+        """
+            Организации с похожим адресом, от самого похожего, не больше limit
+            min_score - минимальное сходство Жаккара триграмм адресов (1.0 - совпадают после нормализации)
+        """
+        grams = trigrams(parse(address).text)
+        if not grams:
+            return []
+        with self._lock:
+            counts = self._query_in('SELECT gram, n FROM gram_count WHERE n > 0 AND gram IN (%s)', grams)
+            rare = [g for g, _ in sorted(counts, key=lambda c: c[1])[:self.rare_grams]]
+            if not rare:
+                return []
+            hits = self._query_in('SELECT key, COUNT(*) AS c FROM gram WHERE gram IN (%s) '
+                                  'GROUP BY key ORDER BY c DESC LIMIT ?', rare, (self.candidates,))
+            rows = self._query_in('SELECT key, address, title, text FROM address WHERE key IN (%s)',
+                                  [key for key, _ in hits])
+
+        matches = []
+        for key, addr, title, text in rows:
+            other = trigrams(text)
+            score = len(grams & other) / len(grams | other)
+            if score >= min_score:
+                matches.append(AddressMatch(key, addr, title, round(score, 4)))
+        matches.sort(key=lambda m: (-m.score, m.key))
+        return matches[:limit]
+
+    def _query_in(self, sql, values, tail=()):
+        values = list(values)
+        return self._conn.execute(sql % ','.join('?' * len(values)), values + list(tail)).fetchall()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM address').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,311 @@
+#*- coding: utf-8 -*-
+import json
+import time
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp - необязательная зависимость
+    aiohttp = None
+
+from .fns import FNS
+from .client import Client
+from .cache import normalize_query
+from .ids import check_query
+from .limiter import default_scheduler
+from .transport import Deadline, DEFAULT_TIMEOUT
+from .errors import FNSTimeoutError
+from .metrics import NULL_METRICS, endpoint
+from .log import logger, Body
+
+
+class AsyncFNS(object):
+    """Асинхронный клиент реестра ФНС (asyncio + aiohttp)
+
+        Позволяет держать в работе сотни запросов одновременно в одном процессе:
+        ожидания (капча, статус 'wait') не блокируют поток.
+
+        concurrency - максимальное количество одновременно выполняемых запросов (info / search / get_doc_pdf)
+        proxy - словарь прокси в формате requests {'https': 'http://host:port'}
+        cache - кэш результатов поиска (cache.MemoryCache, cache.SQLiteCache)
+        scheduler - планировщик запросов (limiter.Scheduler), по умолчанию общий с FNS limiter.default_scheduler
+        base_url - адрес сервиса вместо https://egrul.nalog.ru (тестовый сервер, зеркало)
+        timeout - таймаут одного HTTP запроса, с, или кортеж (соединение, чтение)
+        metrics - сбор метрик и спанов (metrics.Metrics), по умолчанию выключен
+
+        Пример:
+            async with AsyncFNS(concurrency=100) as afns:
+                orgs = await asyncio.gather(*(afns.info(inn) for inn in inns))
+    """
+
+    _URL_BASE = Client._URL_BASE
+    _URL_GET_DATA = Client._URL_GET_DATA
+    _URL_GET_DOC_REQUEST = Client._URL_GET_DOC_REQUEST
+    _URL_GET_DOC_STATUS = Client._URL_GET_DOC_STATUS
+    _URL_GET_DOC_DOWNLOAD = Client._URL_GET_DOC_DOWNLOAD
+
+
+    def __init__(self, concurrency=50, proxy=None, cache=None, scheduler=None, base_url=None,
+                 timeout=DEFAULT_TIMEOUT, metrics=None):
+        if aiohttp is None:
+            raise ImportError('для AsyncFNS требуется пакет aiohttp')
+        self.log = logger
+        self.concurrency = concurrency
+        self.cache = cache
+        self.scheduler = scheduler or default_scheduler
+        self.metrics = metrics or NULL_METRICS
+        if isinstance(timeout, tuple):
+            self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            self.timeout = aiohttp.ClientTimeout(total=timeout)
+        if base_url:
+            self._URL_BASE = base_url.rstrip('/')
+            self._URL_GET_DATA = self._URL_BASE + '/search-result/'
+            self._URL_GET_DOC_REQUEST = self._URL_BASE + '/vyp-request/'
+            self._URL_GET_DOC_STATUS = self._URL_BASE + '/vyp-status/'
+            self._URL_GET_DOC_DOWNLOAD = self._URL_BASE + '/vyp-download/'
+        self.proxy = (proxy.get('https') or proxy.get('http')) if proxy else None
+        self._semaphore = None
+        self._session = None
+        # общий для всех результатов info синхронный клиент (FNS.get_doc_pdf и т.п. у результата)
+        self._client = Client(proxy=proxy, scheduler=self.scheduler, base_url=base_url, timeout=timeout,
+                              metrics=metrics)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._client.session.close()
+
+    def _get_session(self):
+        # сессия и семафор создаются внутри работающего event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=self.proxy is None,
+                                                  timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+
+    async def _fetch(self, method, url, deadline=None, **kwargs):
+        # deadline - transport.Deadline операции: слот планировщика, которого не дождаться в срок, не резервируется
+        pause = await self.scheduler.async_wait(url, deadline=deadline)
+        metrics = self.metrics
+        if metrics.enabled:
+            if pause:
+                metrics.observe('fns_pause_seconds', pause, reason='queue')
+            start = time.perf_counter()
+        try:
+            async with self._get_session().request(method, url, proxy=self.proxy, **kwargs) as resp:
+                status, body = resp.status, await resp.read()
+        except Exception as e:
+            if metrics.enabled:
+                metrics.request(method, url, 'error', time.perf_counter() - start)
+            if isinstance(e, asyncio.TimeoutError):
+                raise FNSTimeoutError('таймаут запроса %s %s' % (method, url)) from e
+            raise
+        if metrics.enabled:
+            metrics.request(method, url, status, time.perf_counter() - start, len(body))
+        return status, body
+
+
+    async def _within(self, coro, deadline, what):
+        # общий срок операции (transport.Deadline) вместе со всеми попытками и паузами
+        if deadline.timeout is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, deadline.remaining())
+        except asyncio.TimeoutError as e:
+            raise FNSTimeoutError('истек срок %.1f c [%s]' % (deadline.timeout, what)) from e
+
+
+    async def _get_response(self, query, attempts=10, deadline=None):
+        """
+            Асинхронный аналог FNS._get_response
+            attempts - количество попыток получить данные, паузы между попытками задает self.scheduler
+            deadline - transport.Deadline операции
+        """
+        j1 = {}
+        attempt_counter = 0
+        while attempt_counter < attempts:
+            attempt_counter += 1
+            status, body = await self._fetch('POST', self._URL_BASE, deadline, data={'query': str(query)})
+            try:
+                j1 = json.loads(body)
+            except Exception as e:
+                j1 = {}
+                self.log.error('[afns] не удалось загрузить json ответа на запрос: %s', Body(body),
+                               extra={'event': 'bad_json', 'endpoint': 'search', 'status': status})
+
+            if status == 405:
+                self.log.error('[afns] Сервис nalog.ru не доступен. данные не получены',
+                               extra={'event': 'unavailable', 'endpoint': 'search'})
+                return {}
+
+            if status != 200:
+                self.log.error('[afns] ошибка ОТПРАВКИ запроса в nalog.ru. код ошибки = %s', status,
+                               extra={'event': 'http_error', 'endpoint': 'search', 'status': status})
+                if 'captchaSearch' in j1.get('ERRORS', {}):
+                    self._captcha(self._URL_BASE)
+            elif j1.get('captchaRequired') != False:  # запрашивается капча - ждем
+                self._captcha(self._URL_BASE)
+            else:
+                self.scheduler.ok(self._URL_BASE)
+                break
+        else:
+            return []
+
+        attempt_counter = 0
+        while attempt_counter < attempts:
+            status, body = await self._fetch('GET', self._URL_GET_DATA + j1['t'], deadline)
+            if status != 200:
+                self.log.error('[afns] ошибка ПОЛУЧЕНИЯ ответа из nalog.ru. код ошибки = %s', status,
+                               extra={'event': 'http_error', 'endpoint': 'search-result', 'status': status})
+                break
+            try:
+                j2 = json.loads(body)
+            except Exception as e:
+                j2 = {}  # как ответ без rows: поиск завершается без результата
+                self.log.error('[afns] не удалось загрузить json ответа ФНС: %s', Body(body),
+                               extra={'event': 'bad_json', 'endpoint': 'search-result', 'status': status})
+            if j2 == dict(status='wait'):
+                self.log.info('[afns] Ждем ответ ФНС ...', extra={'event': 'wait', 'endpoint': 'search-result'})
+                attempt_counter += 1
+                await self._wait_round('search-result', self.scheduler.poll_delay(attempt_counter))
+                continue
+
+            if not j2.get('rows'):
+                self.log.error('[afns] ошибка доступа к структуре ответа ФНС. отсутствует ключ ["rows"]',
+                               extra={'event': 'no_rows', 'endpoint': 'search-result'})
+                break
+            return j2['rows']
+        return []
+
+
+    async def _wait_round(self, name, delay):
+        # ответ 'wait' при опросе готовности: пауза перед следующим опросом
+        if self.metrics.enabled:
+            self.metrics.inc('fns_wait_rounds_total', endpoint=name)
+            self.metrics.observe('fns_pause_seconds', delay, reason='poll')
+        await asyncio.sleep(delay)
+
+
+    def _captcha(self, url, where=''):
+        # пауза после капчи выдерживается в следующем self._fetch
+        pause = self.scheduler.captcha(url)
+        if self.metrics.enabled:
+            self.metrics.inc('fns_captcha_total', endpoint=endpoint(url))
+        self.log.warning('[afns]%s ФНС запрашивает ввод капчи, ждем ... %.0f c', where, pause,
+                         extra={'event': 'captcha', 'url': url, 'pause': pause})
+
+
+    async def search(self, query, attempts=10, deadline=None):
+        """
+            Возвращает список со словарями с результатами поискового запроса по любым данным
+            deadline - общий срок, с (включая ожидание в очереди concurrency); при превышении errors.FNSTimeoutError
+            числовой запрос с неверными контрольными цифрами ИНН/ОГРН сразу отклоняется errors.FNSValueError
+        """
+        check_query(query)
+        key = normalize_query(query)
+        if self.cache is not None:
+            rows = self.cache.get(key)
+            if rows is not None:
+                return rows
+
+        deadline = Deadline.of(deadline)
+        rows = await self._within(self._search(query, attempts, deadline), deadline, 'search')
+        if self.cache is not None and rows:
+            self.cache.set(key, rows)
+        return rows
+
+
+    async def _search(self, query, attempts, deadline):
+        self._get_session()
+        async with self._semaphore:
+            return await self._get_response(query, attempts, deadline)
+
+
+    async def info(self, inn, selecte_one=True, attempts=10, deadline=None):
+        """
+            Получает данные по организации по ИНН/ОГРН.
+            Возвращает новый объект FNS с заполненными полями (как после FNS.info), все результаты используют
+            один client.Client этого AsyncFNS
+            deadline - общий срок, с; при превышении errors.FNSTimeoutError
+        """
+        result = FNS(client=self._client)
+        result._parse_response(await self.search(inn, attempts, deadline), selecte_one)
+        return result
+
+
+    async def get_doc_pdf(self, doc_token, attempts=10, deadline=None):
+        """
+            Возвращает битовую строку с содержимым выписки в формате pdf, b'' если выписку получить не удалось
+            doc_token - FNS.doc_token организации
+            deadline - общий срок на запрос, ожидание и загрузку выписки, с; при превышении errors.FNSTimeoutError
+        """
+        deadline = Deadline.of(deadline)
+        return await self._within(self._get_doc_pdf(doc_token, attempts, deadline), deadline, 'get_doc_pdf')
+
+
+    async def _get_doc_pdf(self, doc_token, attempts, deadline):
+        self._get_session()
+        async with self._semaphore:
+            attempt_counter = 0
+            while attempt_counter < attempts:
+                attempt_counter += 1
+                status, body = await self._fetch('GET', self._URL_GET_DOC_REQUEST + doc_token, deadline)
+                try:
+                    j1 = json.loads(body)
+                except Exception as e:  # следующая попытка
+                    self.log.error('[afns] [get_doc_pdf] не удалось загрузить json ответа на запрос выписки: %s',
+                                   Body(body), extra={'event': 'bad_json', 'endpoint': 'vyp-request', 'status': status})
+                    continue
+                if j1.get('captchaRequired') == True or 'captchaVyp' in j1.get('ERRORS', {}):
+                    self._captcha(self._URL_GET_DOC_REQUEST, ' [get_doc_pdf]')
+                    continue
+                if 'ERRORS' in j1:
+                    self.log.error('[afns] [get_doc_pdf] Отправка запроса на выписку ФНС. неизвестная ошибка %s', j1,
+                                   extra={'event': 'server_error', 'endpoint': 'vyp-request'})
+                else:
+                    self.scheduler.ok(self._URL_GET_DOC_REQUEST)
+                    break
+
+            attempt_counter = 0
+            while attempt_counter < attempts:
+                attempt_counter += 1
+                status, body = await self._fetch('GET', self._URL_GET_DOC_STATUS + doc_token, deadline)
+                try:
+                    j2 = json.loads(body)['status']
+                except Exception as e:
+                    j2 = ''
+                    self.log.warning('[afns] [get_doc_pdf] ошибка получения статуса выписки. %s', Body(body),
+                                     extra={'event': 'bad_json', 'endpoint': 'vyp-status', 'status': status})
+
+                if j2 == 'ready':
+                    break
+                if j2 == 'wait':
+                    delay = self.scheduler.poll_delay(attempt_counter)
+                    self.log.info('[afns] [get_doc_pdf] Ждем выписку ФНС ... %.1f c', delay,
+                                  extra={'event': 'wait', 'endpoint': 'vyp-status', 'pause': delay})
+                    await self._wait_round('vyp-status', delay)
+            else:
+                self.log.warning('[afns] [get_doc_pdf] выписка не готова',
+                                 extra={'event': 'not_ready', 'endpoint': 'vyp-status'})
+                return b''
+
+            status, body = await self._fetch('GET', self._URL_GET_DOC_DOWNLOAD + doc_token, deadline)
+            if status != 200:
+                self.log.error('[afns] [get_doc_pdf] ошибка загрузки выписки. код ошибки = %s: %s', status, Body(body),
+                               extra={'event': 'http_error', 'endpoint': 'vyp-download', 'status': status})
+                return b''
+            if not body.startswith(Client._PDF_MAGIC):
+                self.log.error('[afns] [get_doc_pdf] ответ на загрузку выписки не pdf: %s', Body(body),
+                               extra={'event': 'not_pdf', 'endpoint': 'vyp-download'})
+                return b''
+            return body
@@ -0,0 +1,193 @@
+#*- coding: utf-8 -*-
+"""Бенчмарки без сети на локальном имитаторе сервисов ФНС (fake_nalog.FakeNalog)
+
+    python -m fns.bench -n 200 --workers 16 --latency 0.02 --wait-rounds 1 --captcha-rate 0.01
+
+    Для каждого сценария выводится количество операций, пропускная способность (оп/с)
+    и задержка одной операции p50 / p99 в миллисекундах.
+"""
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from . import fl
+from .fns import FNS
+from .client import Client
+from .afns import AsyncFNS, aiohttp
+from .limiter import Scheduler
+from .transport import make_session
+from .record import parse_row, parse_dirs, parse_dirs_many
+from .address import parse as parse_address
+from .ids import kind, valid_many
+from .extract import Extract
+from .fake_nalog import FakeNalog, sample_extract, sample_row
+
+
+def _percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def _report(name, latencies, total):
+    n = len(latencies)
+    return {'name': name, 'n': n, 'ops': n / total if total else float('inf'),
+            'p50': _percentile(latencies, 50) * 1000, 'p99': _percentile(latencies, 99) * 1000}
+
+
+def measure(name, func, args_list, workers=1):
+    """
+        Выполняет func(*args) для каждого набора аргументов в пуле из workers потоков
+        Возвращает словарь name, n, ops (оп/с), p50, p99 (мс)
+    """
+    def timed(args):
+        t = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            latencies = list(pool.map(timed, args_list))
+    else:
+        latencies = [timed(args) for args in args_list]
+    return _report(name, latencies, time.perf_counter() - start)
+
+
+def _queries(n):
+    # ИНН юр. лиц с верной контрольной цифрой, иначе запросы отклоняются без обращения к сети
+    result = []
+    for i in range(n):
+        base = str(780000000 + i)
+        result.append(base + str(sum(int(c) * w for c, w in zip(base, (2, 4, 10, 3, 5, 9, 4, 6, 8))) % 11 % 10))
+    return result
+
+
+def bench_network(server, n, workers, rate):
+    scheduler = Scheduler(rate=rate, max_rate=rate, burst=max(1, workers))
+    session = make_session(pool_size=workers)
+
+    def new_fns():
+        return FNS(session=session, scheduler=scheduler, base_url=server.url)
+
+    results = [measure('FNS.info', lambda q: new_fns().info(q), [(q,) for q in _queries(n)], workers)]
+    shared = Client(session=session, scheduler=scheduler, base_url=server.url)
+    results.append(measure('Client.info (общий клиент)', shared.info, [(q,) for q in _queries(n)], workers))
+
+    start = time.perf_counter()
+    done = sum(1 for _ in new_fns().info_many(_queries(n), workers=workers))
+    total = time.perf_counter() - start
+    results.append({'name': 'FNS.info_many', 'n': done, 'ops': done / total,
+                    'p50': float('nan'), 'p99': float('nan')})
+
+    def get_doc(q):
+        org = new_fns()
+        org._parse_response([sample_row(q)])
+        org.get_doc_pdf()
+    results.append(measure('FNS.get_doc_pdf', get_doc, [(q,) for q in _queries(n)], workers))
+    start = time.perf_counter()
+    done = sum(1 for r in new_fns().get_doc_pdf_many(['DOC' + q for q in _queries(n)], workers=workers, delay=0.05)
+               if r.error is None)
+    total = time.perf_counter() - start
+    results.append({'name': 'FNS.get_doc_pdf_many', 'n': done, 'ops': done / total,
+                    'p50': float('nan'), 'p99': float('nan')})
+
+    client = fl.FL(session=session, scheduler=scheduler, base_url=server.url)
+    args = [('Иванов', 'Иван', 'Иванович', '01.01.1980', 'passport_russia', '40 09 %06d' % i, '01.01.2010')
+            for i in range(n)]
+    results.append(measure('FL.find_inn_new', lambda *a: client.find_inn_new(*a, delay=0), args, workers))
+    start = time.perf_counter()
+    done = sum(1 for _ in client.find_inn_many(args, workers=workers, delay=0))
+    total = time.perf_counter() - start
+    results.append({'name': 'FL.find_inn_many', 'n': done, 'ops': done / total,
+                    'p50': float('nan'), 'p99': float('nan')})
+
+    if aiohttp is not None:
+        results.append(_bench_async(server, n, workers, rate))
+    return results
+
+
+def _bench_async(server, n, concurrency, rate):
+    async def run():
+        latencies = []
+        async with AsyncFNS(concurrency=concurrency, base_url=server.url,
+                            scheduler=Scheduler(rate=rate, max_rate=rate, burst=concurrency)) as afns:
+            async def one(q):
+                t = time.perf_counter()
+                await afns.info(q)
+                latencies.append(time.perf_counter() - t)
+            start = time.perf_counter()
+            await asyncio.gather(*(one(q) for q in _queries(n)))
+            return _report('AsyncFNS.info', latencies, time.perf_counter() - start)
+    return asyncio.run(run())
+
+
+def bench_pdf(n):
+    results = []
+    for unreliable in (False, True):
+        org = FNS()
+        org.type = 'ul'
+        org.is_doc_loaded = True
+        org.doc_pdf = sample_extract(unreliable=unreliable)
+        suffix = ' (недостоверн)' if unreliable else ''
+        results.append(measure('is_valid_org_check fast' + suffix, lambda: org.is_valid_org_check(fast=True),
+                               [()] * n))
+        results.append(measure('is_valid_org_check full' + suffix, lambda: org.is_valid_org_check(fast=False),
+                               [()] * n))
+    pdf = sample_extract()
+    results.append(measure('Extract первый раздел', lambda: Extract(pdf).section('Наименование'), [()] * n))
+    results.append(measure('Extract весь документ', lambda: Extract(pdf).to_dict(), [()] * n))
+    return results
+
+
+def bench_parsing(n):
+    org = FNS()
+    row = sample_row('7802182340')
+    return [
+        measure('parse_row', parse_row, [(row,)] * n),
+        measure('parse_dirs', parse_dirs, [(row['g'],)] * n),
+        measure('parse_dirs_many x1000', parse_dirs_many, [([row['g']] * 1000,)] * max(1, n // 1000)),
+        measure('FNS._parse_response', org._parse_response, [([row],)] * n),
+        measure('FNS.addr_cut', org.addr_cut, [(row['a'],)] * n),
+        measure('address.parse', parse_address, [(row['a'],)] * n),
+        measure('FNS.fio_split', org.fio_split, [('Степанов Алексей Геннадьевич',)] * n),
+        measure('ids.kind', kind, [('7802182340',)] * n),
+        measure('ids.valid_many x1000', valid_many, [(_queries(1000),)] * max(1, n // 1000)),
+    ]
+
+
+def print_report(results, file=sys.stdout):
+    file.write('%-40s %8s %12s %10s %10s\n' % ('сценарий', 'n', 'оп/с', 'p50, мс', 'p99, мс'))
+    for r in results:
+        file.write('%-40s %8d %12.1f %10.3f %10.3f\n' % (r['name'], r['n'], r['ops'], r['p50'], r['p99']))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='fns.bench', description=__doc__.splitlines()[0])
+    p.add_argument('-n', type=int, default=100, help='операций в сетевых сценариях')
+    p.add_argument('--cpu-n', type=int, default=10000, help='операций в сценариях разбора')
+    p.add_argument('--pdf-n', type=int, default=20, help='операций в сценариях проверки pdf')
+    p.add_argument('--workers', type=int, default=8, help='потоков / одновременных запросов')
+    p.add_argument('--rate', type=float, default=10000.0, help='скорость планировщика, запросов в секунду')
+    p.add_argument('--latency', type=float, default=0.0, help='задержка ответа имитатора, с')
+    p.add_argument('--wait-rounds', type=int, default=0, help="ответов 'wait' до готовности")
+    p.add_argument('--captcha-rate', type=float, default=0.0, help='вероятность капчи')
+    p.add_argument('--only', choices=['network', 'pdf', 'parsing'], help='только одна группа сценариев')
+    args = p.parse_args(argv)
+
+    results = []
+    if args.only in (None, 'network'):
+        with FakeNalog(latency=args.latency, wait_rounds=args.wait_rounds, captcha_rate=args.captcha_rate) as server:
+            results += bench_network(server, args.n, args.workers, args.rate)
+    if args.only in (None, 'pdf'):
+        results += bench_pdf(args.pdf_n)
+    if args.only in (None, 'parsing'):
+        results += bench_parsing(args.cpu_n)
+    print_report(results)
+
+
+if __name__ == '__main__':
+    main()
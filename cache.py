@@ -0,0 +1,153 @@
+#*- coding: utf-8 -*-
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+        Ключ кэша для поискового запроса: без крайних и повторных пробелов, в верхнем регистре
+        ' 7802182340 ' и '7802182340' дают один ключ
+    """
+    return re.sub(r'\s+', ' ', str(query)).strip().upper()
+
+
+class MemoryCache(object):
+    """LRU кэш результатов поиска в памяти процесса
+
+        maxsize - максимальное количество записей, при превышении удаляются давно не использованные
+        ttl - время жизни записи в секундах (None - бессрочно)
+        hits, misses - счетчики попаданий и промахов
+    """
+
+    def __init__(self, maxsize=10000, ttl=24*3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+            Возвращает значение по ключу или None, если записи нет или она устарела
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[1] is not None and item[1] < time.time()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        """
+            Сохраняет значение, ttl - время жизни записи (по умолчанию self.ttl)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses}
+
+
+class SQLiteCache(object):
+    """Постоянный кэш результатов поиска в файле SQLite
+
+        Значения хранятся в json, переживают перезапуск процесса и доступны нескольким процессам.
+        path - путь к файлу базы
+        maxsize - максимальное количество записей, при превышении удаляются давно не использованные
+        ttl - время жизни записи в секундах (None - бессрочно)
+        hits, misses - счетчики попаданий и промахов (в рамках процесса)
+    """
+
+    _EVICT_EVERY = 1000  # проверка размера не на каждую запись
+
+    def __init__(self, path, maxsize=1000000, ttl=24*3600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                           '(key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+
+    def get(self, key):
+        """
+            Возвращает значение по ключу или None, если записи нет или она устарела
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                if row is not None:
+                    self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE cache SET used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """
+            Сохраняет значение, ttl - время жизни записи (по умолчанию self.ttl)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                               (key, data, now + ttl if ttl else None, now))
+            self._sets += 1
+            if self._sets % self._EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute('DELETE FROM cache WHERE expires < ?', (now,))
+        extra = len(self) - self.maxsize
+        if extra > 0:
+            self._conn.execute('DELETE FROM cache WHERE key IN '
+                               '(SELECT key FROM cache ORDER BY used LIMIT ?)', (extra,))
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache')
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def stats(self):
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,159 @@
+#*- coding: utf-8 -*-
+"""Пакетная проверка ИНН/ОГРН из файла
+
+    python -m fns inns.txt -o result.csv --workers 16 --rate 2 --check-valid --checkpoint done.txt
+
+    Входной файл - по одному ИНН/ОГРН в строке ('-' - stdin).
+    Результаты пишутся потоком по мере готовности (jsonl / csv / parquet).
+    С --checkpoint обработанные запросы записываются в файл, повторный запуск пропускает их
+    и дописывает результаты в тот же выходной файл. Запросы с ошибкой (кроме неверных ИНН/ОГРН), в том числе
+    без ответа ФНС за --attempts попыток, при этом не записываются ни в результаты, ни в checkpoint -
+    они выполняются заново при следующем запуске.
+    С --snapshot проверка инкрементальная (FNS.recheck_many): в результаты попадают только новые
+    и изменившиеся организации, выписка проверяется заново только при изменении данных или по сроку --max-age.
+"""
+import os
+import sys
+import logging
+import argparse
+
+from .fns import FNS, LookupResult
+from .cache import SQLiteCache
+from .limiter import Scheduler
+from .coordination import Coordinator, SQLiteStore
+from .pdf_store import PdfStore
+from .proxy import ProxyPool
+from .snapshot import Snapshot
+from .errors import FNSValueError
+from .export import open_exporter
+
+
+def _parser():
+    p = argparse.ArgumentParser(prog='fns', description='Пакетная проверка организаций по ИНН/ОГРН в реестре ФНС')
+    p.add_argument('input', help="файл со списком ИНН/ОГРН, по одному в строке ('-' - stdin)")
+    p.add_argument('-o', '--output', default='-', help="файл результатов ('-' - stdout, по умолчанию)")
+    p.add_argument('-f', '--format', choices=['jsonl', 'csv', 'parquet'], help='формат, по умолчанию по расширению файла')
+    p.add_argument('--layout', choices=['flat', 'nested'], default='flat', help='раскладка руководителей')
+    p.add_argument('-w', '--workers', type=int, default=8, help='количество одновременных запросов')
+    p.add_argument('--rate', type=float, default=1.0, help='начальная скорость запросов к ФНС, в секунду')
+    p.add_argument('--max-rate', type=float, default=5.0, help='максимальная скорость запросов к ФНС, в секунду')
+    p.add_argument('--attempts', type=int, default=10, help='количество попыток на запрос')
+    p.add_argument('--timeout', type=float, default=60.0, help='таймаут одного HTTP запроса, с')
+    p.add_argument('--deadline', type=float, help='срок на один ИНН вместе с проверкой выписки, с')
+    p.add_argument('--check-valid', action='store_true', help='загружать выписку и проверять недостоверность')
+    p.add_argument('--pdf-store', help='каталог хранилища pdf выписок')
+    p.add_argument('--cache', help='файл SQLite кэша результатов поиска')
+    p.add_argument('--shared', help='файл SQLite общего для процессов хоста темпа запросов, паузы после капчи '
+                                    'и запросов в работе (несколько запусков одновременно)')
+    p.add_argument('--proxies', help="файл со списком прокси, по одному в строке ('direct' - без прокси)")
+    p.add_argument('--snapshot', help='файл SQLite снимка данных для инкрементальной проверки')
+    p.add_argument('--max-age', type=float, default=30, help='срок повторной проверки выписки со --snapshot, дней')
+    p.add_argument('--checkpoint', help='файл с обработанными запросами для продолжения прерванного запуска')
+    p.add_argument('-v', '--verbose', action='store_true', help='подробный журнал в stderr')
+    p.add_argument('-q', '--quiet', action='store_true', help='только ошибки в stderr')
+    return p
+
+
+def _read_queries(path, done):
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8-sig')
+    with f:
+        for line in f:
+            query = line.strip()
+            if query and query not in done:
+                yield query
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _read_proxies(path):
+    with open(path, encoding='utf-8') as f:
+        proxies = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return ProxyPool([None if p == 'direct' else p for p in proxies])
+
+
+def _results(fns, queries, args):
+    if not args.snapshot:
+        for result in fns.info_many(queries, attempts=args.attempts, workers=args.workers,
+                                    check_valid=args.check_valid, deadline=args.deadline):
+            yield result, True
+        return
+    snapshot = Snapshot(args.snapshot)
+    try:
+        for change in fns.recheck_many(queries, snapshot, max_age=args.max_age, attempts=args.attempts,
+                                       workers=args.workers, deadline=args.deadline):
+            changed = change.error is not None or change.is_new or bool(change.diff)
+            yield LookupResult(change.query, (), change.org, change.error), changed
+    finally:
+        snapshot.close()
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    level = logging.INFO if args.verbose else logging.ERROR if args.quiet else logging.WARNING
+    logging.basicConfig(level=level, stream=sys.stderr,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    fmt = args.format or ('jsonl' if args.output == '-' else args.output.rsplit('.', 1)[-1].lower())
+    fmt = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet'}.get(fmt, fmt)
+    if fmt == 'parquet' and args.checkpoint:
+        sys.exit('parquet не поддерживает дозапись, для --checkpoint используйте jsonl или csv')
+
+    done = _read_checkpoint(args.checkpoint)
+    append = bool(done) and args.output != '-' and os.path.exists(args.output)
+    if args.output == '-':
+        out = sys.stdout
+    elif fmt == 'parquet':
+        out = args.output
+    else:
+        out = open(args.output, 'a' if append else 'w', encoding='utf-8', newline='')
+    options = {'header': not append} if fmt == 'csv' else {}
+
+    if args.shared:
+        coordinator = Coordinator(SQLiteStore(args.shared), rate=args.rate, max_rate=args.max_rate)
+        scheduler = coordinator.scheduler
+    else:
+        coordinator, scheduler = None, Scheduler(rate=args.rate, max_rate=args.max_rate)
+    fns = FNS(cache=SQLiteCache(args.cache) if args.cache else None,
+              pdf_store=PdfStore(args.pdf_store) if args.pdf_store else None,
+              scheduler=scheduler,
+              coordinator=coordinator,
+              timeout=args.timeout,
+              proxy_pool=_read_proxies(args.proxies) if args.proxies else None)
+    checkpoint = open(args.checkpoint, 'a', encoding='utf-8') if args.checkpoint else None
+    queries = _read_queries(args.input, done)
+    failed = 0
+
+    with open_exporter(out, fmt, args.layout, **options) as exporter:
+        try:
+            for result, changed in _results(fns, queries, args):
+                # запросы с ошибкой повторяются при следующем запуске, кроме неверных ИНН/ОГРН
+                retry = result.error is not None and not isinstance(result.error, FNSValueError)
+                if result.error is not None:
+                    failed += 1
+                if retry and checkpoint:
+                    # не в выходной файл: иначе после повтора у запроса будет две строки
+                    logging.warning('%s: %s, повтор при следующем запуске', result.query, result.error)
+                    continue
+                if changed:  # со --snapshot организации без изменений не выводятся
+                    exporter.write(result)
+                if retry:
+                    continue
+                if checkpoint:
+                    exporter.flush()
+                    checkpoint.write(result.query + '\n')
+                    checkpoint.flush()
+        except KeyboardInterrupt:
+            logging.warning('прервано, обработано %s', exporter.count)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+    if out is not sys.stdout and not isinstance(out, str):
+        out.close()
+
+    logging.info('обработано %s, с ошибкой %s', exporter.count, failed)
+    return 1 if failed else 0
@@ -0,0 +1,721 @@
+#*- coding: utf-8 -*-
+"""Клиент реестра ФНС без состояния запроса
+
+    client = Client(cache=MemoryCache(), pdf_store=PdfStore('pdf'))
+    with ThreadPoolExecutor(16) as pool:
+        records = list(pool.map(client.info, inns))      # один клиент на все потоки
+    client.check_valid(records[0])                        # OrgRecord с заполненным is_valid_org
+
+    Client хранит только транспорт и настройки: сессию, кэш, хранилище выписок, планировщик, прокси, метрики.
+    Поля ответа в нем не сохраняются, каждый метод возвращает свой результат (список записей rows,
+    record.OrgRecord, pdf, extract.Extract), поэтому один объект можно вызывать из любого количества потоков:
+    запросы идут через общий пул соединений и общий планировщик. Прокси последнего запроса хранится
+    отдельно для каждого потока.
+    FNS - прежний интерфейс с полями организации, все запросы делает через свой Client (FNS.client).
+"""
+import io
+import json
+import time
+import requests
+from time import sleep
+from itertools import islice
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+import threading
+
+from .cache import normalize_query
+from .pdf_check import find_mark
+from .extract import Extract
+from .limiter import default_scheduler
+from .record import parse_row
+from .transport import make_session, set_pool_size, set_proxy, Deadline, DEFAULT_TIMEOUT, DEFAULT_POOL_SIZE
+from .errors import FNSError, FNSTimeoutError
+from .metrics import NULL_METRICS, endpoint, traced
+from .log import logger, Body
+from .proxy import ProxyPool
+from .ids import check_query, split_valid, invalid_error
+
+
+class LookupResult(NamedTuple):
+    """Результат одного запроса пакетной проверки FNS.info_many / Client.info_many
+
+        query - нормализованный запрос (ИНН/ОГРН)
+        indexes - позиции запроса во входной последовательности (повторы запрашиваются один раз)
+        org - объект FNS (FNS.info_many) или record.OrgRecord (Client.info_many), None при ошибке
+        error - исключение, если запрос завершился ошибкой; ответ ФНС, не полученный за attempts попыток, -
+                errors.FNSError, а не пустой результат "не найдено"
+    """
+    query: str
+    indexes: tuple
+    org: object = None
+    error: Exception = None
+
+
+class DocResult(NamedTuple):
+    """Результат загрузки одной выписки FNS.get_doc_pdf_many / Client.doc_pdf_many
+
+        doc_token - токен выписки
+        item - исходный элемент входной последовательности (токен, FNS или record.OrgRecord)
+        pdf - содержимое выписки (b'' при ошибке или если выписка сохранена в pdf_store)
+        path - путь к выписке в хранилище pdf_store, None если хранилище не задано
+        error - исключение, если выписку получить не удалось
+    """
+    doc_token: str
+    item: object
+    pdf: bytes = b''
+    path: str = None
+    error: Exception = None
+
+
+def _safe(func, *args):
+    # результат и исключение вызова в пуле потоков, одна ошибка не останавливает пакет
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, e
+
+
+def select_row(rows):
+    """
+        Запись об организации из ответа ФНС: первая действующая, если есть, иначе первая; None - ничего не найдено
+    """
+    if not rows or (len(rows) == 1 and rows[0].get('tot') == '0'):
+        return None
+    for row in rows:
+        if not ('e' in row or 'v' in row):
+            return row
+    return rows[0]
+
+
+class Client(object):
+    """Клиент реестра ФНС egrul.nalog.ru, безопасный для общего использования из пула потоков
+
+        session - готовая requests.Session (общий пул соединений с fl.FL), по умолчанию transport.make_session
+        pool_size - размер пула соединений (если session не передана), info_many и doc_pdf_many увеличивают его до workers
+        proxy - словарь прокси в формате requests {'https': 'http://host:port'}
+        cache - кэш результатов поиска (cache.MemoryCache, cache.SQLiteCache или объект с методами get/set)
+        pdf_store - хранилище pdf выписок (pdf_store.PdfStore), выписки загружаются только при отсутствии свежих
+        scheduler - планировщик запросов (limiter.Scheduler), по умолчанию общий для процесса limiter.default_scheduler
+        base_url - адрес сервиса вместо https://egrul.nalog.ru (тестовый сервер, зеркало)
+        timeout - таймаут одного HTTP запроса, с, или кортеж (соединение, чтение)
+        metrics - сбор метрик и спанов (metrics.Metrics), по умолчанию выключен
+        proxy_pool - пул прокси (proxy.ProxyPool), запросы распределяются по прокси вместо одного proxy
+        coordinator - согласование с другими процессами (coordination.Coordinator): общий планировщик
+                      (если scheduler не задан) и один запрос на все процессы для одинакового поиска
+    """
+
+    _URL_BASE = 'https://egrul.nalog.ru'
+    _URL_GET_DATA = _URL_BASE + '/search-result/'
+    _URL_GET_DOC_REQUEST = _URL_BASE + '/vyp-request/'
+    _URL_GET_DOC_STATUS = _URL_BASE + '/vyp-status/'
+    _URL_GET_DOC_DOWNLOAD = _URL_BASE + '/vyp-download/'
+    _UNRELIABLE_MARK = 'недостоверн'
+    _DOC_CHUNK = 64 * 1024
+    _PDF_MAGIC = b'%PDF'
+    _PROXY_ERRORS = (407, 502, 503, 504)  # ответы, которые скорее всего дал сам прокси
+
+    def __init__(self, session=None, pool_size=DEFAULT_POOL_SIZE, proxy=None, cache=None, pdf_store=None,
+                 scheduler=None, base_url=None, timeout=DEFAULT_TIMEOUT, metrics=None, proxy_pool=None,
+                 coordinator=None):
+        self.log = logger
+        self.session = session or make_session(pool_size, proxy)
+        if proxy and session is not None:
+            set_proxy(self.session, proxy)
+        self.cache = cache
+        self.pdf_store = pdf_store
+        self.coordinator = coordinator
+        self.scheduler = scheduler or (coordinator.scheduler if coordinator is not None else default_scheduler)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.metrics = metrics or NULL_METRICS
+        self.proxy_pool = proxy_pool
+        self._via = threading.local()  # прокси последнего запроса потока
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    @base_url.setter
+    def base_url(self, base_url):
+        # адреса сервиса от base_url, None - https://egrul.nalog.ru
+        self._base_url = base_url
+        base = base_url.rstrip('/') if base_url else type(self)._URL_BASE
+        self._URL_BASE = base
+        self._URL_GET_DATA = base + '/search-result/'
+        self._URL_GET_DOC_REQUEST = base + '/vyp-request/'
+        self._URL_GET_DOC_STATUS = base + '/vyp-status/'
+        self._URL_GET_DOC_DOWNLOAD = base + '/vyp-download/'
+
+# ---------------- данные организации
+
+    def search(self, query, attempts=10, deadline=None, use_cache=True):
+        """
+            Список записей rows ответа ФНС по запросу (ИНН, ОГРН или любые данные), из кэша self.cache если он задан
+            attempts - количество попыток получить данные, паузы между попытками задает self.scheduler
+            deadline - общий срок, с, или transport.Deadline; при превышении errors.FNSTimeoutError
+            use_cache - False: запросить заново, не читая кэш (свежий ответ в кэш записывается); с self.coordinator
+                        берется только результат такого же запроса, выполняемого сейчас в другом процессе
+            числовой запрос с неверными контрольными цифрами ИНН/ОГРН сразу отклоняется errors.FNSValueError
+            [] - ничего не найдено; если ответ ФНС не получен за attempts попыток - errors.FNSError
+        """
+        check_query(query)
+        deadline = Deadline.of(deadline)
+        if self.cache is None:
+            return self._fetch_rows(query, attempts, deadline, not use_cache)
+
+        key = normalize_query(query)
+        rows = self.cache.get(key) if use_cache else None
+        if rows is None:
+            rows = self._fetch_rows(query, attempts, deadline, not use_cache)
+            if rows:  # пустой ответ может быть временной ошибкой, не кэшируем
+                self.cache.set(key, rows)
+        return rows
+
+    def _fetch_rows(self, query, attempts, deadline, fresh=False):
+        # запрос в ФНС; с self.coordinator одинаковый запрос, уже начатый другим процессом, не повторяется
+        # fresh - не брать готовый результат прошлого запроса другого процесса, только запроса в работе
+        if self.coordinator is None:
+            return self._request_rows(query, attempts, deadline)
+        return self.coordinator.once(normalize_query(query), lambda: self._request_rows(query, attempts, deadline),
+                                     deadline, fresh)
+
+    @traced('client.info')
+    def info(self, query, attempts=10, deadline=None):
+        """
+            Данные организации по ИНН/ОГРН: record.OrgRecord первой действующей (иначе первой) записи ответа,
+            None если ничего не найдено
+        """
+        row = select_row(self.search(query, attempts, deadline))
+        return parse_row(row) if row is not None else None
+
+    def records(self, query, attempts=10, deadline=None):
+        """
+            Все записи ответа ФНС по запросу кортежем record.OrgRecord
+        """
+        rows = self.search(query, attempts, deadline)
+        if select_row(rows) is None:
+            return ()
+        return tuple(parse_row(row) for row in rows)
+
+    def info_many(self, inns, attempts=10, workers=8, check_valid=False, deadline=None):
+        """
+            Пакетное получение данных по списку ИНН/ОГРН в пуле из workers потоков.
+            Генератор, возвращает LookupResult с org = record.OrgRecord (None - не найдено или ошибка)
+            по мере готовности. Повторяющиеся ИНН запрашиваются один раз.
+            Запрос без ответа ФНС за attempts попыток возвращается с LookupResult.error = errors.FNSError и не кэшируется.
+            check_valid - для юр. лиц сразу проверять выписку на недостоверность (check_valid)
+            deadline - срок на один запрос вместе с проверкой выписки, с
+        """
+        return self._lookup_many(self._info_one, inns, workers, attempts, check_valid, deadline)
+
+    def _info_one(self, query, attempts, check_valid=False, deadline=None):
+        deadline = Deadline.of(deadline)
+        record = self.info(query, attempts, deadline)
+        if check_valid and record is not None:
+            record = self.check_valid(record, attempts, deadline=deadline)
+        return record
+
+    def _lookup_many(self, func, inns, workers, *args):
+        """
+            Общая часть info_many: удаление повторов, отклонение неверных ИНН/ОГРН без запроса,
+            func(query, *args) в пуле потоков. Генератор LookupResult
+        """
+        positions = {}
+        for i, inn in enumerate(inns):
+            positions.setdefault(str(inn).strip(), []).append(i)
+
+        queries, invalid = split_valid(positions)
+        for query in invalid:
+            self.log.warning('[fns] info_many отклонен запрос %s: не ИНН/ОГРН', query,
+                             extra={'event': 'invalid_id', 'query': query})
+            yield LookupResult(query, tuple(positions[query]), None, invalid_error(query))
+
+        for query, org, error in self._pool_run(func, queries, workers, *args):
+            indexes = tuple(positions[query])
+            if error is None:
+                yield LookupResult(query, indexes, org)
+            else:
+                self.log.error('[fns] info_many query=%s error=%s', query, error,
+                               extra={'event': 'lookup_error', 'query': query})
+                yield LookupResult(query, indexes, None, error)
+
+    def _pool_run(self, func, queries, workers, *args):
+        """
+            func(query, *args) для каждого запроса в пуле из workers потоков на общей сессии.
+            Генератор (query, результат, исключение) в порядке завершения
+        """
+        set_pool_size(self.session, workers)
+
+        queries = iter(queries)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            while True:
+                # в очереди пула не больше 2*workers задач, вход не разворачивается в futures целиком
+                for query in queries:
+                    pending[pool.submit(func, query, *args)] = query
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    query = pending.pop(future)
+                    error = future.exception()
+                    yield query, (future.result() if error is None else None), error
+
+# ---------------- выписка
+
+    @traced('client.doc_pdf')
+    def doc_pdf(self, item, attempts=10, deadline=None):
+        """
+            Содержимое pdf выписки, b'' если выписка не готова; ответ загрузки с ошибкой (не 200 или не pdf) -
+            errors.FNSError
+            item - токен выписки (doc_token) или объект с полем doc_token (record.OrgRecord, FNS);
+                   если задано хранилище self.pdf_store, выписка по ОГРН/ИНН объекта берется из него
+            deadline - общий срок на запрос, ожидание и загрузку выписки, с; при превышении errors.FNSTimeoutError
+        """
+        deadline = Deadline.of(deadline)
+        token, key = self._doc_item(item)
+        if key:
+            path = self.doc_path(item, attempts, deadline)
+            if path:
+                with open(path, 'rb') as f:
+                    return f.read()
+            return b''
+        chunks = self.doc_chunks(token, attempts, deadline)
+        return b''.join(chunks) if chunks is not None else b''
+
+    def doc_path(self, item, attempts=10, deadline=None, max_age=None):
+        """
+            Путь к файлу выписки организации item в хранилище self.pdf_store, None если хранилища нет
+            или выписку получить не удалось; выписка загружается потоком сразу в файл, только если в хранилище нет свежей;
+            ответ загрузки с ошибкой (не 200 или не pdf) в хранилище не сохраняется - errors.FNSError
+            max_age - срок годности выписки в днях (по умолчанию pdf_store.max_age, 0 - только сегодняшняя)
+        """
+        token, key = self._doc_item(item)
+        if not key:
+            return None
+        path = self.pdf_store.find(key, max_age)
+        if path is None:
+            chunks = self.doc_chunks(token, attempts, deadline)
+            if chunks is not None:
+                path = self.pdf_store.put(key, chunks)
+        return path
+
+    @traced('client.extract')
+    def extract(self, item, attempts=10, deadline=None):
+        """
+            Разобранная выписка extract.Extract организации item, None если выписку получить не удалось
+            Если задано хранилище self.pdf_store, выписка и ее разбор берутся из него
+        """
+        token, key = self._doc_item(item)
+        if key:
+            if self.doc_path(item, attempts, deadline):
+                return self.pdf_store.extract(key)
+            return None
+        pdf = self.doc_pdf(token, attempts, deadline)
+        return Extract(pdf) if pdf else None
+
+    @traced('client.unreliable_mark')
+    def unreliable_mark(self, item, pages_to_parse=4, attempts=10, deadline=None, max_age=None):
+        """
+            Поиск отметки о недостоверности в первых pages_to_parse страницах выписки организации item
+            Возвращает pdf_check.MarkResult(found, page, section, method), None если выписку получить не удалось
+            max_age - срок годности выписки из хранилища self.pdf_store в днях (по умолчанию pdf_store.max_age)
+        """
+        deadline = Deadline.of(deadline)
+        token, key = self._doc_item(item)
+        if key:
+            path = self.doc_path(item, attempts, deadline, max_age)
+            pdf_data = open(path, 'rb') if path else None
+        else:
+            pdf = self.doc_pdf(token, attempts, deadline)
+            pdf_data = io.BytesIO(pdf) if pdf else None
+        if pdf_data is None:
+            return None
+        return self._find_mark(pdf_data, pages_to_parse)
+
+    def _find_mark(self, pdf_data, pages_to_parse):
+        # быстрый поиск отметки в открытом pdf (файл закрывается)
+        start = time.perf_counter()
+        with pdf_data:
+            mark = find_mark(pdf_data, pages_to_parse, self._UNRELIABLE_MARK)
+        if self.metrics.enabled:
+            self.metrics.observe('fns_pdf_parse_seconds', time.perf_counter() - start, method='fast')
+        return mark
+
+    def check_valid(self, record, attempts=10, pages_to_parse=4, deadline=None, max_age=None):
+        """
+            Проверка юр. лица на недостоверность сведений: новая запись record.OrgRecord с заполненным is_valid_org
+            (False - в выписке есть отметка о недостоверности). Для ИП, без выписки или при ошибке загрузки
+            возвращается исходная запись
+        """
+        if record.type != 'ul' or not record.doc_token:
+            return record
+        mark = self.unreliable_mark(record, pages_to_parse, attempts, deadline, max_age)
+        if mark is None:
+            self.log.warning('[fns] данные выписки не получены, проверка недостоверности не завершена',
+                             extra={'event': 'no_extract', 'inn': record.inn})
+            return record
+        return record._replace(is_valid_org=not mark.found)
+
+    def doc_pdf_many(self, items, attempts=10, workers=8, window=100, delay=None):
+        """
+            Конвейерная загрузка выписок многих организаций.
+            Генератор, возвращает DocResult по мере готовности (порядок завершения, не порядок входа).
+            items - токены выписок (doc_token) или объекты с полем doc_token (FNS, record.OrgRecord)
+
+            Запросы на выписку отправляются сразу для window токенов, статусы всех ожидающих
+            опрашиваются вместе, раундами, загрузка каждой выписки начинается как только она готова.
+            Так время подготовки выписок на стороне ФНС перекрывается, а не складывается, как при doc_pdf подряд.
+            Если задано хранилище self.pdf_store, для объектов с ОГРН/ИНН свежие выписки берутся из него,
+            загруженные сохраняются в него (DocResult.path).
+            attempts - количество попыток запроса и опросов статуса одной выписки
+            delay - пауза между раундами опроса, с, по умолчанию задает self.scheduler
+            Повтор токена, который еще в работе, не запрашивается заново: он получает тот же результат
+            со своим item. Ответ загрузки с ошибкой (не 200 или не pdf) - DocResult.error, в хранилище не сохраняется.
+        """
+        set_pool_size(self.session, workers)
+        items = iter(items)
+        outstanding = {}  # doc_token -> [элемент, ключ в хранилище, оставшиеся опросы]
+        downloads = {}  # future загрузки -> (doc_token, элемент)
+        duplicates = {}  # doc_token в работе -> повторы этого токена, получают тот же результат
+        exhausted = False
+
+        def finished(result):
+            # результат токена и его копии для повторов, пришедших, пока токен был в работе
+            return [result] + [result._replace(item=item) for item in duplicates.pop(result.doc_token, ())]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                free = window - len(outstanding)
+                if not exhausted and free > 0:
+                    batch = list(islice(items, free))
+                    exhausted = len(batch) < free
+                    tokens = []
+                    for item in batch:
+                        token, key = self._doc_item(item)
+                        path = self.pdf_store.find(key) if key else None
+                        if path:
+                            yield DocResult(token, item, path=path)
+                        elif not token:
+                            yield DocResult(token, item, error=FNSError('нет токена выписки'))
+                        elif token in duplicates:
+                            duplicates[token].append(item)
+                        else:
+                            outstanding[token] = [item, key, attempts]
+                            duplicates[token] = []
+                            tokens.append(token)
+                    for token, (accepted, error) in zip(tokens, pool.map(
+                            lambda t: _safe(self._doc_request, t, attempts), tokens)):
+                        if not accepted:
+                            item = outstanding.pop(token)[0]
+                            yield from finished(DocResult(token, item,
+                                                          error=error or FNSError('запрос на выписку не принят')))
+
+                for future in [f for f in downloads if f.done()]:
+                    yield from finished(self._doc_result(downloads.pop(future), future))
+
+                if not outstanding:
+                    if exhausted:
+                        break
+                    continue
+
+                pause = self.scheduler.poll_delay(1) if delay is None else delay
+                self.metrics.observe('fns_pause_seconds', pause, reason='poll')
+                sleep(pause)
+                tokens = list(outstanding)
+                for token, (status, error) in zip(tokens, pool.map(lambda t: _safe(self._doc_status, t), tokens)):
+                    entry = outstanding[token]
+                    entry[2] -= 1
+                    if status == 'wait':
+                        self.metrics.inc('fns_wait_rounds_total', endpoint='vyp-status')
+                    if status == 'ready':
+                        del outstanding[token]
+                        downloads[pool.submit(self._doc_fetch, token, entry[1])] = (token, entry[0])
+                    elif error is not None or entry[2] <= 0:
+                        del outstanding[token]
+                        yield from finished(DocResult(token, entry[0], error=error or FNSError('выписка не готова')))
+
+            for future in as_completed(list(downloads)):
+                yield from finished(self._doc_result(downloads.pop(future), future))
+
+    def _doc_item(self, item):
+        # токен выписки и ключ в хранилище (ОГРН или ИНН, None без хранилища) для токена или объекта с doc_token
+        if isinstance(item, str):
+            return item, None
+        key = None
+        if self.pdf_store is not None:
+            key = getattr(item, 'ogrn', '') or getattr(item, 'inn', '') or None
+        return getattr(item, 'doc_token', ''), key
+
+    def _doc_fetch(self, doc_token, key=None):
+        # загрузка готовой выписки: в хранилище, если задан ключ, иначе в память
+        # ответ с ошибкой _doc_download отклоняет errors.FNSError до записи в хранилище
+        chunks = self._doc_download(doc_token)
+        if key:
+            return b'', self.pdf_store.put(key, chunks)
+        return b''.join(chunks), None
+
+    @staticmethod
+    def _doc_result(source, future):
+        doc_token, item = source
+        error = future.exception()
+        if error is not None:
+            return DocResult(doc_token, item, error=error)
+        pdf, path = future.result()
+        return DocResult(doc_token, item, pdf, path)
+
+    def doc_chunks(self, doc_token, attempts=10, deadline=None):
+        """
+            Запрос выписки: отправка запроса, ожидание готовности.
+            Возвращает итератор по частям pdf файла или None, если выписка не готова
+            Ответ загрузки не 200 - errors.FNSError сразу, не pdf - errors.FNSError при чтении первой части
+        """
+        deadline = Deadline.of(deadline)
+        self._doc_request(doc_token, attempts, deadline)
+
+        attempt_counter = 0
+        while attempt_counter < attempts:
+            attempt_counter += 1
+            status = self._doc_status(doc_token, deadline)
+
+            if status == 'ready':  # ответ готов, выходим из цикла
+                break
+
+            if status == 'wait':
+                delay = self.scheduler.poll_delay(attempt_counter)
+                self.log.info('[fns] [get_doc_pdf] Ждем выписку ФНС ... %.1f c', delay,
+                              extra={'event': 'wait', 'endpoint': 'vyp-status', 'pause': delay})
+                self._wait_round('vyp-status', delay, deadline)
+                continue
+
+        else:
+            self.log.warning('[fns] [get_doc_pdf] выписка не готова', extra={'event': 'not_ready', 'endpoint': 'vyp-status'})
+            return None
+
+        return self._doc_download(doc_token, deadline)
+
+    def _doc_request(self, doc_token, attempts=10, deadline=None):
+        """
+            Отправка запроса на выписку (vyp-request) с повтором после капчи. True - запрос принят
+        """
+        attempt_counter = 0
+        while attempt_counter < attempts:
+            attempt_counter += 1
+            if attempt_counter > 1:
+                self.metrics.inc('fns_retries_total', endpoint='vyp-request')
+            _req1 = self._request('GET', self._URL_GET_DOC_REQUEST + doc_token, deadline)  # отправка запроса на выписку
+            try:
+                j1 = json.loads(_req1.text)
+            except ValueError:  # страница ошибки вместо json - следующая попытка
+                self.log.error('[fns] [get_doc_pdf] не удалось загрузить json ответа на запрос выписки: %s', Body(_req1),
+                               extra={'event': 'bad_json', 'endpoint': 'vyp-request', 'status': _req1.status_code})
+                continue
+
+            if j1.get('captchaRequired') == True:  # запрашивается капча - ждем
+                self._captcha(self._URL_GET_DOC_REQUEST, ' [get_doc_pdf]')
+                continue
+
+            if 'ERRORS' in j1:
+                if 'captchaVyp' in j1['ERRORS']:
+                    self._captcha(self._URL_GET_DOC_REQUEST, ' [get_doc_pdf]')
+                    continue
+                else:
+                    self.log.error('[fns] [get_doc_pdf] Отправка запроса на выписку ФНС. неизвестная ошибка %s', j1,
+                                   extra={'event': 'server_error', 'endpoint': 'vyp-request'})
+            else:
+                self._ok(self._URL_GET_DOC_REQUEST)
+                return True
+        return False
+
+    def _doc_status(self, doc_token, deadline=None):
+        """
+            Статус запроса на выписку (vyp-status): 'ready', 'wait' или другой ответ ФНС
+        """
+        _req2 = self._request('GET', self._URL_GET_DOC_STATUS + doc_token, deadline)  # статус запроса на выписку
+
+        try:
+            status = json.loads(_req2.text)['status']
+        except Exception as e:
+            self.log.warning('[fns] [get_doc_pdf] ошибка получения статуса выписки. %s', Body(_req2),
+                             extra={'event': 'bad_json', 'endpoint': 'vyp-status', 'status': _req2.status_code})
+            return ''
+
+        if status not in ('ready', 'wait'):
+            self.log.info('[fns] [get_doc_pdf] необрабатываемый статус ответа ФНС %s', Body(_req2),
+                          extra={'event': 'unknown_status', 'endpoint': 'vyp-status'})
+        return status
+
+    def _doc_download(self, doc_token, deadline=None):
+        # получение выписки потоком, итератор по частям pdf файла
+        # ответ с ошибкой - errors.FNSError до первой части, в хранилище pdf_store такой ответ не попадает
+        _req3 = self._request('GET', self._URL_GET_DOC_DOWNLOAD + doc_token, deadline, stream=True)
+        if _req3.status_code != requests.codes.ok:
+            with _req3:
+                body = _req3.content
+            self.log.error('[fns] [get_doc_pdf] ошибка загрузки выписки. код ошибки = %s: %s', _req3.status_code,
+                           Body(body), extra={'event': 'http_error', 'endpoint': 'vyp-download',
+                                              'status': _req3.status_code})
+            raise FNSError('ошибка загрузки выписки %s, код %s' % (doc_token, _req3.status_code))
+        return self._iter_content(_req3, deadline)
+
+    def _iter_content(self, response, deadline=None):
+        size = 0
+        with response:
+            try:
+                for chunk in response.iter_content(self._DOC_CHUNK):
+                    if not size and chunk and not chunk.startswith(self._PDF_MAGIC[:len(chunk)]):
+                        self.log.error('[fns] [get_doc_pdf] ответ на загрузку выписки не pdf: %s', Body(chunk),
+                                       extra={'event': 'not_pdf', 'endpoint': 'vyp-download'})
+                        raise FNSError('ответ на загрузку выписки не pdf %s' % response.url)
+                    size += len(chunk)
+                    yield chunk
+                    if deadline is not None:
+                        deadline.check('vyp-download')
+            except requests.exceptions.Timeout as e:
+                raise FNSTimeoutError('таймаут загрузки выписки %s' % response.url) from e
+            finally:
+                if size and self.metrics.enabled:
+                    self.metrics.inc('fns_download_bytes_total', size, endpoint=endpoint(response.url))
+
+# ---------------- HTTP
+
+    def _request_rows(self, query, attempts=10, deadline=None):
+        """
+            Запрос данных в ФНС: отправка запроса и получение ответа по токену
+            темп запросов и паузы после капчи задает планировщик self.scheduler
+            [] - только если ФНС ответила пустым списком rows (ничего не найдено); исчерпаны попытки
+            (капча, ошибки HTTP, ответ не готов) или ответ без rows - errors.FNSError
+        """
+
+        j1 = {}
+        attempt_counter = 0
+        while attempt_counter < attempts:  # отправляем запрос
+            attempt_counter += 1
+            if attempt_counter > 1:
+                self.metrics.inc('fns_retries_total', endpoint='search')
+            _req1 = self._request('POST', self._URL_BASE, deadline, data={'query': str(query)})
+
+            try:
+                j1 = json.loads(_req1.text)  # что вернет
+            except Exception as e:
+                j1 = {}
+                self.log.error('[fns] не удалось загрузить json ответа на запрос: %s', Body(_req1),
+                               extra={'event': 'bad_json', 'endpoint': 'search', 'status': _req1.status_code})
+
+            if _req1.status_code != requests.codes.ok:
+                self.log.error('[fns] ошибка ОТПРАВКИ запроса в nalog.ru. код ошибки = %s', _req1.status_code,
+                               extra={'event': 'http_error', 'endpoint': 'search', 'status': _req1.status_code})
+
+                if _req1.status_code == requests.codes.not_allowed:
+                    self.log.error('[fns] Сервис nalog.ru не доступен. данные не получены',
+                                   extra={'event': 'unavailable', 'endpoint': 'search'})
+                    raise FNSError('сервис nalog.ru не доступен [%s]' % query)
+
+                if ('ERRORS' in j1) and ('captchaSearch' in j1['ERRORS']):
+                    self._captcha(self._URL_BASE)
+                else:
+                    self.log.error('[fns] Ошибка. ответ сервера = %s', j1,
+                                   extra={'event': 'server_error', 'endpoint': 'search'})
+
+            elif j1.get('captchaRequired') != False:  # запрашивается капча - ждем
+                self._captcha(self._URL_BASE)
+            else:
+                self._ok(self._URL_BASE)
+                break  # данные получены без ошибок - выходим из цикла
+        else:
+            raise FNSError('запрос %s не принят ФНС за %s попыток' % (query, attempts))
+
+        attempt_counter = 0
+        while attempt_counter < attempts:
+            _req2 = self._request('GET', self._URL_GET_DATA + j1['t'], deadline)
+
+            if _req2.status_code != requests.codes.ok:
+                self.log.error('[fns] ошибка ПОЛУЧЕНИЯ ответа из nalog.ru. код ошибки = %s: %s',
+                               _req2.status_code, Body(_req2),
+                               extra={'event': 'http_error', 'endpoint': 'search-result', 'status': _req2.status_code})
+                raise FNSError('ошибка получения ответа ФНС по %s, код %s' % (query, _req2.status_code))
+            try:
+                j2 = json.loads(_req2.text)
+            except ValueError:
+                self.log.error('[fns] не удалось загрузить json ответа ФНС: %s', Body(_req2),
+                               extra={'event': 'bad_json', 'endpoint': 'search-result', 'status': _req2.status_code})
+                raise FNSError('ответ ФНС по %s не json' % query)
+            if j2 == dict(status='wait'):
+                self.log.info('[fns] Ждем ответ ФНС ...', extra={'event': 'wait', 'endpoint': 'search-result'})
+                attempt_counter += 1
+                self._wait_round('search-result', self.scheduler.poll_delay(attempt_counter), deadline)
+                continue
+
+            if not isinstance(j2.get('rows'), list):
+                self.log.error('[fns] ошибка доступа к структуре ответа ФНС. отсутствует ключ ["rows"]',
+                               extra={'event': 'no_rows', 'endpoint': 'search-result'})
+                raise FNSError('ответ ФНС по %s без rows' % query)
+
+            return j2['rows']
+        raise FNSError('ответ ФНС по %s не готов за %s попыток' % (query, attempts))
+
+    def _request(self, method, url, deadline=None, **kwargs):
+        """
+            Все HTTP запросы к ФНС идут через этот метод: ожидание разрешения планировщика и запрос в общей сессии
+            таймаут запроса - self.timeout, но не больше остатка срока deadline
+            с пулом прокси запрос идет через прокси, у которого раньше освобождается слот планировщика
+        """
+        deadline = Deadline.of(deadline)
+        via = None
+        if self.proxy_pool is not None:
+            via = self._via.proxy = self.proxy_pool.pick(url, self.scheduler)
+            kwargs['proxies'] = ProxyPool.requests_proxies(via)
+        pause = self.scheduler.wait(url, deadline, via)
+        metrics = self.metrics
+        if metrics.enabled:
+            if pause:
+                metrics.observe('fns_pause_seconds', pause, reason='queue')
+            start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=deadline.request_timeout(self.timeout, url), **kwargs)
+        except Exception as e:
+            if metrics.enabled:
+                metrics.request(method, url, 'error', time.perf_counter() - start)
+            if self.proxy_pool is not None and isinstance(e, requests.exceptions.RequestException):
+                self.proxy_pool.failure(via)
+            if isinstance(e, requests.exceptions.Timeout):
+                raise FNSTimeoutError('таймаут запроса %s %s' % (method, url)) from e
+            raise
+        if self.proxy_pool is not None and response.status_code in self._PROXY_ERRORS:
+            self.proxy_pool.failure(via)
+        if metrics.enabled:
+            # тело потоковой загрузки считается в _iter_content
+            metrics.request(method, url, response.status_code, time.perf_counter() - start,
+                            0 if kwargs.get('stream') else len(response.content))
+        return response
+
+    def _wait_round(self, name, delay, deadline):
+        # ответ 'wait' при опросе готовности: пауза перед следующим опросом
+        if self.metrics.enabled:
+            self.metrics.inc('fns_wait_rounds_total', endpoint=name)
+            self.metrics.observe('fns_pause_seconds', delay, reason='poll')
+        deadline.sleep(delay, name)
+
+    def _current_via(self):
+        # прокси, через который в этом потоке ушел последний запрос
+        return getattr(self._via, 'proxy', None) if self.proxy_pool is not None else None
+
+    def _ok(self, url):
+        # чистый ответ: скорость для хоста (и прокси) растет
+        via = self._current_via()
+        self.scheduler.ok(url, via)
+        if self.proxy_pool is not None:
+            self.proxy_pool.ok(via)
+
+    def _captcha(self, url, where=''):
+        # капча: планировщик ставит хост (для прокси - пару хост, прокси) на паузу, следующий self._request ее дождется
+        via = self._current_via()
+        pause = self.scheduler.captcha(url, via)
+        if self.proxy_pool is not None:
+            self.proxy_pool.captcha(via)
+        if self.metrics.enabled:
+            self.metrics.inc('fns_captcha_total', endpoint=endpoint(url))
+        self.log.warning('[fns]%s ФНС запрашивает ввод капчи, ждем ... %.0f c', where, pause,
+                         extra={'event': 'captcha', 'url': url, 'pause': pause})
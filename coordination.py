@@ -0,0 +1,266 @@
+#*- coding: utf-8 -*-
+"""Согласование нескольких процессов (воркеры Celery, gunicorn) при запросах к ФНС
+
+    coordinator = Coordinator(SQLiteStore('/tmp/fns-shared.db'), rate=1.0, max_rate=5.0)
+    fns = FNS(coordinator=coordinator)          # или Client(coordinator=...), fl.FL(scheduler=coordinator.scheduler)
+
+    # тот же интерфейс у Redis: несколько хостов
+    coordinator = Coordinator(redis.Redis(host='redis'))
+
+    Без согласования каждый процесс держит свой limiter.Scheduler: N воркеров шлют запросы в N раз чаще,
+    капчу получают намного раньше одного процесса и повторяют одни и те же запросы.
+    С Coordinator у всех процессов:
+        - один token bucket на хост (SharedScheduler): общий темп и общая адаптивная скорость,
+        - общая пауза после капчи: капча в одном процессе останавливает запросы к хосту во всех,
+        - общие запросы в работе: одинаковый поиск, начатый в одном процессе, другие не повторяют,
+          а ждут и берут его результат (Coordinator.once).
+
+    Хранилище - объект с подмножеством команд Redis: get, set(name, value, px=, nx=), delete.
+    SQLiteStore реализует их в файле SQLite для процессов одного хоста, для нескольких хостов
+    подходит redis.Redis без изменений. Время в общем состоянии - time.time(), а не time.monotonic().
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+
+from .limiter import Scheduler
+from .transport import Deadline
+
+
+def _text(value):
+    # redis возвращает bytes, SQLiteStore - str
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class SQLiteStore(object):
+    """Хранилище ключ-значение в файле SQLite с подмножеством команд Redis (get, set, delete)
+
+        path - путь к файлу базы, общему для всех процессов хоста
+        Каждая команда - одна атомарная инструкция SQLite, блокировки между процессами берет SQLite.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+
+    def get(self, name):
+        """
+            Значение ключа или None, если ключа нет или срок истек
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                     (name, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        """
+            Записывает значение; ex / px - срок жизни в секундах / миллисекундах
+            nx=True - только если ключа нет (или срок истек): True - записано, None - ключ уже есть
+        """
+        now = time.time()
+        expires = now + ex if ex is not None else now + px / 1000.0 if px is not None else None
+        with self._lock:
+            if nx:
+                cursor = self._conn.execute(
+                    'INSERT INTO kv VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE '
+                    'SET value = excluded.value, expires = excluded.expires '
+                    'WHERE kv.expires IS NOT NULL AND kv.expires <= ?', (name, value, expires, now))
+                return True if cursor.rowcount > 0 else None
+            self._conn.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?)', (name, value, expires))
+        return True
+
+    def delete(self, *names):
+        """
+            Удаляет ключи, возвращает количество удаленных
+        """
+        with self._lock:
+            return self._conn.executemany('DELETE FROM kv WHERE key = ?', [(n,) for n in names]).rowcount
+
+    def prune(self):
+        """
+            Удаляет ключи с истекшим сроком
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM kv WHERE expires <= ?', (time.time(),))
+
+    def close(self):
+        self._conn.close()
+
+
+class _Lock(object):
+    # короткая блокировка в хранилище (SET NX PX): снимается сама по истечении ttl, если процесс упал
+
+    def __init__(self, store, name, ttl, spin=0.002):
+        self.store = store
+        self.name = name
+        self.ttl_ms = int(ttl * 1000)
+        self.spin = spin
+        self.token = uuid.uuid4().hex
+
+    def __enter__(self):
+        while not self.store.set(self.name, self.token, px=self.ttl_ms, nx=True):
+            time.sleep(self.spin)
+        return self
+
+    def __exit__(self, *exc):
+        if _text(self.store.get(self.name)) == self.token:
+            self.store.delete(self.name)
+
+
+class SharedScheduler(Scheduler):
+    """limiter.Scheduler с состоянием хостов в общем хранилище: один token bucket и одна пауза после капчи
+    на все процессы
+
+        store - хранилище с командами get / set / delete (SQLiteStore, redis.Redis)
+        prefix - префикс ключей в хранилище
+        lock_ttl - срок блокировки состояния хоста, с (если процесс упал, пока держал ее)
+        остальные параметры - как у limiter.Scheduler; скорость rate - общая для всех процессов
+    """
+
+    def __init__(self, store, prefix='fns:', lock_ttl=5.0, **options):
+        Scheduler.__init__(self, **options)
+        self.store = store
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+
+    def _key(self, url, via=None):
+        host = urlsplit(url).netloc or url
+        return '%shost:%s' % (self.prefix, host if via is None else '%s|%s' % (host, via))
+
+    def _load(self, key):
+        value = self.store.get(key)
+        if value is None:
+            return {'rate': self.rate, 'tat': 0.0, 'cooldown_until': 0.0, 'captcha_streak': 0,
+                    'requests': 0, 'captchas': 0}
+        return json.loads(_text(value))
+
+    def _update(self, url, via, change):
+        """
+            change(state, now) под блокировкой хоста в хранилище, измененное состояние сохраняется
+            Возвращает результат change
+        """
+        key = self._key(url, via)
+        with self._lock:  # потоки процесса не спорят за блокировку в хранилище
+            with _Lock(self.store, key + ':lock', self.lock_ttl):
+                state = self._load(key)
+                result = change(state, time.time())
+                self.store.set(key, json.dumps(state))
+        with self._lock:
+            self._hosts[key] = state  # для stats
+        return result
+
+    def try_reserve(self, url, via=None, max_delay=None):
+        def change(state, now):
+            interval = 1.0 / state['rate']
+            start = max(now, state['tat'] - (self.burst - 1) * interval, state['cooldown_until'])
+            if max_delay is not None and start - now >= max_delay:
+                return None
+            state['tat'] = max(state['tat'], start) + interval
+            state['requests'] += 1
+            return start - now
+        return self._update(url, via, change)
+
+    def delay(self, url, via=None):
+        key = self._key(url, via)
+        state = self._load(key)
+        with self._lock:
+            self._hosts[key] = state
+        now = time.time()
+        return max(now, state['tat'] - (self.burst - 1) / state['rate'], state['cooldown_until']) - now
+
+    def ok(self, url, via=None):
+        def change(state, now):
+            state['captcha_streak'] = 0
+            state['rate'] = min(self.max_rate, state['rate'] + self.increase)
+        self._update(url, via, change)
+
+    def captcha(self, url, via=None):
+        def change(state, now):
+            state['captchas'] += 1
+            state['captcha_streak'] += 1
+            state['rate'] = max(self.min_rate, state['rate'] * self.decrease)
+            pause = self._jitter(min(self.max_cooldown, self.cooldown * 2 ** (state['captcha_streak'] - 1)))
+            state['cooldown_until'] = max(state['cooldown_until'], now + pause)
+            return pause
+        return self._update(url, via, change)
+
+    def stats(self):
+        """
+            Текущая скорость и счетчики всех процессов по хостам, к которым обращался этот процесс
+        """
+        with self._lock:
+            keys = list(self._hosts)
+        result = {}
+        for key in keys:
+            state = self._load(key)
+            result[key[len(self.prefix) + len('host:'):]] = {
+                'rate': state['rate'], 'requests': state['requests'], 'captchas': state['captchas']}
+        return result
+
+
+class Coordinator(object):
+    """Общие для процессов планировщик запросов и запросы в работе
+
+        store - хранилище с командами get / set / delete (SQLiteStore, redis.Redis)
+        prefix - префикс ключей в хранилище
+        inflight_ttl - сколько секунд запрос считается в работе, если выполняющий его процесс не ответил
+        result_ttl - сколько секунд результат запроса доступен ожидающим процессам
+        poll - пауза между проверками готовности чужого запроса, с
+        scheduler_options - параметры SharedScheduler (rate, max_rate, burst, cooldown, ...)
+
+        scheduler - SharedScheduler для FNS, Client, fl.FL
+        shared_hits - сколько запросов этот процесс не выполнял, а взял результат другого
+    """
+
+    def __init__(self, store, prefix='fns:', inflight_ttl=120.0, result_ttl=60.0, poll=0.05, **scheduler_options):
+        self.store = store
+        self.prefix = prefix
+        self.inflight_ttl = inflight_ttl
+        self.result_ttl = result_ttl
+        self.poll = poll
+        self.scheduler = SharedScheduler(store, prefix, **scheduler_options)
+        self.shared_hits = 0
+        self._owner = '%s:%s' % (os.getpid(), uuid.uuid4().hex)
+
+    def once(self, key, func, deadline=None, fresh=False):
+        """
+            func() один раз на все процессы для одинакового key: если такой же запрос уже выполняется
+            в другом процессе (или потоке), ждет его результат вместо повторного запроса
+            Результат должен сериализоваться в json; пустой результат не передается ожидающим,
+            они выполняют запрос сами.
+            deadline - общий срок ожидания и выполнения, с, или transport.Deadline; при превышении errors.FNSTimeoutError
+            fresh - не брать результат, готовый до вызова (Client.search с use_cache=False): только результат запроса,
+                    который выполнялся во время ожидания, иначе func() выполняется заново
+        """
+        deadline = Deadline.of(deadline)
+        inflight = '%sinflight:%s' % (self.prefix, key)
+        done = '%sresult:%s' % (self.prefix, key)
+        joined = None  # запуск в работе, к которому присоединился вызов
+        while True:
+            value = self.store.get(done)
+            if value is not None:
+                run, result = json.loads(_text(value))
+                if not fresh or run == joined:
+                    self.shared_hits += 1
+                    return result
+            run = '%s:%s' % (self._owner, uuid.uuid4().hex)
+            if self.store.set(inflight, run, px=int(self.inflight_ttl * 1000), nx=True):
+                try:
+                    result = func()
+                    if result:
+                        self.store.set(done, json.dumps([run, result], ensure_ascii=False),
+                                       px=int(self.result_ttl * 1000))
+                    return result
+                finally:
+                    self.store.delete(inflight)
+            current = self.store.get(inflight)
+            if current is not None:
+                joined = _text(current)
+            deadline.sleep(self.poll, 'inflight')
@@ -0,0 +1,13 @@
+#*- coding: utf-8 -*-
+
+
+class FNSError(Exception):
+    """Базовое исключение пакета"""
+
+
+class FNSTimeoutError(FNSError, TimeoutError):
+    """Истек таймаут запроса к ФНС или общий срок (deadline) операции"""
+
+
+class FNSValueError(FNSError, ValueError):
+    """Запрос - число, но не ИНН/ОГРН/ОГРНИП (неверная длина или контрольная цифра), в ФНС не отправляется"""
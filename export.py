@@ -0,0 +1,201 @@
+#*- coding: utf-8 -*-
+import csv
+import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow - необязательная зависимость, нужна только для parquet
+    pyarrow = None
+
+from .record import OrgRecord
+
+
+_FIELDS = [f for f in OrgRecord._fields if f != 'dirs']
+
+
+def to_row(result, layout='flat', max_dirs=3):
+    """
+        Строка выгрузки (словарь) из результата проверки
+        result - OrgRecord, FNS, fns.LookupResult или словарь полей OrgRecord
+        layout - 'flat': руководители в колонках dir1_position, dir1_fio ... dirN (N = max_dirs)
+                 'nested': руководители списком словарей в колонке dirs
+    """
+    query = error = ''
+    record = result
+    if hasattr(result, 'indexes'):  # LookupResult
+        query = result.query
+        error = str(result.error) if result.error is not None else ''
+        record = result.org
+    if record is not None and not isinstance(record, (OrgRecord, dict)):  # FNS
+        record = record.record
+    if record is None:
+        record = OrgRecord()
+    elif isinstance(record, dict):
+        record = OrgRecord(**{k: v for k, v in record.items() if k in OrgRecord._fields})
+
+    row = {'query': query}
+    for field in _FIELDS:
+        row[field] = getattr(record, field)
+    dirs = record.dirs
+    row['dirs_num'] = len(dirs)
+    if layout == 'nested':
+        row['dirs'] = [{'position': p, 'fio': f} for p, f in dirs]
+    else:
+        for i in range(max_dirs):
+            p, f = dirs[i] if i < len(dirs) else ('', '')
+            row['dir%d_position' % (i + 1)] = p
+            row['dir%d_fio' % (i + 1)] = f
+    row['error'] = error
+    return row
+
+
+def columns(layout='flat', max_dirs=3):
+    """
+        Список колонок выгрузки
+    """
+    cols = ['query'] + _FIELDS + ['dirs_num']
+    if layout == 'nested':
+        cols.append('dirs')
+    else:
+        for i in range(max_dirs):
+            cols += ['dir%d_position' % (i + 1), 'dir%d_fio' % (i + 1)]
+    return cols + ['error']
+
+
+class _Exporter(object):
+    """Потоковая выгрузка результатов: каждая запись пишется сразу, вся выборка в памяти не хранится"""
+
+    def __init__(self, target, layout='flat', max_dirs=3):
+        self.layout = layout
+        self.max_dirs = max_dirs
+        self.count = 0
+        self._own = isinstance(target, str)
+        self._file = self._open(target) if self._own else target
+
+    def _open(self, path):
+        return open(path, 'w', encoding='utf-8', newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, result):
+        self._write(to_row(result, self.layout, self.max_dirs))
+        self.count += 1
+
+    def write_many(self, results):
+        for result in results:
+            self.write(result)
+        return self.count
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._own:
+            self._file.close()
+        else:
+            self.flush()
+
+
+class CsvExporter(_Exporter):
+    """Выгрузка в CSV, во вложенной раскладке колонка dirs содержит json
+
+        header - писать строку заголовка (False - при дозаписи в существующий файл)
+    """
+
+    def __init__(self, target, layout='flat', max_dirs=3, delimiter=';', header=True):
+        _Exporter.__init__(self, target, layout, max_dirs)
+        self._writer = csv.DictWriter(self._file, columns(layout, max_dirs), delimiter=delimiter)
+        if header:
+            self._writer.writeheader()
+
+    def _write(self, row):
+        if self.layout == 'nested':
+            row['dirs'] = json.dumps(row['dirs'], ensure_ascii=False)
+        self._writer.writerow(row)
+
+
+class JsonlExporter(_Exporter):
+    """Выгрузка в JSON Lines, одна запись - одна строка"""
+
+    def _write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False))
+        self._file.write('\n')
+
+
+class ParquetExporter(_Exporter):
+    """Выгрузка в колоночный формат Parquet (требуется pyarrow)
+
+        Записи накапливаются пачками по batch_size и сбрасываются в файл отдельными row group.
+    """
+
+    def __init__(self, target, layout='flat', max_dirs=3, batch_size=10000):
+        if pyarrow is None:
+            raise ImportError('для выгрузки в parquet требуется пакет pyarrow')
+        self.batch_size = batch_size
+        self._rows = []
+        _Exporter.__init__(self, target, layout, max_dirs)
+        fields = []
+        for col in columns(layout, max_dirs):
+            if col == 'is_valid_org':
+                fields.append((col, pyarrow.bool_()))
+            elif col == 'dirs_num':
+                fields.append((col, pyarrow.int32()))
+            elif col == 'dirs':
+                fields.append((col, pyarrow.list_(pyarrow.struct([('position', pyarrow.string()),
+                                                                   ('fio', pyarrow.string())]))))
+            else:
+                fields.append((col, pyarrow.string()))
+        self.schema = pyarrow.schema(fields)
+        self._writer = pyarrow.parquet.ParquetWriter(self._file, self.schema)
+
+    def _open(self, path):
+        return open(path, 'wb')
+
+    def _write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._writer.write_table(pyarrow.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        _Exporter.close(self)
+
+
+_EXPORTERS = {'csv': CsvExporter, 'jsonl': JsonlExporter, 'parquet': ParquetExporter}
+
+
+def open_exporter(target, fmt=None, layout='flat', **kwargs):
+    """
+        Открывает потоковую выгрузку
+        target - путь к файлу или открытый файл (текстовый для csv/jsonl, бинарный для parquet)
+        fmt - 'csv', 'jsonl', 'parquet', по умолчанию по расширению файла
+    """
+    if fmt is None:
+        fmt = str(target).rsplit('.', 1)[-1].lower() if isinstance(target, str) else 'jsonl'
+        fmt = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet'}.get(fmt, fmt)
+    if fmt not in _EXPORTERS:
+        raise ValueError('неизвестный формат выгрузки %s' % fmt)
+    return _EXPORTERS[fmt](target, layout=layout, **kwargs)
+
+
+def export(results, target, fmt=None, layout='flat', **kwargs):
+    """
+        Выгружает результаты проверок (итератор OrgRecord / FNS / LookupResult) в файл потоком
+        Возвращает количество записанных строк
+
+        Пример:
+            export(FNS().info_many(inns), 'result.csv')
+    """
+    with open_exporter(target, fmt, layout, **kwargs) as exporter:
+        return exporter.write_many(results)
@@ -0,0 +1,308 @@
+#*- coding: utf-8 -*-
+"""Разбор pdf выписки ЕГРЮЛ/ЕГРИП в разделы и поля
+
+    extract = Extract(pdf)                           # bytes, путь к файлу или открытый бинарный файл
+    extract.section('Сведения о лицензиях')          # разбираются страницы только до конца этого раздела
+    extract.section('видах экономической').values('Код и наименование вида деятельности')
+    extract.to_dict()                                # весь документ
+
+    Выписка - таблица '№ п/п | наименование показателя | значение показателя' с заголовками разделов
+    жирным шрифтом. Страницы разбираются по одной по мере обращения: текст декодируется прямо
+    из содержимого страницы (как в pdf_check.find_mark), строки собираются по координатам,
+    ячейки строки разделяются по колонкам. Строка с номером в первой колонке начинает новое поле,
+    строки без номера продолжают наименование или значение предыдущего поля (в том числе на следующей странице).
+    Колонтитулы 'Страница N из M' пропускаются.
+
+    Разобранная целиком выписка сохраняется в PdfStore рядом с pdf (PdfStore.extract).
+"""
+import io
+import re
+from typing import NamedTuple
+
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.utils import apply_matrix_pt, mult_matrix
+
+from .pdf_check import _decode
+
+
+# строки колонтитулов, которые не относятся к разделам
+_NOISE = re.compile(r'^(Страница \d+ из \d+|Сведения с сайта ФНС России.*|№\s*п/п.*)$')
+
+_Y_TOLERANCE = 2.0   # строки с разницей базовой линии меньше - одна строка
+_X_TOLERANCE = 20.0  # допуск при отнесении продолжения к колонке наименования или значения
+
+
+class Section(NamedTuple):
+    """Раздел выписки
+
+        title - заголовок раздела (строки жирного шрифта подряд через пробел)
+        page - номер страницы начала раздела (с 1)
+        rows - кортеж пар (наименование показателя, значение)
+    """
+    title: str
+    page: int = 0
+    rows: tuple = ()
+
+    def get(self, field, default=''):
+        """
+            Значение первого поля, в наименовании которого есть field (без учета регистра)
+        """
+        values = self.values(field)
+        return values[0] if values else default
+
+    def values(self, field):
+        """
+            Значения всех полей, в наименовании которых есть field (без учета регистра)
+        """
+        field = field.lower()
+        return [value for name, value in self.rows if field in name.lower()]
+
+    def to_dict(self):
+        return {'title': self.title, 'page': self.page, 'rows': [list(row) for row in self.rows]}
+
+
+class _Line(object):
+
+    __slots__ = ('y', 'cells', 'bold')
+
+    def __init__(self, y):
+        self.y = y
+        self.cells = []  # [(x, текст)]
+        self.bold = True
+
+
+class _LineDevice(PDFDevice):
+    """Устройство pdfminer без разметки страницы: собирает строки текста страницы с координатами"""
+
+    def __init__(self, rsrcmgr):
+        PDFDevice.__init__(self, rsrcmgr)
+        self.items = []  # [(y, x, текст, жирный)]
+
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        font = textstate.font
+        if font is None:
+            return
+        text = ' '.join(_decode(font, seq).split())
+        if not text:
+            return
+        matrix = mult_matrix(textstate.matrix, self.ctm) if self.ctm else textstate.matrix
+        x, y = apply_matrix_pt(matrix, textstate.linematrix)
+        self.items.append((y, x, text, 'bold' in (font.fontname or '').lower()))
+
+    def lines(self):
+        """
+            Строки страницы сверху вниз, ячейки строки слева направо; список накопленных элементов очищается
+        """
+        lines = []
+        for y, x, text, bold in sorted(self.items, key=lambda item: (-item[0], item[1])):
+            if not lines or lines[-1].y - y > _Y_TOLERANCE:
+                lines.append(_Line(y))
+            line = lines[-1]
+            line.cells.append((x, text))
+            line.bold = line.bold and bold
+        self.items = []
+        return lines
+
+
+class _Parser(object):
+    # состояние разбора между страницами: текущий раздел и текущее поле
+
+    def __init__(self):
+        self.title = None
+        self.page = 0
+        self.rows = []
+        self.field = None  # [наименование, значение, x наименования, x значения]
+        self._bold = False
+
+    def feed(self, lines, page):
+        """
+            Разбор строк страницы, возвращает список завершенных разделов
+        """
+        done = []
+        for line in lines:
+            text = ' '.join(t for _, t in line.cells)
+            if _NOISE.match(text):
+                continue
+            if line.bold:
+                if self._bold:
+                    self.title += ' ' + text
+                else:
+                    section = self._close()
+                    if section is not None:
+                        done.append(section)
+                    self.title, self.page = text, page
+                self._bold = True
+                continue
+            self._bold = False
+            if self.title is None:
+                self.title, self.page = '', page
+            self._row(line.cells)
+        return done
+
+    def _row(self, cells):
+        first_x, first = cells[0]
+        if first.isdigit() and len(cells) > 1:
+            self._flush()
+            name_x, name = cells[1]
+            value_x = cells[2][0] if len(cells) > 2 else None
+            self.field = [name, ' '.join(t for _, t in cells[2:]), name_x, value_x]
+            return
+        if self.field is None:
+            self.field = [first, ' '.join(t for _, t in cells[1:]), first_x,
+                          cells[1][0] if len(cells) > 1 else None]
+            return
+        field = self.field
+        for x, text in cells:
+            if field[3] is not None and x >= field[3] - _X_TOLERANCE:
+                field[1] = (field[1] + ' ' + text).strip()
+            elif x <= field[2] + _X_TOLERANCE:
+                field[0] = (field[0] + ' ' + text).strip()
+            else:  # первое значение поля на строке продолжения
+                field[1] = (field[1] + ' ' + text).strip()
+                field[3] = x
+
+    def _flush(self):
+        if self.field is not None:
+            self.rows.append((self.field[0], self.field[1]))
+            self.field = None
+
+    def _close(self):
+        self._flush()
+        if self.title is None or (not self.title and not self.rows):
+            self.rows = []
+            return None
+        section = Section(self.title, self.page, tuple(self.rows))
+        self.rows = []
+        return section
+
+
+class Extract(object):
+    """Разобранная выписка ЕГРЮЛ/ЕГРИП: последовательность разделов Section, страницы разбираются по мере обращения
+
+        pdf - bytes, путь к файлу или открытый бинарный файл
+        on_complete - функция on_complete(extract), вызывается один раз после разбора последней страницы
+                      (PdfStore.extract сохраняет в ней разбор рядом с pdf)
+        pages - количество разобранных страниц
+
+        Файл, открытый по пути, закрывается после разбора последней страницы; если документ разобран
+        не целиком (section нашел раздел на первых страницах), его закрывает close или блок with:
+
+            with Extract(path) as extract:
+                licenses = extract.section('Сведения о лицензиях')
+    """
+
+    def __init__(self, pdf, on_complete=None):
+        self._pdf = pdf
+        self._on_complete = on_complete
+        self._sections = []
+        self._pages = None
+        self._parser = None
+        self._fp = None
+        self._closed = False
+        self.pages = 0
+        self.complete = False
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+            Extract из результата to_dict (без pdf)
+        """
+        extract = cls(None)
+        extract._sections = [Section(s['title'], s['page'], tuple(tuple(row) for row in s['rows']))
+                             for s in data['sections']]
+        extract.pages = data.get('pages', 0)
+        extract.complete = True
+        return extract
+
+    def _next_page(self):
+        # разбор следующей страницы, False если страниц больше нет
+        if self.complete or self._closed:
+            return False
+        if self._pages is None:
+            pdf = self._pdf
+            if isinstance(pdf, (bytes, bytearray)):
+                self._fp = io.BytesIO(pdf)
+            elif isinstance(pdf, str):
+                self._fp = open(pdf, 'rb')
+            else:
+                self._fp = pdf
+            rsrcmgr = PDFResourceManager(caching=True)
+            self._device = _LineDevice(rsrcmgr)
+            self._interpreter = PDFPageInterpreter(rsrcmgr, self._device)
+            self._pages = PDFPage.get_pages(self._fp)
+            self._parser = _Parser()
+
+        page = next(self._pages, None)
+        if page is None:
+            section = self._parser._close()
+            if section is not None:
+                self._sections.append(section)
+            self._finish()
+            return False
+        self._interpreter.process_page(page)
+        self.pages += 1
+        self._sections += self._parser.feed(self._device.lines(), self.pages)
+        return True
+
+    def _finish(self):
+        self.complete = True
+        self._release()
+        if self._on_complete is not None:
+            self._on_complete(self)
+
+    def _release(self):
+        # закрывает только файл, открытый по пути или созданный из bytes, переданный файл закрывает вызывающий
+        if self._fp is not None and self._fp is not self._pdf:
+            self._fp.close()
+        self._pages = self._parser = self._device = self._interpreter = self._fp = None
+
+    def close(self):
+        """
+            Прекращает разбор и закрывает файл pdf; остаются доступны уже разобранные разделы
+        """
+        if not self.complete:
+            self._closed = True
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            while i >= len(self._sections):
+                if not self._next_page():
+                    if i >= len(self._sections):
+                        return
+            yield self._sections[i]
+            i += 1
+
+    def section(self, title, default=None):
+        """
+            Первый раздел, в заголовке которого есть title (без учета регистра), или default
+            Страницы после конца найденного раздела не разбираются
+        """
+        title = title.lower()
+        for section in self:
+            if title in section.title.lower():
+                return section
+        return default
+
+    def sections(self, title=''):
+        """
+            Все разделы, в заголовке которых есть title (без учета регистра), разбирает документ целиком
+        """
+        title = title.lower()
+        return [section for section in self if title in section.title.lower()]
+
+    def to_dict(self):
+        """
+            Весь документ: {'pages': количество страниц, 'sections': [Section.to_dict(), ...]}
+        """
+        sections = [section.to_dict() for section in self]
+        return {'pages': self.pages, 'sections': sections}
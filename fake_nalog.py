@@ -0,0 +1,317 @@
+#*- coding: utf-8 -*-
+"""Локальный сервер, имитирующий egrul.nalog.ru и service.nalog.ru, для бенчмарков и отладки без сети
+
+    server = FakeNalog(latency=0.05, wait_rounds=1, captcha_rate=0.05).start()
+    fns = FNS('7802182340', base_url=server.url)
+    ...
+    server.stop()
+
+    Эндпоинты: POST /, GET /search-result/<t>, /vyp-request/<t>, /vyp-status/<t>, /vyp-download/<t>,
+    POST /inn-proc.do, /inn-new-proc.do
+    Сервер можно указать и как http прокси: несколько экземпляров имитируют разные IP со своей капчей.
+"""
+import json
+import time
+import random
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+_CYRILLIC = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ№'
+
+
+_EXTRACT_SECTIONS = [
+    ('Наименование', [
+        ('Полное наименование на русском языке', 'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "ПРИМЕР"'),
+        ('Сокращенное наименование на русском языке', 'ООО "ПРИМЕР"')]),
+    ('Место нахождения и адрес юридического лица', [
+        ('Место нахождения юридического лица', 'ГОРОД САНКТ-ПЕТЕРБУРГ'),
+        ('Адрес юридического лица', '194358, ГОРОД САНКТ-ПЕТЕРБУРГ, УЛИЦА ШОСТАКОВИЧА,|ДОМ 3, КОРПУС 1, ЛИТЕРА А, ПОМЕЩЕНИЕ 8-Н')]),
+    ('Сведения о регистрации', [
+        ('ОГРН', '1027801558487'),
+        ('Дата регистрации', '25.11.2002')]),
+    ('Сведения об учете в налоговом органе', [
+        ('ИНН юридического лица', '7802182340'),
+        ('КПП юридического лица', '780201001')]),
+    ('Сведения об участниках / учредителях юридического лица', [
+        ('Фамилия|Имя|Отчество', 'СТЕПАНОВ|АЛЕКСЕЙ|ГЕННАДЬЕВИЧ'),
+        ('Номинальная стоимость доли (в рублях)', '10000'),
+        ('Размер доли (в процентах)', '100')]),
+    ('Сведения о видах экономической деятельности по|Общероссийскому классификатору видов экономической|деятельности', [
+        ('Код и наименование вида деятельности', '41.20 Строительство жилых и нежилых зданий'),
+        ('Код и наименование вида деятельности', '43.99 Работы строительные специализированные прочие,|не включенные в другие группировки')]),
+    ('Сведения о лицензиях', [
+        ('Номер лицензии', '78-Б/00123'),
+        ('Дата лицензии', '01.03.2015'),
+        ('Вид лицензируемой деятельности', 'Деятельность по сбору отходов')]),
+]
+
+
+def sample_extract(unreliable=False, pages=4):
+    """
+        pdf, похожий на выписку ЕГРЮЛ: таблица '№ п/п | наименование показателя | значение показателя',
+        заголовки разделов жирным шрифтом, колонтитул 'Страница N из M', кириллица через таблицу ToUnicode.
+        Разделы наименования, адреса, регистрации, учета, участников, видов деятельности и лицензий,
+        затем записи ЕГРЮЛ до заполнения pages страниц.
+        unreliable - добавить на последнюю страницу сведения о недостоверности адреса
+    """
+    lines = []  # строки: (ячейки [(x, текст)], жирный)
+    number = 0
+
+    def section(title, rows):
+        nonlocal number
+        if title:
+            lines.extend(([(150, t)], True) for t in title.split('|'))
+        for field, value in rows:
+            number += 1
+            fields, values = field.split('|'), value.split('|')
+            for i in range(max(len(fields), len(values))):
+                cells = [(40, str(number))] if i == 0 else []
+                if i < len(fields):
+                    cells.append((70, fields[i]))
+                if i < len(values):
+                    cells.append((300, values[i]))
+                lines.append((cells, False))
+
+    for title, rows in _EXTRACT_SECTIONS:
+        section(title, rows)
+    per_page = 50
+    tail = 3 if unreliable else 0
+    record = 0
+    while len(lines) + 3 + tail <= per_page * pages:
+        record += 1
+        section('Сведения о записях, внесенных в Единый государственный реестр' if record == 1 else '', [
+            ('ГРН и дата внесения записи в ЕГРЮЛ', '%d %02d.03.2015' % (2157800000000 + record, record % 28 + 1)),
+            ('Причина внесения записи в ЕГРЮЛ', 'Изменение сведений о юридическом лице')])
+    if unreliable:
+        section('Адрес юридического лица', [
+            ('Сведения о недостоверности адреса юридического лица',
+             'ГРН и дата внесения в ЕГРЮЛ записи 2207800123456 01.02.2022')])
+
+    page_lines = [lines[p:p + per_page] for p in range(0, len(lines), per_page)][:pages] or [[]]
+    for p, page in enumerate(page_lines, 1):
+        page.append(([(250, 'Страница %d из %d' % (p, len(page_lines)))], False))
+    return _make_pdf(page_lines)
+
+
+def _make_pdf(page_lines):
+    enc = {c: 0x80 + i for i, c in enumerate(_CYRILLIC)}
+
+    def encode(text):
+        out = bytearray()
+        for ch in text:
+            out.append(enc[ch] if ch in enc else (ord(ch) if ord(ch) < 128 else 0x3f))
+        return bytes(out).replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    cmap = ['/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+            '/CMapName /Fake def 1 begincodespacerange <00> <FF> endcodespacerange',
+            '%d beginbfchar' % (95 + len(enc))]
+    cmap += ['<%02X> <%04X>' % (i, i) for i in range(32, 127)]
+    cmap += ['<%02X> <%04X>' % (code, ord(c)) for c, code in enc.items()]
+    cmap += ['endbfchar endcmap CMapName currentdict /CMap defineresource pop end end']
+    cmap = '\n'.join(cmap).encode()
+    widths = b'[' + b' '.join([b'500'] * 224) + b']'
+
+    objs = []
+
+    def add(data):
+        objs.append(data)
+        return len(objs)
+
+    def stream(data):
+        return b'<< /Length %d >>\nstream\n' % len(data) + data + b'\nendstream'
+
+    tounicode = add(stream(cmap))
+    fonts = [add(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /FirstChar 32 /LastChar 255 /Widths %s '
+                 b'/ToUnicode %d 0 R >>' % (name, widths, tounicode)) for name in (b'Helvetica', b'Helvetica-Bold')]
+    pages_id = len(objs) + 2 * len(page_lines) + 1
+    kids = []
+    for lines in page_lines:
+        ops = [b'BT']
+        y = 800
+        for cells, bold in lines:
+            if isinstance(cells, str):
+                cells = [(40, cells)]
+            for x, text in cells:
+                ops.append(b'/F%d 9 Tf 1 0 0 1 %d %d Tm (%s) Tj' % (2 if bold else 1, x, y, encode(text)))
+            y -= 14
+        ops.append(b'ET')
+        content = add(stream(b'\n'.join(ops)))
+        kids.append(add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] '
+                        b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> /Contents %d 0 R >>'
+                        % (pages_id, fonts[0], fonts[1], content)))
+    add(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids)))
+    root = add(b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % i + obj + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objs) + 1)
+    out += b''.join(b'%010d 00000 n \n' % o for o in offsets)
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objs) + 1, root, xref)
+    return bytes(out)
+
+
+def sample_row(query):
+    """
+        Запись rows ответа поиска для запроса query (ИНН/ОГРН или текст)
+    """
+    digits = ''.join(c for c in str(query) if c.isdigit()) or '7802182340'
+    return {
+        'k': 'ul',
+        't': 'DOC' + digits,
+        'n': 'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "ПРИМЕР %s"' % digits,
+        'c': 'ООО "ПРИМЕР %s"' % digits,
+        'a': '194358, САНКТ-ПЕТЕРБУРГ ГОРОД, УЛИЦА ШОСТАКОВИЧА,  3,  1,  ЛИТ.А ПОМЕЩЕНИЕ 8-Н',
+        'i': digits[:10],
+        'o': ('1' + digits + '000')[:13],
+        'p': digits[:4] + '01001',
+        'r': '25.11.2002',
+        'g': 'ГЕНЕРАЛЬНЫЙ ДИРЕКТОР: Степанов Алексей Геннадьевич, ПРЕЗИДЕНТ: Юсупов Рафаэль Мидхатович',
+    }
+
+
+class FakeNalog(object):
+    """Имитация сервисов ФНС в отдельном потоке
+
+        latency - задержка каждого ответа, с
+        wait_rounds - сколько раз отвечать 'wait' на search-result, vyp-status и запрос ИНН ФЛ до готовности
+        captcha_rate - вероятность ответа с капчей на запрос поиска и запрос выписки
+        pdf - содержимое выписки (по умолчанию sample_extract())
+        errors - ошибки эндпоинтов {эндпоинт: код ответа}, например {'vyp-download': 502}: вместо ответа
+                 html страница ошибки; эндпоинты 'search', 'search-result', 'vyp-request', 'vyp-status',
+                 'vyp-download', 'inn-proc.do', 'inn-new-proc.do'
+        port - порт (0 - любой свободный)
+    """
+
+    def __init__(self, latency=0.0, wait_rounds=0, captcha_rate=0.0, pdf=None, errors=None, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.wait_rounds = wait_rounds
+        self.captcha_rate = captcha_rate
+        self.pdf = pdf if pdf is not None else sample_extract()
+        self.errors = dict(errors or {})
+        self.requests = 0
+        self.captchas = 0
+        self._polls = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _captcha(self):
+        with self._lock:
+            self.requests += 1
+            if random.random() < self.captcha_rate:
+                self.captchas += 1
+                return True
+        return False
+
+    def _ready(self, key):
+        # первые wait_rounds опросов по ключу отвечают 'wait'
+        with self._lock:
+            n = self._polls.get(key, 0)
+            if n < self.wait_rounds:
+                self._polls[key] = n + 1
+                return False
+            self._polls.pop(key, None)
+            return True
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, code=200, content_type='application/json'):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if not isinstance(body, bytes):
+                    body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _form(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = parse_qs(self.rfile.read(length).decode('utf-8'))
+                return {k: v[0] for k, v in data.items()}
+
+            def _route(self):
+                # запрос через сервер как через http прокси приходит с полным адресом
+                if not self.path.startswith('/'):
+                    self.path = urlsplit(self.path).path or '/'
+
+            def _error(self, name):
+                # ответ с ошибкой, если она задана для эндпоинта в fake.errors
+                code = fake.errors.get(name)
+                if code is None:
+                    return False
+                self._send(b'<html><body>%d Error</body></html>' % code, code, 'text/html')
+                return True
+
+            def do_POST(self):
+                self._route()
+                form = self._form()
+                if self._error(self.path.strip('/') or 'search'):
+                    return
+                if self.path.startswith('/inn-new-proc.do'):
+                    if form.get('c') == 'find':
+                        return self._send({'requestId': 'R' + form.get('docno', '').replace(' ', '')})
+                    if not fake._ready(form.get('requestId')):
+                        return self._send({'state': 0})
+                    return self._send({'state': 1, 'inn': '7707' + form.get('requestId', '')[-8:]})
+                if self.path.startswith('/inn-proc.do'):
+                    return self._send({'code': 1, 'inn': '7707' + form.get('docno', '').replace(' ', '')[-8:]})
+                if fake._captcha():
+                    return self._send({'captchaRequired': True})
+                return self._send({'t': 'Q' + form.get('query', ''), 'captchaRequired': False})
+
+            def do_GET(self):
+                self._route()
+                prefix, _, token = self.path.rpartition('/')
+                if self._error(prefix.strip('/')):
+                    return
+                if prefix == '/search-result':
+                    if not fake._ready('s' + token):
+                        return self._send({'status': 'wait'})
+                    return self._send({'rows': [sample_row(token[1:])]})
+                if prefix == '/vyp-request':
+                    if fake._captcha():
+                        return self._send({'ERRORS': {'captchaVyp': ['Требуется ввести цифры с картинки']}})
+                    return self._send({'t': token, 'captchaRequired': False})
+                if prefix == '/vyp-status':
+                    return self._send({'status': 'ready' if fake._ready('v' + token) else 'wait'})
+                if prefix == '/vyp-download':
+                    return self._send(fake.pdf, content_type='application/pdf')
+                return self._send({'ERRORS': {'': ['not found']}}, 404)
+
+        return Handler
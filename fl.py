@@ -1,5 +1,16 @@
+import time
+import threading
 import requests
 from time import sleep
+from itertools import islice
+from typing import Iterable, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .limiter import default_scheduler
+from .transport import DEFAULT_TIMEOUT, Deadline, make_session, set_proxy
+from .errors import FNSTimeoutError
+from .metrics import NULL_METRICS
+from .proxy import ProxyPool
 
 url_fl_inn_old = 'https://service.nalog.ru/inn-proc.do'
 url_fl_inn_new = 'https://service.nalog.ru/inn-new-proc.do'
@@ -34,6 +45,9 @@ def find_fl_inn(fio_f: str,
         docnumber (str): Номер документа. для паспорта Серия и Номер - "СС СС НННННН" docnumber="40 09 950176"
         docdate (str): Дата документа в формате дд.мм.гггг
 
+    Raises:
+        errors.FNSTimeoutError: истек таймаут запроса
+
     Returns:
         dict: словарь вида {
                             'code' : int (0 - ошибка, 1 - успешно),
@@ -42,29 +56,7 @@ def find_fl_inn(fio_f: str,
                             }
     """         
 
-    data = {
-        'fam': fio_f,
-        'nam': fio_i,
-        'otch': fio_o,
-        'bdate': birthdate,
-        'bplace': '',
-        'doctype': doc_type_code[doctype],
-        'docno': docnumber,
-        'docdt': docdate,
-        'c': 'innMy',
-        'captcha': '',
-        'captchaToken': '',
-    }
-
-    try:
-        resp = requests.post(url=url_fl_inn_old, data=data)
-    except Exception as e:
-        return {'code': 0, 'message' : f'Ошибка запроса к ФНС {e}'}
-
-    if resp.status_code != requests.codes.ok :
-        return {'code': 0, 'message' : f'код ошибки {resp.status_code}'}
-    else:
-        return resp.json()
+    return _default_client().find_inn(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate)
 
 
 
@@ -78,7 +70,8 @@ def find_fl_inn_new(fio_f: str,
                         docnumber: str, 
                         docdate: str, 
                         attempts:int = 5, 
-                        delay: float = 0.3) -> dict:
+                        delay: float = None, 
+                        deadline: float = None) -> dict:
     """Получение ИНН физлица по паспортным данным, новая версия метода ФНС. 
        Схема : запрос с данным документа, в ответе получаем номер запроса, 
                 по номеру запроса, повторно в цикле обращаемся в ФНС для получения данных ответа
@@ -92,7 +85,11 @@ def find_fl_inn_new(fio_f: str,
         docnumber (str): Номер документа. для паспорта Серия и Номер - "СС СС НННННН" docnumber="40 09 950176"
         docdate (str): Дата документа в формате дд.мм.гггг
         attempts (int, optional): количество попыток получения ИНН. Defaults to 5.
-        delay (float, optional): задержка в секундах между попытками. Defaults to 0.1.
+        delay (float, optional): задержка в секундах между попытками. Defaults to None - растущая пауза limiter.default_scheduler.
+        deadline (float, optional): общий срок на запрос и все опросы в секундах. Defaults to None - без ограничения.
+
+    Raises:
+        errors.FNSTimeoutError: истек таймаут запроса или срок deadline
 
     Returns:
         dict: словарь вида {
@@ -101,33 +98,248 @@ def find_fl_inn_new(fio_f: str,
                             'message' : текст ошибки
                             }
     """         
-    resp_q = _send_fl_inn_request(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate)
-    request_id = resp_q.get('requestId')
-    if not request_id:
-        return resp_q
-    sleep(delay)
-
-    while attempts:
-        resp_a = _get_fl_inn_response(request_id)
-        if not resp_a.get('inn'):
-            sleep(delay)
-            attempts -= 1
-        else:
-            return resp_a
-    return resp_a
+    return _default_client().find_inn_new(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate,
+                                          attempts=attempts, delay=delay, deadline=deadline)
+
+def find_fl_inn_many(records: Iterable, 
+                     attempts: int = 5, 
+                     workers: int = 4, 
+                     window: int = 100, 
+                     delay: float = None) -> Iterator[Tuple[int, dict]]:
+    """Пакетное получение ИНН физлиц по паспортным данным (новая версия метода ФНС).
+       Запросы отправляются конвейером: пока не больше window запросов ждут ответа, добавляются новые.
+       Все ожидающие requestId опрашиваются вместе, раундами по одному расписанию,
+       вместо отдельного цикла ожидания на каждого человека.
 
-def _get_json_error_text_in_response(response: requests.models.Response):
-    try:
-        return response.json().get('ERROR')
-    except Exception as e:
-        return None
+    Args:
+        records (Iterable): данные физлиц - словари с ключами fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate
+                            или кортежи в том же порядке (как аргументы find_fl_inn_new)
+        attempts (int, optional): количество опросов одного запроса. Defaults to 5.
+        workers (int, optional): количество одновременных HTTP запросов. Defaults to 4.
+        window (int, optional): максимальное количество ожидающих ответа запросов. Defaults to 100.
+        delay (float, optional): пауза между раундами опроса в секундах. Defaults to None - пауза limiter.default_scheduler.
+
+    Yields:
+        (int, dict): номер записи во входной последовательности и ответ в формате find_fl_inn_new, по мере готовности
+    """
+    return _default_client().find_inn_many(records, attempts=attempts, workers=workers, window=window, delay=delay)
 
 
-def _send_fl_inn_request(fio_f: str, fio_i: str, fio_o: str, birthdate: str, doctype: str, docnumber: str, docdate: str):
-    """
-    docnumber="40 09 950176"
+class FL(object):
+    """Клиент сервиса получения ИНН физлица по паспортным данным service.nalog.ru
+
+        Все запросы идут через одну requests.Session с пулом keep-alive соединений,
+        поэтому опросы requestId не открывают каждый раз новое TCP+TLS соединение.
+        Модульные функции find_fl_inn, find_fl_inn_new, find_fl_inn_many используют общий клиент процесса.
+
+        session - готовая requests.Session, например FNS.session - тогда FNS и FL используют общие соединения
+        pool_size - размер пула соединений (если session не передана)
+        timeout - таймаут одного запроса, с, или кортеж (соединение, чтение)
+        proxy - словарь прокси в формате requests {'https': 'http://host:port'}
+        scheduler - планировщик запросов (limiter.Scheduler), по умолчанию limiter.default_scheduler
+        base_url - адрес сервиса вместо https://service.nalog.ru (тестовый сервер, зеркало)
+        metrics - сбор метрик и спанов (metrics.Metrics), по умолчанию выключен
+        proxy_pool - пул прокси (proxy.ProxyPool), запросы распределяются по прокси вместо одного proxy
+
+        Пример:
+            org = FNS()
+            fl = FL(session=org.session, scheduler=org.scheduler)
+            fl.find_inn_new('Иванов', 'Иван', 'Иванович', '01.01.1980', 'passport_russia', '40 09 950176', '01.01.2010')
     """
-    data = {
+
+    def __init__(self, session=None, pool_size=10, timeout=DEFAULT_TIMEOUT, proxy=None, scheduler=None,
+                 base_url=None, metrics=None, proxy_pool=None):
+        self.session = session or make_session(pool_size, proxy)
+        if proxy and session is not None:
+            set_proxy(self.session, proxy)
+        self.timeout = timeout
+        self.scheduler = scheduler or default_scheduler
+        self.metrics = metrics or NULL_METRICS
+        self.proxy_pool = proxy_pool
+        if base_url:
+            self.url_old = base_url.rstrip('/') + '/inn-proc.do'
+            self.url_new = base_url.rstrip('/') + '/inn-new-proc.do'
+        else:
+            self.url_old = url_fl_inn_old
+            self.url_new = url_fl_inn_new
+
+    def find_inn(self, fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate):
+        """
+            Получение ИНН первой версией метода ФНС, см. find_fl_inn
+        """
+        data = _passport_data(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate, 'innMy')
+        try:
+            resp = self._post(self.url_old, data)
+        except FNSTimeoutError:
+            raise
+        except Exception as e:
+            return {'code': 0, 'message' : f'Ошибка запроса к ФНС {e}'}
+
+        if resp.status_code != requests.codes.ok :
+            return {'code': 0, 'message' : f'код ошибки {resp.status_code}'}
+        else:
+            return resp.json()
+
+    def find_inn_new(self, fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate, attempts=5, delay=None,
+                     deadline=None):
+        """
+            Получение ИНН новой версией метода ФНС (запрос + опрос requestId), см. find_fl_inn_new
+        """
+        deadline = Deadline.of(deadline)
+        data = _passport_data(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate, 'find')
+        resp_q = self._post_json(data, deadline)
+        request_id = resp_q.get('requestId')
+        if not request_id:
+            return resp_q
+
+        resp_a = resp_q
+        for attempt in range(1, attempts + 1):
+            pause = self.scheduler.poll_delay(attempt) if delay is None else delay
+            if self.metrics.enabled:
+                self.metrics.inc('fns_wait_rounds_total', endpoint='inn-new-proc.do')
+                self.metrics.observe('fns_pause_seconds', pause, reason='poll')
+            deadline.sleep(pause, 'inn-new-proc')
+            resp_a = self._post_json({'c': 'get', 'requestId': request_id}, deadline)
+            if resp_a.get('inn'):
+                break
+        return resp_a
+
+    def find_inn_many(self, records, attempts=5, workers=4, window=100, delay=None):
+        """
+            Пакетное получение ИНН с общим опросом ожидающих requestId, см. find_fl_inn_many
+        """
+        records = enumerate(records)
+        outstanding = {}  # requestId -> [номер записи, оставшиеся опросы]
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                free = window - len(outstanding)
+                if not exhausted and free > 0:
+                    batch = list(islice(records, free))
+                    exhausted = len(batch) < free
+                    for (i, _), resp_q in zip(batch, pool.map(self._send_record, (r for _, r in batch))):
+                        request_id = resp_q.get('requestId')
+                        if request_id:
+                            outstanding[request_id] = [i, attempts]
+                        else:
+                            yield i, resp_q
+                if not outstanding:
+                    if exhausted:
+                        return
+                    continue
+
+                pause = self.scheduler.poll_delay(1) if delay is None else delay
+                self.metrics.observe('fns_pause_seconds', pause, reason='poll')
+                sleep(pause)
+                request_ids = list(outstanding)
+                for request_id, resp_a in zip(request_ids, pool.map(self._poll, request_ids)):
+                    entry = outstanding[request_id]
+                    entry[1] -= 1
+                    if resp_a.get('inn') or entry[1] <= 0:
+                        del outstanding[request_id]
+                        yield entry[0], resp_a
+
+    def _send_record(self, record):
+        try:
+            if isinstance(record, dict):
+                return self._send_request(**record)
+            return self._send_request(*record)
+        except Exception as e:  # одна ошибочная запись (неизвестный doctype, не те поля, таймаут) не останавливает пакет
+            return {'state': 0, 'message': str(e)}
+
+    def _poll(self, request_id):
+        try:
+            return self._get_response(request_id)
+        except Exception as e:
+            return {'state': 0, 'message': str(e)}
+
+    def _post(self, url, data, deadline=None):
+        """POST запрос к service.nalog.ru через планировщик запросов self.scheduler"""
+        deadline = Deadline.of(deadline)
+        via = proxies = None
+        if self.proxy_pool is not None:
+            via = self.proxy_pool.pick(url, self.scheduler)
+            proxies = ProxyPool.requests_proxies(via)
+        pause = self.scheduler.wait(url, deadline, via)
+        metrics = self.metrics
+        if metrics.enabled:
+            if pause:
+                metrics.observe('fns_pause_seconds', pause, reason='queue')
+            start = time.perf_counter()
+        try:
+            resp = self.session.post(url=url, data=data, timeout=deadline.request_timeout(self.timeout, url),
+                                     proxies=proxies)
+        except Exception as e:
+            if metrics.enabled:
+                metrics.request('POST', url, 'error', time.perf_counter() - start)
+            if self.proxy_pool is not None and isinstance(e, requests.exceptions.RequestException):
+                self.proxy_pool.failure(via)
+            if isinstance(e, requests.exceptions.Timeout):
+                raise FNSTimeoutError('таймаут запроса %s' % url) from e
+            raise
+        if metrics.enabled:
+            metrics.request('POST', url, resp.status_code, time.perf_counter() - start, len(resp.content))
+        if _is_captcha_response(resp):
+            self.scheduler.captcha(url, via)
+            if self.proxy_pool is not None:
+                self.proxy_pool.captcha(via)
+            if metrics.enabled:
+                metrics.inc('fns_captcha_total', endpoint='inn-new-proc.do' if url == self.url_new else 'inn-proc.do')
+            return resp
+        if resp.status_code == 429 or resp.status_code >= 500:
+            # сервис перегружен или сбоит: скорость снижается и хост ставится на паузу, как после капчи
+            self.scheduler.captcha(url, via)
+        elif 200 <= resp.status_code < 300:
+            self.scheduler.ok(url, via)
+        if self.proxy_pool is not None:
+            if resp.status_code in (407, 502, 503, 504):
+                self.proxy_pool.failure(via)
+            else:
+                self.proxy_pool.ok(via)
+        return resp
+
+    def _send_request(self, fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate):
+        """
+        docnumber="40 09 950176"
+        """
+        data = _passport_data(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate, 'find')
+        return self._post_json(data)
+
+    def _get_response(self, request_id):
+        return self._post_json({'c': 'get', 'requestId': request_id})
+
+    def _post_json(self, data, deadline=None):
+        try:
+            resp = self._post(self.url_new, data, deadline)
+        except FNSTimeoutError:
+            raise
+        except Exception as e:
+            return {'state': 0, 'message' : f'Ошибка запроса к ФНС {e}'}
+
+        if resp.status_code != requests.codes.ok :
+            return {'state': 0, 
+                    'message' : _get_json_error_text_in_response(resp) or f'код ошибки {resp.status_code}'}
+        else:
+            return resp.json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _default_client() -> FL:
+    """Общий клиент процесса для модульных функций, создается при первом запросе (один на все потоки)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FL()
+    return _client
+
+
+def _passport_data(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate, command):
+    return {
         'fam': fio_f,
         'nam': fio_i,
         'otch': fio_o,
@@ -136,39 +348,38 @@ def _send_fl_inn_request(fio_f: str, fio_i: str, fio_o: str, birthdate: str, doc
         'doctype': doc_type_code[doctype],
         'docno': docnumber,
         'docdt': docdate,
-        'c': 'find',
+        'c': command,
         'captcha': '',
         'captchaToken': '',
     }
 
+
+def _is_captcha_response(response: requests.models.Response) -> bool:
     try:
-        resp = requests.post(url=url_fl_inn_new, data=data)
+        j = response.json()
     except Exception as e:
-        return {'state': 0, 'message' : f'Ошибка запроса к ФНС {e}'}
-
-    if resp.status_code != requests.codes.ok :
-        return {'state': 0, 
-                'message' : _get_json_error_text_in_response(resp) or f'код ошибки {resp.status_code}'}
-    else:
-        return resp.json()
+        return False
+    if not isinstance(j, dict):
+        return False
+    return bool(j.get('captchaRequired')) or 'captcha' in str(j.get('ERRORS', '')).lower()
 
 
-def _get_fl_inn_response(request_id: str):
-
-    data = {
-                'c': 'get',
-                'requestId': request_id,
-    }
+def _get_json_error_text_in_response(response: requests.models.Response):
     try:
-        resp = requests.post(url=url_fl_inn_new, data=data)
+        return response.json().get('ERROR')
     except Exception as e:
-        return {'state': 0, 'message' : f'Ошибка запроса к ФНС {e}'}
+        return None
+
 
-    if resp.status_code != requests.codes.ok :
-        return {'state': 0, 
-                'message' : _get_json_error_text_in_response(resp) or f'код ошибки {resp.status_code}'}
-    else:
-        return resp.json()
+def _send_fl_inn_request(fio_f: str, fio_i: str, fio_o: str, birthdate: str, doctype: str, docnumber: str, docdate: str):
+    """
+    docnumber="40 09 950176"
+    """
+    return _default_client()._send_request(fio_f, fio_i, fio_o, birthdate, doctype, docnumber, docdate)
+
+
+def _get_fl_inn_response(request_id: str):
+    return _default_client()._get_response(request_id)
 
 
 def fl_passport_prepare(series: str, number: str) -> str:
@@ -1,16 +1,37 @@
 #*- coding: utf-8 -*-
 import io
 import re
-import json
-import requests
-from time import sleep
+import shutil
 import pdfminer.high_level
-import logging
+import time
+
+from .client import Client, LookupResult, DocResult
+from .cache import normalize_query
+from .extract import Extract
+from .record import parse_row, parse_dirs
+from .transport import Deadline, DEFAULT_TIMEOUT, DEFAULT_POOL_SIZE
+from .pdf_check import find_mark
+from .log import logger
+from .errors import FNSError
+from .metrics import traced
+from .snapshot import Change, diff_rows, PDF_FIELDS
+from .address import normalize as normalize_address
+from .ids import split_valid, invalid_error, is_inn as ids_is_inn
+
+
+def _client_attr(name):
+    # настройка FNS, которая читается и записывается в self.client
+    return property(lambda self: getattr(self.client, name), lambda self, value: setattr(self.client, name, value))
 
 
 class FNS(object):
     """Получение информации из реестра ФНС
 
+        Поля последней найденной организации хранятся в самом объекте, поэтому один объект FNS нельзя
+        вызывать из нескольких потоков одновременно. Все запросы идут через client.Client (поле client):
+        для пула потоков - один общий Client, у которого методы возвращают отдельные результаты,
+        или объекты FNS(client=client) на общем клиенте.
+
         type - 'ul', 'ip' ,'fl'
         title_long - 'Общество с Ограниченной Ответственностью "СПЕЦСТРОЙ"'
         title_short - 'ООО "СПЕЦСТРОЙ"'
@@ -28,39 +49,61 @@ class FNS(object):
         dirs_raw - 'Директор: Степанов Алексей Геннадьевич'
 
         dict - словарь со всеми полученными значениями
+        record - те же данные компактной неизменяемой записью record.OrgRecord
 
         is_doc_loaded - загружен ли ранее pdf выписка по данной организации
         doc_pdf - бинарное содержимое pdf документа
+        doc_extract - разобранная выписка extract.Extract после get_extract
 
         is_one_record - одна запись результат?
         is_valid_org - результат проверки на недостоверность сведений об организации
+        unreliable_mark - где найдена отметка о недостоверности, pdf_check.MarkResult(found, page, section, method)
         response_act_num - количество действующих организаций
     """
 
-    _URL_BASE = 'https://egrul.nalog.ru'
-    _URL_GET_DATA = _URL_BASE + '/search-result/'
-    _URL_GET_DOC_REQUEST = _URL_BASE + '/vyp-request/'
-    _URL_GET_DOC_STATUS = _URL_BASE + '/vyp-status/'
-    _URL_GET_DOC_DOWNLOAD = _URL_BASE + '/vyp-download/'
-    _UNRELIABLE_MARK =  'недостоверн'
+    _UNRELIABLE_MARK = Client._UNRELIABLE_MARK
 
 
-    def __init__(self, inn=None, selecte_one=True, proxy=None):
+    def __init__(self, inn=None, selecte_one=True, proxy=None, session=None, cache=None, pdf_store=None,
+                 scheduler=None, base_url=None, timeout=DEFAULT_TIMEOUT, metrics=None, proxy_pool=None, client=None,
+                 coordinator=None):
         """
             inn : строка с инн или огрн для поиска организации
             если inn заполнен выполняется метод info и заполняются поля объекта
+            session : готовая requests.Session (общий пул соединений для нескольких объектов и fl.FL),
+                      по умолчанию transport.make_session
+            cache : кэш результатов поиска (cache.MemoryCache, cache.SQLiteCache или объект с методами get/set)
+            pdf_store : хранилище pdf выписок (pdf_store.PdfStore), выписки загружаются только при отсутствии свежих
+            scheduler : планировщик запросов (limiter.Scheduler), по умолчанию общий для процесса limiter.default_scheduler
+            base_url : адрес сервиса вместо https://egrul.nalog.ru (тестовый сервер, зеркало)
+            timeout : таймаут одного HTTP запроса, с, или кортеж (соединение, чтение)
+            metrics : сбор метрик и спанов (metrics.Metrics), по умолчанию выключен
+            proxy_pool : пул прокси (proxy.ProxyPool), запросы распределяются по прокси вместо одного proxy
+            coordinator : согласование с другими процессами (coordination.Coordinator): общий для процессов
+                          планировщик и один запрос на все процессы для одинакового поиска
+            client : готовый client.Client (общий для многих объектов FNS), тогда параметры proxy, session, cache,
+                     pdf_store, scheduler, base_url, timeout, metrics, proxy_pool, coordinator не используются
         """
-        self.log = logging.getLogger('FNS')
-        self.log.debug('[FNS] inn=%s selecte_one=%s proxy=%s' % (inn, selecte_one, proxy))
+        self.log = logger
+        self.log.debug('[fns] inn=%s selecte_one=%s proxy=%s', inn, selecte_one, proxy)
         self._reset_variables()
-        self.session = requests.Session()
-        if proxy:
-            self.session.proxies.update(proxy)
-            self.session.trust_env = False
-                
+        self.client = client or Client(session, DEFAULT_POOL_SIZE, proxy, cache, pdf_store, scheduler, base_url,
+                                       timeout, metrics, proxy_pool, coordinator)
+
         if inn:
             self.info(inn, selecte_one=selecte_one)   # get_data
                     
+    # настройки и транспорт хранит self.client; присваивание (org.timeout = 10) меняет настройку клиента,
+    # то есть и всех объектов FNS на общем клиенте (info_many, FNS(client=...))
+    session = _client_attr('session')
+    cache = _client_attr('cache')
+    pdf_store = _client_attr('pdf_store')
+    scheduler = _client_attr('scheduler')
+    base_url = _client_attr('base_url')
+    timeout = _client_attr('timeout')
+    metrics = _client_attr('metrics')
+    proxy_pool = _client_attr('proxy_pool')
+
     def _reset_variables(self):
         self.type = ''
         self.title_long = ''
@@ -82,10 +125,13 @@ class FNS(object):
         self.dirs = {}
         self.dirs_num = 0
         self.dict = {}
+        self.record = None
         self.is_one_record = False
         self.is_doc_loaded = False
         self.doc_pdf = b''
+        self.doc_extract = None
         self.is_valid_org = None
+        self.unreliable_mark = None
         self.response_raw = ''
         self._response = ''
         self.response_num = 0
@@ -93,21 +139,129 @@ class FNS(object):
         self.response_act_num = 0
 
 
-    def info(self, inn, selecte_one=True, attempts=10):
+    @traced('fns.info')
+    def info(self, inn, selecte_one=True, attempts=10, deadline=None):
         """
             Получает данные по организации по ИНН/ОГРН.
-            attempts - количество попыток получить данные, попытки разделены ожиданием *10c
+            attempts - количество попыток получить данные, паузы между попытками задает self.scheduler
             selecte_one - заполнять данные по одной организации выбирается действующая если есть, иначе первая в выдаче
+            deadline - общий срок на все попытки и паузы, с; при превышении errors.FNSTimeoutError
+            ИНН/ОГРН с неверными контрольными цифрами отклоняется без запроса в ФНС: errors.FNSValueError
+            ответ ФНС не получен за attempts попыток (капча, ошибки HTTP) - errors.FNSError
         """
         self._reset_variables()
 
-        self.response_raw = self._get_response(inn, attempts)
+        self.response_raw = self._get_response(inn, attempts, deadline)
+        self._parse_response(self.response_raw, selecte_one)
+
+
+    def info_many(self, inns, selecte_one=True, attempts=10, workers=8, check_valid=False, deadline=None):
+        """
+            Пакетное получение данных по списку ИНН/ОГРН в пуле из workers потоков.
+            Генератор, возвращает LookupResult по мере готовности (порядок завершения, не порядок входа).
+            Повторяющиеся ИНН запрашиваются один раз, LookupResult.indexes - их позиции во входном списке.
+            Все запросы идут через общую сессию self.session, поля самого объекта не меняются.
+            check_valid - для юр. лиц сразу загружать выписку и проверять недостоверность (is_valid_org_check)
+            deadline - срок на один запрос вместе с проверкой выписки, с; просроченные запросы
+                       возвращаются с LookupResult.error = errors.FNSTimeoutError
+            Запрос без ответа ФНС за attempts попыток (капча, ошибки HTTP) возвращается с LookupResult.error =
+            errors.FNSError, а не как организация с пустыми полями, и не кэшируется
+        """
+        return self.client._lookup_many(self._info_one, inns, workers, selecte_one, attempts, check_valid, deadline)
+
+
+    def _info_one(self, query, selecte_one, attempts, check_valid=False, deadline=None):
+        deadline = Deadline.of(deadline)
+        org = self._child()
+        org._parse_response(self._get_response(query, attempts, deadline), selecte_one)
+        if check_valid and org.type == 'ul' and org.doc_token:
+            org.is_valid_org_check(attempts, fast=True, deadline=deadline)
+        return org
+
+
+    def _child(self):
+        # новый объект на том же клиенте: сессия, кэш, хранилище, планировщик и прокси общие
+        return FNS(client=self.client)
+
+
+    def recheck_many(self, inns, snapshot, max_age=30, pdf_fields=PDF_FIELDS, attempts=10, workers=8,
+                     deadline=None):
+        """
+            Инкрементальная повторная проверка списка ИНН/ОГРН по снимку snapshot (snapshot.Snapshot).
+            Генератор, возвращает snapshot.Change по мере готовности (порядок завершения, не порядок входа).
+
+            Данные каждой организации запрашиваются заново (без self.cache) и сравниваются с последними
+            сохраненными в снимке, Change.diff - изменившиеся поля {поле: (было, стало)}.
+            Выписка юр. лица загружается и проверяется на недостоверность (is_valid_org_check), только если
+            организации нет в снимке, изменилось одно из полей pdf_fields или прошлой проверке больше max_age дней;
+            иначе is_valid_org берется из снимка. Изменение is_valid_org тоже попадает в diff.
+            Если задано хранилище self.pdf_store: при изменении полей выписка загружается заново,
+            при проверке по сроку берется из хранилища, если ей не больше max_age дней.
+            deadline - срок на один запрос вместе с проверкой выписки, с
+            Если организация есть в снимке, а ФНС ничего не вернула (временная ошибка, исчерпаны попытки),
+            Change.error = errors.FNSError и снимок не меняется.
+        """
+        queries, invalid = split_valid(dict.fromkeys(normalize_query(inn) for inn in inns))
+        for query in invalid:
+            self.log.warning('[fns] recheck_many отклонен запрос %s: не ИНН/ОГРН', query,
+                             extra={'event': 'invalid_id', 'query': query})
+            yield Change(query, error=invalid_error(query))
+
+        for query, change, error in self.client._pool_run(self._recheck_one, queries, workers,
+                                                   snapshot, max_age, pdf_fields, attempts, deadline):
+            if error is not None:
+                self.log.error('[fns] recheck_many query=%s error=%s', query, error,
+                               extra={'event': 'lookup_error', 'query': query})
+                change = Change(query, error=error)
+            elif change.diff:
+                self.log.info('[fns] %s изменены поля: %s', query, ', '.join(change.diff),
+                              extra={'event': 'changed', 'query': query, 'diff': change.diff})
+            yield change
+
+
+    def _recheck_one(self, query, snapshot, max_age, pdf_fields, attempts, deadline):
+        deadline = Deadline.of(deadline)
+        org = self._child()
+        org._parse_response(self.client.search(query, attempts, deadline, use_cache=False))
+        row = org._response or {}
+
+        entry = snapshot.get(query)
+        if entry is not None and not row:
+            # пустой ответ - временная ошибка или исчерпаны попытки, а не исчезновение всех полей
+            raise FNSError('нет ответа ФНС по %s, снимок не изменен' % query)
+        diff = diff_rows(entry.row if entry else None, row)
+        checked, is_valid_org = (entry.checked, entry.is_valid_org) if entry else (None, None)
+
+        changed = any(field in diff for field in pdf_fields)
+        stale = checked is None or time.time() - checked > max_age * 86400
+        recheck = bool(org.type == 'ul' and org.doc_token and (changed or stale))
+        if recheck:
+            org.is_valid_org_check(attempts, fast=True, deadline=deadline, max_age=0 if changed else max_age)
+            if org.is_valid_org is not None:
+                if entry is not None and org.is_valid_org != is_valid_org:
+                    diff['is_valid_org'] = (is_valid_org, org.is_valid_org)
+                checked, is_valid_org = time.time(), org.is_valid_org
+        elif is_valid_org is not None and org.type == 'ul':
+            org._set_valid(is_valid_org)
+
+        if row:
+            snapshot.put(query, row, checked, is_valid_org)
+        return Change(query, org, diff, entry is None, recheck)
+
+
+    def _parse_response(self, response_raw, selecte_one=True):
+        """
+            Заполняет поля объекта по ответу ФНС (список записей rows), без обращения к сети
+            selecte_one - заполнять данные по одной организации выбирается действующая если есть, иначе первая в выдаче
+        """
+        self.response_raw = response_raw
+        self.response_num = len(response_raw)
         self.response_act = self._acting_records(self.response_raw)
         self.response_act_num = len(self.response_act)
 
         if self.response_act_num >1:
-            print('*** warning : более одной действующей организации') 
-            self.log.warning('[fns] more then 1 organisation' )
+            self.log.warning('[fns] более одной действующей организации: %s', self.response_act_num,
+                             extra={'event': 'many_acting', 'count': self.response_act_num})
                 
 
         if self.response_num > 1: 
@@ -125,151 +279,44 @@ class FNS(object):
             
 
         if not self._response:
-            print('Отсутствую данные ФНС') 
-            self.log.warning('[fns] empty response' )
+            self.log.warning('[fns] отсутствуют данные ФНС', extra={'event': 'empty_response'})
 
             return
 
-        if self._response['k'] == 'ul':
-            self.type = 'ul'
-        elif self._response['k'] == 'fl':
-            self.type = 'ip'
-        elif self._response['k'] == 'sprav-fl':
-            self.type = 'fl'
-        else:
-            self.type = 'unknown'
-
-        self.doc_token = self._response['t']
+        self.record = parse_row(self._response)
+        self.type = self.record.type
+        self.doc_token = self.record.doc_token
         
         if self.type == 'fl':
             return
 
-
-        self.title_long = self._response.get('n','')
-        self.title_short = self._response.get('c','')
-        self.address = self._response.get('a','')
-        self.inn = self._response.get('i','')
-        self.ogrn = self._response.get('o','')
-        self.kpp = self._response.get('p','')
-        self.reg_date = self._response.get('r','')
-        self.end_date = self._response.get('e','')
-        self.not_valid_date = self._response.get('v','')
-
+        (_, self.title_long, self.title_short, self.address, self.inn, self.ogrn, self.kpp,
+         self.reg_date, self.end_date, self.not_valid_date, _, self.position, self.fio, dirs, _) = self.record
 
         if self._response['k'] == 'ul':
             if 'g' in self._response:
                 self.dirs_raw = self._response['g']
-
+                self.dirs_num = len(dirs)
                 # случай с несколькими директорами
-                if ',' in self._response['g'] and self._response['g'].count(':') > 1:
-                    self.dirs = self._dirs_dict(self._response['g'])
-                    
-                    # берем первого директора
-                    self.fio = self.dirs[0]['fio']
-                    self.position = self.dirs[0]['position']
-                else:
-                    # self.position = self._response['g'].split(':')[0].strip()
-                    self.position = self._response['g'].split(':')[0].strip()
-                    self.dirs_num = 1
-                    try:
-                        self.fio = self._response['g'].split(':')[1].strip()
-                    except Exception as e:
-                        self.fio = self._response['g'] 
+                if len(dirs) > 1:
+                    self.dirs = {i: {'position': p, 'fio': f} for i, (p, f) in enumerate(dirs)}
             else:
-                print('*** error : отсутствует поле должность и ФИО')
-                self.log.warning('[fns] no position and fio fields' )
-                self.log.warning('[fns] _response = %s' % self._response)
-                self.position = ''
+                self.log.warning('[fns] отсутствует поле должность и ФИО: %s', self._response,
+                                 extra={'event': 'no_director', 'inn': self.inn})
 
-        # если не юр лицо берем фио
-        else:
-            if 'n' in self._response:
-                self.fio = self._response['n']
         self.fio_f, self.fio_i, self.fio_o = self.fio_split(self.fio)
         self._write_dict()
 
 
 
-    def _get_response(self, query, attempts=10):
+    def _get_response(self, query, attempts=10, deadline=None):
         """
-            Метод получает данные по запросу
-            attempts - количество попыток получить данные, попытки разделены ожиданием №*10
+            Метод получает данные по запросу, из кэша self.cache если он задан
+            attempts - количество попыток получить данные, паузы между попытками задает self.scheduler
+            deadline - общий срок, с, или transport.Deadline
+            числовой запрос с неверными контрольными цифрами ИНН/ОГРН сразу отклоняется errors.FNSValueError
         """
-
-        attempt_counter = 0
-        sleep(1)  # пауза перед запросом, чтобы не получить на капчу
-        while attempt_counter < attempts:  # отправляем запрос
-            attempt_counter += 1
-            _req1 = self.session.post(self._URL_BASE, data={'query':str(query) })
-            
-            try:
-                j1 = json.loads(_req1.text)  # что вернет
-            except Exception as e:
-                j1 = {}
-                print('*** error : Не удалось загрузить json self._get_response', _req1.text) 
-                self.log.error(f'[fns] Не удалось загрузить json self._get_response {_req1.text}')
-
-
-            if _req1.status_code != requests.codes.ok :
-                print('*** error : ошибка ОТПРАВКИ запроса в nalog.ru. код ошибки', _req1.status_code)  
-                self.log.error('[fns] ошибка ОТПРАВКИ запроса в nalog.ru. код ошибки = %s' % _req1.status_code)
-
-
-                if _req1.status_code == requests.codes.not_allowed :
-                    print('*** error : Сервис nalog.ru не доступен. данные не получены') 
-                    self.log.error('[fns] Сервис nalog.ru не доступен. данные не получены')
-                    return {}
-
-                if ('ERRORS' in j1) and ('captchaSearch' in j1['ERRORS']):
-                    print('ФНС запрашивает ввод капчи, ждем ...', attempt_counter*10, 'c')
-                    self.log.warning('[fns] ФНС запрашивает ввод капчи, ждем ... %s*10 c' % attempt_counter)
-                    sleep(attempt_counter*10)
-                else:
-                    print('Ошибка. ответ сервера =', j1) 
-                    self.log.error('[fns] ФОшибка. ответ сервера = %s' % j1)
-
-            elif j1.get('captchaRequired') != False: # запрашивается капча - ждем
-                print('ФНС запрашивает ввод капчи, ждем ...', attempt_counter*10, 'c')
-                self.log.warning('[fns] ФНС запрашивает ввод капчи, ждем ... %s*10 c' % attempt_counter)
-                sleep(attempt_counter*10)
-            else:
-                break # данные получены без ошибок - выходим из цикла
-
-
-        attempt_counter = 0
-        while attempt_counter < attempts:
-            try:
-                _req2 = self.session.get(self._URL_GET_DATA + j1['t'])
-            except Exception as e:
-                print('error =', _req2.status_code)
-                self.log.error('[fns] error = %s' % _req2.status_code)
-                # print(json.loads(_req2.text))  # что вернет
-                
-            if _req2.status_code != requests.codes.ok :
-                print('*** error : ошибка ПОЛУЧЕНИЯ ответа из nalog.ru. код ошибки', _req2.status_code)
-                self.log.error('[fns] ошибка ПОЛУЧЕНИЯ ответа из nalog.ru. код ошибки = %s' % _req2.status_code)
-                print(json.loads(_req2.text)) 
-                break    # точно return?
-            j2 = json.loads(_req2.text)
-            if j2 == dict(status = 'wait'):
-                print('Ждем ответ ФНС ...') 
-                self.log.info('[fns] Ждем ответ ФНС ...')
-                attempt_counter += 1
-                sleep(attempt_counter*10)
-                continue
-            
-            self.response_num = len(j2.get('rows'))
-
-            if not j2.get('rows') :
-                print('*** error : ошибка доступа к структуре ответа ФНС. отсутствует ключ ["rows"]')
-                self.log.error('[fns] ошибка доступа к структуре ответа ФНС. отсутствует ключ ["rows"]')
-                break
-            elif len(j2.get('rows')) != 1:
-                # print('Найдено записей ЕГРН =', len(j2.get('rows')))
-                return j2['rows']
-
-            return j2['rows'] # если одна запись возвращаем не список, а сам словарь
-        return []
+        return self.client.search(query, attempts, deadline)
 
 
     def _acting_records(self, list_of_dicts):
@@ -293,98 +340,99 @@ class FNS(object):
             return list_of_dicts[0]
 
 
-    def search(self, query):
+    def search(self, query, deadline=None):
         """
             Возвращает список со словарями с результатами поискового запроса по любым данным
+            deadline - общий срок, с; при превышении errors.FNSTimeoutError
         """
-        return self._get_response(query)
+        return self.client.search(query, deadline=deadline)
 
 
 
 # ----------------
 
-    def get_doc_pdf(self, attempts=10):
+    @traced('fns.get_doc_pdf')
+    def get_doc_pdf(self, attempts=10, deadline=None):
         """
             Возвращает битовую строку с содержимым выписки в формате pdf
-            attempts - количество попыток получить данные, попытки разделены ожиданием №*10
+            attempts - количество попыток получить данные, паузы между попытками задает self.scheduler
+            если задано хранилище self.pdf_store, выписка берется из него и загружается только при отсутствии свежей
+            deadline - общий срок на запрос, ожидание и загрузку выписки, с; при превышении errors.FNSTimeoutError
         """
+        deadline = Deadline.of(deadline)
 
         self.is_doc_loaded = False
         self.doc_pdf = b''
+        self.doc_extract = None
 
-        sleep(5)
-
-        attempt_counter = 0
-        while attempt_counter < attempts:
-            attempt_counter += 1 
-            _req1 = self.session.get(self._URL_GET_DOC_REQUEST + self.doc_token) #отправка запроса на выписку
-            # print('get_doc_pdf ответ на запрос выписки', _req1.text) 
-            j1 = json.loads(_req1.text)
+        self.doc_pdf = self.client.doc_pdf(self, attempts, deadline)
+        self.is_doc_loaded = bool(self.doc_pdf)
+        return self.doc_pdf
 
-            if j1.get('captchaRequired') == True: # запрашивается капча - ждем
-                print('ФНС запрашивает ввод капчи [get_doc_pdf], ждем ...', attempt_counter*10, 'c')
-                self.log.warning('[fns] [get_doc_pdf] ФНС запрашивает ввод капчи, ждем ... %s*10 c' % attempt_counter)
 
-                sleep(attempt_counter*10)
-                continue
-            
-            if 'ERRORS' in j1:
-                if 'captchaVyp' in j1['ERRORS']:
-                    print('Отправка запроса на выписку ФНС [get_doc_pdf] (captcha) ...', attempt_counter*10, 'c') 
-                    self.log.warning('[fns] [get_doc_pdf] Отправка запроса на выписку ФНС (captcha) ... ... %s*10 c' % attempt_counter)
-                    sleep(attempt_counter*10)
-                    continue
-                else:
-                    print('Отправка запроса на выписку ФНС. [get_doc_pdf] неизвестная ошибка ', j1)
-                    self.log.error('[fns] [get_doc_pdf] Отправка запроса на выписку ФНС. неизвестная ошибка %s' % j1)
+    @traced('fns.get_extract')
+    def get_extract(self, attempts=10, deadline=None):
+        """
+            Возвращает разобранную выписку extract.Extract (разделы и поля), None если выписку получить не удалось
+            Страницы разбираются по мере обращения к разделам. Если задано хранилище self.pdf_store,
+            выписка и ее разбор берутся из него, полный разбор сохраняется рядом с pdf.
+            deadline - общий срок на запрос, ожидание и загрузку выписки, с; при превышении errors.FNSTimeoutError
+        """
+        if self.doc_extract is None:
+            if self.is_doc_loaded and not self._doc_key():
+                self.doc_extract = Extract(self.doc_pdf)
             else:
-                break
+                self.doc_extract = self.client.extract(self, attempts, deadline)
+        return self.doc_extract
 
 
-        attempt_counter = 0
-        while attempt_counter < attempts:
-            attempt_counter += 1 
-            _req2 = self.session.get(self._URL_GET_DOC_STATUS + self.doc_token) # статус зщапроса на выписку
+    def get_doc_path(self, attempts=10, deadline=None, max_age=None):
+        """
+            Возвращает путь к файлу выписки в хранилище self.pdf_store, None если выписку получить не удалось
+            выписка загружается потоком сразу в файл, только если в хранилище нет свежей
+            max_age - срок годности выписки в днях (по умолчанию pdf_store.max_age, 0 - только сегодняшняя)
+        """
+        return self.client.doc_path(self, attempts, deadline, max_age)
 
-            try:
-                j2 = json.loads(_req2.text)['status']
-            except Exception as e:
-                j2 = ''
-                print(_req2.text) 
-                self.log.warning('[fns] [get_doc_pdf] ошибка получения статуса выписки. %s' % _req2.text)
 
-            if j2 == 'ready': # ответ готов, выходим из цикла
-                break
+    def get_doc_pdf_many(self, items, attempts=10, workers=8, window=100, delay=None):
+        """
+            Конвейерная загрузка выписок многих организаций.
+            Генератор, возвращает DocResult по мере готовности (порядок завершения, не порядок входа).
+            items - токены выписок (doc_token) или объекты с полем doc_token (FNS, record.OrgRecord)
+
+            Запросы на выписку отправляются сразу для window токенов, статусы всех ожидающих
+            опрашиваются вместе, раундами, загрузка каждой выписки начинается как только она готова.
+            Так время подготовки выписок на стороне ФНС перекрывается, а не складывается, как при get_doc_pdf подряд.
+            Если задано хранилище self.pdf_store, для объектов с ОГРН/ИНН свежие выписки берутся из него,
+            загруженные сохраняются в него (DocResult.path).
+            attempts - количество попыток запроса и опросов статуса одной выписки
+            delay - пауза между раундами опроса, с, по умолчанию задает self.scheduler
+        """
+        return self.client.doc_pdf_many(items, attempts, workers, window, delay)
 
-            if j2 == 'wait': 
-                print('Ждем выписку ФНС [get_doc_pdf] ...', attempt_counter*10, 'c') 
-                self.log.info('[fns] [get_doc_pdf] Ждем выписку ФНС ... %s*10 c' % attempt_counter)
-                # print(r.text) 
-                sleep(attempt_counter*10)
-                continue
-            print('необрабатываемый статус ответа ФНС [get_doc_pdf]', _req2.text)
-            self.log.info('[fns] [get_doc_pdf] необрабатываемый статус ответа ФНС %s' % _req2.text)
 
-        else:
-            self.log.warning('[fns] [get_doc_pdf] пустой ответ')
-            return b''
-
-        _req3 = self.session.get(self._URL_GET_DOC_DOWNLOAD + self.doc_token) # получение выписки
-        self.doc_pdf = _req3.content
-        self.is_doc_loaded = True
-        return self.doc_pdf
+    def _doc_key(self):
+        # ключ выписки в хранилище, None если хранилище не задано
+        return self.client._doc_item(self)[1]
 
 
     def save_doc_pdf(self, filename):
         """
             Созраняет в указанный файл выписку в формате pdf
             filename - строка с полным путем к файлу
+            при заданном self.pdf_store файл копируется из хранилища, без загрузки в память
         """
 
         f = open(filename, 'wb')
 
         if self.is_doc_loaded:
             f.write(self.doc_pdf)
+        elif self._doc_key():
+            path = self.get_doc_path()
+            if path:
+                with open(path, 'rb') as src:
+                    shutil.copyfileobj(src, f)
         elif self.doc_token:
             f.write(self.get_doc_pdf())
 
@@ -392,31 +440,28 @@ class FNS(object):
 
 
     def _write_dict(self):
-        self.dict.update({'type' : self.type})
-        self.dict.update({'title_long' : self.title_long})
-        self.dict.update({'title_short' : self.title_short})
-        self.dict.update({'position' : self.position})
-        self.dict.update({'fio' : self.fio})
-        self.dict.update({'address' : self.address})
-        self.dict.update({'inn' : self.inn})
-        self.dict.update({'ogrn' : self.ogrn})
-        self.dict.update({'kpp' : self.kpp})
-        self.dict.update({'reg_date' : self.reg_date})
-        self.dict.update({'end_date' : self.end_date})
-        self.dict.update({'not_valid_date' : self.not_valid_date})
-        # self.dict.update({'doc_token' : self.doc_token})
-
+        self.dict = {
+            'type' : self.type,
+            'title_long' : self.title_long,
+            'title_short' : self.title_short,
+            'position' : self.position,
+            'fio' : self.fio,
+            'address' : self.address,
+            'inn' : self.inn,
+            'ogrn' : self.ogrn,
+            'kpp' : self.kpp,
+            'reg_date' : self.reg_date,
+            'end_date' : self.end_date,
+            'not_valid_date' : self.not_valid_date,
+        }
         if self.dirs:
-            self.dict.update({'dirs' : self.dirs})
-
-        self.dict.update({'dirs_raw' : self.dirs_raw})
-        self.dict.update({'dirs_num' : self.dirs_num})
-        
-        self.dict.update({'is_doc_loaded' : self.is_doc_loaded})
-
+            self.dict['dirs'] = self.dirs
+        self.dict['dirs_raw'] = self.dirs_raw
+        self.dict['dirs_num'] = self.dirs_num
+        self.dict['is_doc_loaded'] = self.is_doc_loaded
         if self.is_valid_org != None:
-            self.dict.update({'is_valid_org' : self.is_valid_org})
-        self.dict.update({'response_act_num' : self.response_act_num})
+            self.dict['is_valid_org'] = self.is_valid_org
+        self.dict['response_act_num'] = self.response_act_num
 
 
     def fio_split(self, fio):
@@ -432,31 +477,59 @@ class FNS(object):
         return parts[0], parts[1], ' '.join(parts[2:]).strip()
 
 
-    def is_valid_org_check(self, attempts=10, pages_to_parse=4):
+    @traced('fns.is_valid_org_check')
+    def is_valid_org_check(self, attempts=10, pages_to_parse=4, fast=False, deadline=None, max_age=None):
         """
             Возвращает False если в ЕГРЮЛ есть отметка о недостоверности данных (адреса / прочего)
             Проверяет наличие слова "недостоверн" в выписке ЕГРЮЛ в первых 3 страницах
+            fast - False (по умолчанию): полное извлечение текста pdfminer, заполняются self.pdf_text и self.pdf_text_cut;
+                   True - быстрый поиск по содержимому страниц (pdf_check.find_mark) до первого совпадения,
+                   страница и раздел с отметкой сохраняются в self.unreliable_mark, pdf_text не заполняется
+                   (так проверяют info_many(check_valid=True) и recheck_many)
+            deadline - общий срок на получение выписки, с; при превышении errors.FNSTimeoutError
+            max_age - срок годности выписки из хранилища self.pdf_store в днях (по умолчанию pdf_store.max_age)
         """
+        deadline = Deadline.of(deadline)
         self.is_valid_org = None
+        self.pdf_data = None
         if not self.is_doc_loaded:
-            self.get_doc_pdf(attempts)
+            if self._doc_key():
+                path = self.get_doc_path(attempts, deadline, max_age)
+                if path:
+                    self.pdf_data = open(path, 'rb')
+            else:
+                self.get_doc_pdf(attempts, deadline)
 
-        if self.doc_pdf:
+        if self.pdf_data is None and self.doc_pdf:
             self.pdf_data = io.BytesIO(self.doc_pdf)
-            self.pdf_text = pdfminer.high_level.extract_text(self.pdf_data, maxpages=pages_to_parse)
-            self.pdf_text_cut = re.sub(r'[ \f\n\r\t\v]','',self.pdf_text)
 
-            if self.type == 'ul':
-                if self._UNRELIABLE_MARK in self.pdf_text_cut:
-                    self.is_valid_org = False
-                    self.dict.update({'is_valid_org' : self.is_valid_org})
-                    return False
+        if self.pdf_data is not None:
+            start = time.perf_counter()
+            with self.pdf_data:
+                if fast:
+                    self.unreliable_mark = find_mark(self.pdf_data, pages_to_parse, self._UNRELIABLE_MARK)
+                    found = self.unreliable_mark.found
                 else:
-                    self.is_valid_org = True
-                    self.dict.update({'is_valid_org' : self.is_valid_org})
-                    return True
+                    self.pdf_text = pdfminer.high_level.extract_text(self.pdf_data, maxpages=pages_to_parse)
+                    self.pdf_text_cut = re.sub(r'[ \f\n\r\t\v]','',self.pdf_text)
+                    found = self._UNRELIABLE_MARK in self.pdf_text_cut
+            if self.metrics.enabled:
+                self.metrics.observe('fns_pdf_parse_seconds', time.perf_counter() - start,
+                                     method='fast' if fast else 'full')
+
+            if self.type == 'ul':
+                return self._set_valid(not found)
         else:
-            print('ДАНЫЕ ВЫПИСКИ НЕ ПОЛУЧЕНЫ. проверка недостоверности не завершена') 
+            self.log.warning('[fns] данные выписки не получены, проверка недостоверности не завершена',
+                             extra={'event': 'no_extract', 'inn': self.inn})
+
+
+    def _set_valid(self, is_valid_org):
+        self.is_valid_org = is_valid_org
+        self.dict.update({'is_valid_org' : self.is_valid_org})
+        if self.record is not None:
+            self.record = self.record._replace(is_valid_org=self.is_valid_org)
+        return self.is_valid_org
 
 
     def is_inn(self, inn: str):
@@ -466,17 +539,14 @@ class FNS(object):
                 - содержатся только цифры
                 - длина 10 (ЮЛ) или 12 (ИП) цифр
                 - начинается не с '00'
+                - контрольные цифры верны (ids.is_inn)
 
             :inn: инн на проверку
         """
-        inn = str(inn)
-        if inn.isdigit() and \
-                not inn.startswith('00') and \
-                (len(inn) in (10, 12)) :
-
+        if ids_is_inn(inn):
             return True
         else:
-            print('*** error : NOT INN =', inn) 
+            self.log.info('[fns] не ИНН: %s', inn, extra={'event': 'not_inn'})
             return False
 
 
@@ -486,77 +556,18 @@ class FNS(object):
             каждый словарь содержит поля
             position, fio
         """
-            # : разделяет должность и фио
-            # , разделяет список руководителей (либо участвует в названии должности)
-
-        result_list = []
-        dirs_dict = {}
-        temp_list = director_string.split(':') # 
-
-        for i in range(0, len(temp_list)):
-            if ( i == 0 ) or ( i == len(temp_list)-1 ):
-                result_list.append(temp_list[i].strip())
-            else:
-                n = temp_list[i].index(',')   # ищем первый разделитель "," после фио 
-                result_list.append(temp_list[i][:n].strip())
-                result_list.append(temp_list[i][n+1:].strip())
-
-        if len(result_list) % 2 != 0:  # должно быть четное количество элементов, пары (должность-фио)
-            print('*** error: ошибка парсинга должностей и ФИО') 
-
-        for i in range(0, len(result_list), 2):
-            i_new = i // 2
-            dirs_dict.update({i_new:{}})
-            dirs_dict[i_new].update({'position' : result_list[i]})
-            dirs_dict[i_new].update({'fio' : result_list[i+1]})
-        self.dirs_num = len(result_list) // 2
-        return dirs_dict
+        dirs = parse_dirs(director_string)
+        self.dirs_num = len(dirs)
+        return {i: {'position': p, 'fio': f} for i, (p, f) in enumerate(dirs)}
 
 
 # ----------------
 
     def addr_cut(self, address):
-        new_address = address
-        cuts = []
-        cuts.append([', ', '[РАЗДЕЛИТЕЛЬ]'])
-        cuts.append([',', '[РАЗДЕЛИТЕЛЬ]'])
-        cuts.append([' УЛИЦА ', '[УЛИЦА]'])
-        cuts.append([' УЛ.', '[УЛИЦА]'])
-        cuts.append([' ПР.', '[ПРОСПЕКТ]'])
-        cuts.append([' ПРОСПЕКТ ', '[ПРОСПЕКТ]'])
-        cuts.append([' ДОМ ', '[ДОМ]'])
-        cuts.append([' Д.', '[ДОМ]'])
-        cuts.append([' ГОРОД', '[ГОРОД]'])
-        cuts.append([' ПОСЕЛОК ', '[ПОСЕЛОК]'])
-        cuts.append([' П. ', '[ПОСЕЛОК]'])
-        cuts.append([' ОФИС', '[ОФИС]'])
-        cuts.append([' ОФ ', '[ОФИС]'])
-        cuts.append([' ОФ.', '[ОФИС]'])
-        cuts.append([' КОРПУС ', '[КОРПУС]'])
-        cuts.append([' КОРП.', '[КОРПУС]'])
-        # cuts.append([' К.', '[РАЗДЕЛИТЕЛЬ]'])
-        cuts.append([' ПОМЕЩЕНИЕ ', '[ПОМЕЩЕНИЕ]'])
-        cuts.append([' ПОМ ', '[ПОМЕЩЕНИЕ]'])
-        cuts.append([' ПОМ. ', '[ПОМЕЩЕНИЕ]'])
-        cuts.append([' ШОССЕ', '[ШОССЕ]'])
-        cuts.append([' Ш.', '[ШОССЕ]'])
-        cuts.append([' ГОРОД ', '[ГОРОД]'])
-        cuts.append([' Г. ', '[ГОРОД]'])
-        cuts.append([' КВАРТИРА ', '[КВАРТИРА]'])
-        cuts.append([' КВ.', '[КВАРТИРА]'])
-        cuts.append([' ЛИТЕРА ', '[ЛИТЕРА]'])
-        cuts.append([' ЛИТЕР ', '[ЛИТЕРА]'])
-        cuts.append([' ЛИТ.', '[ЛИТЕРА]'])
-        cuts.append([' ЛИТ ', '[ЛИТЕРА]'])
-        cuts.append([' КОМНАТА ', '[КОМНАТА]'])
-        cuts.append([' КОМ.', '[КОМНАТА]'])
-        cuts.append(['  ', ' '])
-
-        for cut in cuts:
-            new_address = new_address.replace(cut[0], cut[1])
-        new_address = new_address.replace('[РАЗДЕЛИТЕЛЬ]', ' ')
-        new_address = new_address.replace('[ГОРОД]', ' ')
-        return new_address
+        """
+            Нормализованная строка адреса (address.normalize), части адреса - address.parse
+        """
+        return normalize_address(address)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+#*- coding: utf-8 -*-
+"""Проверка ИНН, ОГРН и ОГРНИП по контрольным цифрам без обращения к сети
+
+    kind('7802182340')      'inn_ul'
+    kind('7802182341')      ''        - число, но не ИНН/ОГРН
+    kind('ООО РОМАШКА')     None      - не число, текстовый запрос
+    valid_many(['7802182340', '1027804862755', '123'])   array([ True,  True, False])
+
+    ИНН юр. лица - 10 цифр, ИНН физ. лица - 12 цифр (две контрольные), ОГРН - 13 цифр (остаток от деления на 11),
+    ОГРНИП - 15 цифр (остаток от деления на 13). ИНН не может начинаться с '00'.
+    Пакетные функции *_many принимают списки и массивы numpy строк; если установлен numpy,
+    проверка идет векторно (миллионы значений за доли секунды), иначе циклом.
+    Значения лучше передавать строками: у чисел теряются ведущие нули ИНН ('0274062111').
+"""
+try:
+    import numpy
+except ImportError:  # numpy - необязательная зависимость, без него пакетная проверка идет циклом
+    numpy = None
+
+from .errors import FNSValueError
+
+
+INN_UL = 'inn_ul'
+INN_FL = 'inn_fl'
+OGRN = 'ogrn'
+OGRNIP = 'ogrnip'
+
+_KINDS = (INN_UL, INN_FL, OGRN, OGRNIP)
+_NAMES = {INN_UL: 'ИНН', INN_FL: 'ИНН', OGRN: 'ОГРН', OGRNIP: 'ОГРНИП'}
+
+_W10 = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+_W11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_W12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+# коды пакетной проверки: индекс в _CODES
+_TEXT, _INVALID = 5, 0
+_CODES = ('',) + _KINDS + (None,)
+
+
+def _control(digits, weights):
+    return sum(d * w for d, w in zip(digits, weights)) % 11 % 10
+
+
+def _code(value):
+    value = str(value).strip()
+    if not value.isdigit() or not value.isascii():
+        return _TEXT
+    d = [ord(c) - 48 for c in value]
+    n = len(d)
+    if n == 10:
+        return 1 if value[:2] != '00' and _control(d, _W10) == d[9] else _INVALID
+    if n == 12:
+        return 2 if (value[:2] != '00' and _control(d, _W11) == d[10]
+                     and _control(d, _W12) == d[11]) else _INVALID
+    if n == 13:
+        return 3 if int(value[:12]) % 11 % 10 == d[12] else _INVALID
+    if n == 15:
+        return 4 if int(value[:14]) % 13 % 10 == d[14] else _INVALID
+    return _INVALID
+
+
+def kind(value):
+    """
+        Вид идентификатора: 'inn_ul', 'inn_fl', 'ogrn', 'ogrnip';
+        '' - число, не прошедшее проверку (неверная длина или контрольная цифра), None - не число
+    """
+    return _CODES[_code(value)]
+
+
+def is_valid(value):
+    """
+        True для ИНН, ОГРН или ОГРНИП с верными контрольными цифрами
+    """
+    return 0 < _code(value) < _TEXT
+
+
+def is_inn(value):
+    """
+        True для ИНН юр. или физ. лица с верными контрольными цифрами
+    """
+    return _code(value) in (1, 2)
+
+
+def check_query(query):
+    """
+        Проверка поискового запроса перед отправкой в ФНС: errors.FNSValueError, если запрос - число,
+        но не ИНН/ОГРН/ОГРНИП. Текстовые запросы не проверяются. Возвращает вид запроса (kind)
+    """
+    result = kind(query)
+    if result == '':
+        raise invalid_error(query)
+    return result
+
+
+def invalid_error(query):
+    """
+        errors.FNSValueError для запроса, не прошедшего проверку
+    """
+    return FNSValueError('%s не ИНН/ОГРН/ОГРНИП: неверная длина или контрольная цифра' % str(query).strip())
+
+
+def split_valid(queries):
+    """
+        Пакетная проверка запросов: (список допустимых, список отклоненных) в исходном порядке
+        Допустимы ИНН/ОГРН/ОГРНИП с верными контрольными цифрами и текстовые запросы
+    """
+    queries = list(queries)
+    valid, invalid = [], []
+    for query, result in zip(queries, kind_many(queries)):
+        (invalid if result == '' else valid).append(query)
+    return valid, invalid
+
+
+def _codes_numpy(values):
+    s = numpy.char.strip(numpy.asarray(values).astype(str))
+    n = len(s)
+    length = numpy.char.str_len(s)
+    # коды символов первых 15 знаков как матрица n x 15 (за концом строки - 0)
+    chars = s.astype('U15').view(numpy.uint32).reshape(n, 15)
+    inside = numpy.arange(15) < length[:, None]
+    ascii_digit = numpy.all(((chars >= 48) & (chars <= 57)) | ~inside, axis=1)
+
+    codes = numpy.full(n, _TEXT, dtype=numpy.int8)
+    codes[ascii_digit & (length > 0) & (length <= 15)] = _INVALID
+    long = numpy.flatnonzero(length > 15)
+    if len(long):  # длинные строки редки и в любом случае не ИНН/ОГРН
+        codes[long] = [_code(v) for v in s[long]]
+
+    # контрольные цифры считаются только для строк из цифр нужной длины
+    for size, code in ((10, 1), (12, 2), (13, 3), (15, 4)):
+        rows = numpy.flatnonzero(ascii_digit & (length == size))
+        if len(rows):
+            codes[rows[_check_numpy(chars[rows, :size].astype(numpy.int64) - 48)]] = code
+    return codes
+
+
+def _check_numpy(d):
+    # d - матрица цифр одной длины, возвращает массив bool
+    size = d.shape[1]
+    if size == 13:
+        return (d[:, :12] @ 10 ** numpy.arange(11, -1, -1, dtype=numpy.int64)) % 11 % 10 == d[:, 12]
+    if size == 15:
+        return (d[:, :14] @ 10 ** numpy.arange(13, -1, -1, dtype=numpy.int64)) % 13 % 10 == d[:, 14]
+    not00 = (d[:, 0] != 0) | (d[:, 1] != 0)
+    if size == 10:
+        return not00 & ((d[:, :9] @ numpy.array(_W10)) % 11 % 10 == d[:, 9])
+    return (not00 & ((d[:, :10] @ numpy.array(_W11)) % 11 % 10 == d[:, 10])
+            & ((d[:, :11] @ numpy.array(_W12)) % 11 % 10 == d[:, 11]))
+
+
+def _codes(values):
+    if numpy is not None:
+        return _codes_numpy(values)
+    return [_code(v) for v in values]
+
+
+def valid_many(values):
+    """
+        is_valid для списка или массива значений: массив numpy bool (без numpy - список)
+    """
+    codes = _codes(values)
+    if numpy is not None and isinstance(codes, numpy.ndarray):
+        return (codes > _INVALID) & (codes < _TEXT)
+    return [0 < c < _TEXT for c in codes]
+
+
+def kind_many(values):
+    """
+        kind для списка или массива значений, список в том же порядке
+    """
+    codes = _codes(values)
+    return [_CODES[c] for c in (codes.tolist() if hasattr(codes, 'tolist') else codes)]
+
+
+def name(kind):
+    """
+        Название вида идентификатора для сообщений: 'ИНН', 'ОГРН', 'ОГРНИП'
+    """
+    return _NAMES.get(kind, '')
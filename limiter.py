@@ -0,0 +1,171 @@
+#*- coding: utf-8 -*-
+import time
+import random
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+from .errors import FNSTimeoutError
+
+
+class _HostState(object):
+    """Состояние одного хоста: token bucket (GCRA) с адаптивной скоростью и паузой после капчи"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tat = 0.0  # теоретическое время следующего запроса
+        self.cooldown_until = 0.0
+        self.captcha_streak = 0
+        self.requests = 0
+        self.captchas = 0
+
+
+class Scheduler(object):
+    """Общий планировщик запросов к сервисам ФНС
+
+        Для каждого хоста (egrul.nalog.ru, service.nalog.ru, ...) - token bucket со своей скоростью.
+        Скорость подстраивается под сервис (AIMD): каждый чистый ответ немного ее увеличивает,
+        капча уменьшает в decrease раз и включает паузу для хоста с экспоненциальным ростом и случайным разбросом.
+        Один планировщик используется всеми объектами FNS и функциями fl.py (default_scheduler),
+        поэтому общий темп запросов процесса не зависит от количества объектов и потоков.
+        Запросы через разные прокси (параметр via) учитываются отдельно: капча на egrul.nalog.ru
+        выдается по IP, поэтому у каждого прокси своя скорость и своя пауза.
+
+        rate - начальная скорость, запросов в секунду
+        min_rate, max_rate - границы скорости
+        burst - сколько запросов можно отправить подряд без паузы
+        increase - прибавка скорости после чистого ответа, запросов в секунду
+        decrease - множитель скорости после капчи
+        cooldown - пауза после первой капчи, c (удваивается при повторных, не более max_cooldown)
+        jitter - относительный случайный разброс пауз
+    """
+
+    def __init__(self, rate=1.0, min_rate=0.05, max_rate=5.0, burst=1, increase=0.05, decrease=0.5,
+                 cooldown=10.0, max_cooldown=120.0, jitter=0.3):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.jitter = jitter
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, url, via=None):
+        # via - прокси: у каждой пары (хост, прокси) свой token bucket и своя пауза после капчи
+        host = urlsplit(url).netloc or url
+        key = host if via is None else (host, via)
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts.setdefault(key, _HostState(self.rate))
+        return state
+
+    def _jitter(self, value):
+        return value * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def reserve(self, url, via=None):
+        """
+            Резервирует слот для запроса к хосту url, возвращает сколько секунд нужно подождать до отправки
+            via - прокси, через который пойдет запрос (proxy.ProxyPool)
+        """
+        return self.try_reserve(url, via)
+
+    def try_reserve(self, url, via=None, max_delay=None):
+        """
+            Как reserve, но если ждать слота не меньше max_delay секунд, слот не резервируется и возвращается None
+            (запрос, который не успеет в срок, не занимает слот следующих запросов)
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(url, via)
+            interval = 1.0 / state.rate
+            start = max(now, state.tat - (self.burst - 1) * interval, state.cooldown_until)
+            if max_delay is not None and start - now >= max_delay:
+                return None
+            state.tat = max(state.tat, start) + interval
+            state.requests += 1
+        return start - now
+
+    def delay(self, url, via=None):
+        """
+            Сколько секунд до свободного слота для хоста url (через прокси via), без резервирования
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(url, via)
+            start = max(now, state.tat - (self.burst - 1) / state.rate, state.cooldown_until)
+        return start - now
+
+    def wait(self, url, deadline=None, via=None):
+        """
+            Ждет разрешения на запрос к хосту url (блокирующе)
+            deadline - transport.Deadline операции: если ждать дольше остатка срока, сразу errors.FNSTimeoutError,
+                       слот при этом не резервируется
+            Возвращает время ожидания в секундах
+        """
+        remaining = deadline.remaining() if deadline is not None else None
+        delay = self.try_reserve(url, via, remaining)
+        if delay is None:
+            raise FNSTimeoutError('истек срок %.1f c [%s]' % (deadline.timeout, urlsplit(url).netloc))
+        if delay > 0:
+            time.sleep(delay)
+        return max(0.0, delay)
+
+    async def async_wait(self, url, via=None, deadline=None):
+        """
+            Ждет разрешения на запрос к хосту url, не блокируя event loop
+            deadline - transport.Deadline операции, как у wait: слот, которого не дождаться до конца срока,
+                       не резервируется (иначе отмена по сроку оставила бы занятый слот), сразу errors.FNSTimeoutError
+            Возвращает время ожидания в секундах
+        """
+        remaining = deadline.remaining() if deadline is not None else None
+        delay = self.try_reserve(url, via, remaining)
+        if delay is None:
+            raise FNSTimeoutError('истек срок %.1f c [%s]' % (deadline.timeout, urlsplit(url).netloc))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return max(0.0, delay)
+
+    def ok(self, url, via=None):
+        """
+            Чистый ответ сервиса: скорость для хоста понемногу растет
+        """
+        with self._lock:
+            state = self._state(url, via)
+            state.captcha_streak = 0
+            state.rate = min(self.max_rate, state.rate + self.increase)
+
+    def captcha(self, url, via=None):
+        """
+            Сервис запросил капчу: скорость для хоста снижается, хост ставится на паузу
+            Возвращает длительность паузы в секундах
+        """
+        with self._lock:
+            state = self._state(url, via)
+            state.captchas += 1
+            state.captcha_streak += 1
+            state.rate = max(self.min_rate, state.rate * self.decrease)
+            pause = self._jitter(min(self.max_cooldown, self.cooldown * 2 ** (state.captcha_streak - 1)))
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + pause)
+        return pause
+
+    def poll_delay(self, attempt, base=0.5, factor=1.5, limit=10.0):
+        """
+            Пауза перед повторным опросом статуса ('wait') номер attempt (с 1): экспоненциальный рост с разбросом
+        """
+        return self._jitter(min(limit, base * factor ** (attempt - 1)))
+
+    def stats(self):
+        """
+            Текущая скорость и счетчики по хостам
+        """
+        with self._lock:
+            return {(key if isinstance(key, str) else '%s via %s' % key):
+                    {'rate': s.rate, 'requests': s.requests, 'captchas': s.captchas}
+                    for key, s in self._hosts.items()}
+
+
+default_scheduler = Scheduler()
@@ -0,0 +1,53 @@
+#*- coding: utf-8 -*-
+"""Журнал пакета
+
+    Вся диагностика идет в logging.getLogger('FNS') с ленивым форматированием (аргументы, а не готовые строки)
+    и структурными полями в extra: event ('captcha', 'wait', 'http_error', ...) и данные события
+    (endpoint, status, pause, query, ...). В stdout библиотека ничего не пишет.
+
+    По умолчанию к журналу подключен NullHandler: без настройки logging в приложении сообщения не выводятся
+    и не форматируются. Для вывода в консоль, как print в прежних версиях:
+
+        fns.log.console()
+"""
+import sys
+import logging
+
+
+logger = logging.getLogger('FNS')
+logger.addHandler(logging.NullHandler())
+
+
+class Body(object):
+    """Тело ответа для записи в журнал: текст получается и обрезается только при выводе записи"""
+
+    __slots__ = ('response', 'limit')
+
+    def __init__(self, response, limit=500):
+        self.response = response
+        self.limit = limit
+
+    def __str__(self):
+        body = self.response
+        if hasattr(body, 'text'):
+            body = body.text
+        elif isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        else:
+            body = str(body)
+        if len(body) > self.limit:
+            return body[:self.limit] + '...'
+        return body
+
+
+def console(level=logging.INFO, stream=None):
+    """
+        Вывод журнала пакета в консоль (по умолчанию stdout) только текстом сообщения
+        Возвращает добавленный logging.Handler (его можно убрать logger.removeHandler)
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    if logger.level == logging.NOTSET or logger.level > level:
+        logger.setLevel(level)
+    return handler
@@ -0,0 +1,328 @@
+#*- coding: utf-8 -*-
+"""Метрики и трассировка запросов к сервисам ФНС
+
+    metrics = Metrics(exporters=[SpanRecorder()])
+    org = FNS(metrics=metrics)
+    org.info('7802182340')
+    print(metrics.prometheus())
+
+    Собираются:
+        fns_request_seconds{endpoint}          - гистограмма времени HTTP запроса
+        fns_requests_total{endpoint,status}    - количество запросов по коду ответа ('error' - исключение)
+        fns_retries_total{endpoint}            - повторные попытки
+        fns_captcha_total{endpoint}            - ответы с капчей
+        fns_wait_rounds_total{endpoint}        - ответы 'wait' при опросе готовности
+        fns_pause_seconds{reason}              - время пауз: queue - очередь планировщика и пауза после капчи,
+                                                 poll - паузы между опросами готовности
+        fns_download_bytes_total{endpoint}     - загружено байт
+        fns_pdf_parse_seconds{method}          - время проверки pdf выписки
+    Для операций (info, get_doc_pdf, is_valid_org_check) и каждого HTTP запроса создаются спаны.
+
+    По умолчанию объекты используют NULL_METRICS: проверка одного атрибута enabled, без замеров времени.
+"""
+import time
+import bisect
+import functools
+import threading
+from collections import deque
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # opentelemetry - необязательная зависимость, нужна только для OtelExporter
+    otel_trace = None
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Sample(NamedTuple):
+    """Одно измерение: kind - 'counter' или 'histogram', labels - кортеж пар (метка, значение)"""
+    kind: str
+    name: str
+    value: float
+    labels: tuple = ()
+
+
+class Span(NamedTuple):
+    """Завершенная операция: время начала и окончания (time.time), атрибуты, исключение"""
+    name: str
+    start: float
+    end: float
+    attributes: dict
+    error: Exception = None
+
+
+def endpoint(url):
+    """
+        Имя эндпоинта по адресу: 'search-result', 'vyp-status', 'inn-new-proc.do', ... ('search' для корня)
+    """
+    return urlsplit(url).path.strip('/').split('/', 1)[0] or 'search'
+
+
+class _Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _SpanContext(object):
+
+    def __init__(self, metrics, name, attributes):
+        self.metrics = metrics
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.time()
+        return self.attributes
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.span(Span(self.name, self.start, time.time(), self.attributes, exc))
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def traced(name):
+    """
+        Декоратор метода объекта с полем metrics: спан name на время вызова, если метрики включены
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not self.metrics.enabled:
+                return func(self, *args, **kwargs)
+            with self.metrics.trace(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class NullMetrics(object):
+    """Выключенные метрики: все методы ничего не делают"""
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def span(self, span):
+        pass
+
+    def trace(self, name, **attributes):
+        return _NULL_SPAN
+
+    def request(self, method, url, status, seconds, size=0):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics(NullMetrics):
+    """Сбор метрик в памяти процесса (потокобезопасно) и передача событий экспортерам
+
+        buckets - границы гистограмм, с
+        exporters - объекты с методами on_sample(Sample) и on_span(Span) (Exporter и наследники)
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=BUCKETS, exporters=()):
+        self.buckets = tuple(buckets)
+        self.exporters = list(exporters)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+            Увеличивает счетчик name с метками labels
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        for exporter in self.exporters:
+            exporter.on_sample(Sample('counter', name, value, key[1]))
+
+    def observe(self, name, value, **labels):
+        """
+            Добавляет значение value в гистограмму name с метками labels
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+        for exporter in self.exporters:
+            exporter.on_sample(Sample('histogram', name, value, key[1]))
+
+    def span(self, span):
+        """
+            Передает завершенный спан экспортерам
+        """
+        for exporter in self.exporters:
+            exporter.on_span(span)
+
+    def trace(self, name, **attributes):
+        """
+            Контекстный менеджер спана операции, возвращает словарь атрибутов (его можно дополнять)
+        """
+        return _SpanContext(self, name, attributes)
+
+    def request(self, method, url, status, seconds, size=0):
+        """
+            Итог одного HTTP запроса: время, код ответа (или 'error'), размер ответа
+        """
+        name = endpoint(url)
+        self.observe('fns_request_seconds', seconds, endpoint=name)
+        self.inc('fns_requests_total', endpoint=name, status=str(status))
+        if size:
+            self.inc('fns_download_bytes_total', size, endpoint=name)
+        if self.exporters:
+            end = time.time()
+            self.span(Span('fns.http', end - seconds, end,
+                           {'http.method': method, 'http.url': url, 'http.status_code': status, 'fns.endpoint': name}))
+
+    def counters(self):
+        """
+            Счетчики {(имя, метки): значение}
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def histograms(self):
+        """
+            Гистограммы {(имя, метки): {'buckets': ((граница, накопленное количество), ...), 'sum', 'count'}}
+        """
+        with self._lock:
+            result = {}
+            for key, h in self._histograms.items():
+                cumulative, total = [], 0
+                for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                    total += count
+                    cumulative.append((bound, total))
+                result[key] = {'buckets': tuple(cumulative), 'sum': h.sum, 'count': h.count}
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def prometheus(self):
+        """
+            Текущие значения в текстовом формате Prometheus (exposition format 0.0.4)
+        """
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters().items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s counter' % name)
+            lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+        for (name, labels), h in sorted(self.histograms().items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s histogram' % name)
+            for bound, count in h['buckets']:
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', le),)), count))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), _number(h['sum'])))
+            lines.append('%s_count%s %d' % (name, _labels(labels), h['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Exporter(object):
+    """Базовый экспортер: получает каждое измерение и каждый завершенный спан"""
+
+    def on_sample(self, sample):
+        pass
+
+    def on_span(self, span):
+        pass
+
+
+class CallbackExporter(Exporter):
+    """Передает измерения и спаны в функции on_sample(Sample) / on_span(Span)"""
+
+    def __init__(self, on_sample=None, on_span=None):
+        self._on_sample = on_sample
+        self._on_span = on_span
+
+    def on_sample(self, sample):
+        if self._on_sample is not None:
+            self._on_sample(sample)
+
+    def on_span(self, span):
+        if self._on_span is not None:
+            self._on_span(span)
+
+
+class SpanRecorder(Exporter):
+    """Хранит последние maxlen спанов в памяти в виде словарей в духе OpenTelemetry (для отладки и выгрузки в json)"""
+
+    def __init__(self, maxlen=10000):
+        self.spans = deque(maxlen=maxlen)
+
+    def on_span(self, span):
+        self.spans.append({
+            'name': span.name,
+            'start_time_unix_nano': int(span.start * 1e9),
+            'end_time_unix_nano': int(span.end * 1e9),
+            'attributes': dict(span.attributes),
+            'status': 'ERROR' if span.error is not None else 'OK',
+        })
+
+
+class OtelExporter(Exporter):
+    """Передает спаны в OpenTelemetry (требуется пакет opentelemetry-api)
+
+        tracer - трассировщик opentelemetry, по умолчанию trace.get_tracer('fns')
+    """
+
+    def __init__(self, tracer=None):
+        if otel_trace is None:
+            raise ImportError('для OtelExporter требуется пакет opentelemetry-api')
+        self.tracer = tracer or otel_trace.get_tracer('fns')
+
+    def on_span(self, span):
+        attributes = {k: v for k, v in span.attributes.items() if isinstance(v, (str, bool, int, float))}
+        s = self.tracer.start_span(span.name, start_time=int(span.start * 1e9), attributes=attributes)
+        if span.error is not None:
+            s.record_exception(span.error)
+            s.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR))
+        s.end(end_time=int(span.end * 1e9))
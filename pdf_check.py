@@ -0,0 +1,138 @@
+#*- coding: utf-8 -*-
+import io
+import re
+import itertools
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfminer.high_level
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+
+UNRELIABLE_MARK = 'недостоверн'
+
+_SPACES = re.compile(r'[ \f\n\r\t\v]')
+
+
+class MarkResult(NamedTuple):
+    """Результат поиска отметки в pdf выписке
+
+        found - отметка найдена
+        page - номер страницы с отметкой (с 1), None если не найдена или неизвестна
+        section - заголовок раздела выписки, в котором найдена отметка ('' если неизвестен)
+        method - 'fast' - потоковый поиск по содержимому страниц, 'full' - полное извлечение текста pdfminer
+    """
+    found: bool
+    page: int = None
+    section: str = ''
+    method: str = 'fast'
+
+
+class _MarkFound(Exception):
+    pass
+
+
+def _decode(font, seq):
+    """
+        Текст строки pdf (аргумент оператора TJ/Tj) в шрифте font; символы без unicode пропускаются
+        Общий для _MarkDevice и extract._LineDevice
+    """
+    chars = []
+    for obj in seq:
+        if isinstance(obj, bytes):
+            for cid in font.decode(obj):
+                try:
+                    chars.append(font.to_unichr(cid))
+                except PDFUnicodeNotDefined:
+                    pass
+    return ''.join(chars)
+
+
+class _MarkDevice(PDFDevice):
+    """Устройство pdfminer без разметки страницы: только декодирует строки текста и ищет отметку
+
+        Заголовки разделов выписки набраны жирным шрифтом, последний из них запоминается как текущий раздел.
+    """
+
+    def __init__(self, rsrcmgr, mark):
+        PDFDevice.__init__(self, rsrcmgr)
+        self.mark = mark
+        self.tail = ''  # конец предыдущего текста, отметка может быть разбита между строками
+        self.chars = 0
+        self.section = ''
+        self._bold = False
+
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        font = textstate.font
+        if font is None:
+            return
+        chars = _decode(font, seq)
+        text = _SPACES.sub('', chars)
+        if not text:
+            return
+        self.chars += len(text)
+
+        bold = 'bold' in (font.fontname or '').lower()
+        if bold:
+            line = ' '.join(chars.split())
+            self.section = self.section + ' ' + line if self._bold else line
+        self._bold = bold
+
+        window = self.tail + text
+        if self.mark in window:
+            raise _MarkFound()
+        self.tail = window[-len(self.mark) + 1:]
+
+
+def find_mark(pdf, pages=4, mark=UNRELIABLE_MARK):
+    """
+        Ищет отметку (по умолчанию "недостоверн") в первых pages страницах pdf выписки.
+        Текст декодируется прямо из содержимого страниц без разметки и анализа расположения,
+        поиск останавливается на первом совпадении.
+        Полное извлечение текста pdfminer выполняется, только если быстрым способом текст не получен
+        (шрифты без таблицы ToUnicode, ошибка разбора).
+
+        pdf - bytes, путь к файлу или открытый бинарный файл
+        Возвращает MarkResult
+    """
+    if isinstance(pdf, (bytes, bytearray)):
+        fp = io.BytesIO(pdf)
+    elif isinstance(pdf, str):
+        fp = open(pdf, 'rb')
+    else:
+        fp = pdf
+
+    try:
+        rsrcmgr = PDFResourceManager(caching=True)
+        device = _MarkDevice(rsrcmgr, mark)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        page_num = 0
+        try:
+            for page_num, page in enumerate(PDFPage.get_pages(fp, maxpages=pages), 1):
+                interpreter.process_page(page)
+        except _MarkFound:
+            return MarkResult(True, page_num, device.section, 'fast')
+        except Exception:
+            device.chars = 0
+        if device.chars:
+            return MarkResult(False)
+
+        fp.seek(0)
+        text = _SPACES.sub('', pdfminer.high_level.extract_text(fp, maxpages=pages))
+        return MarkResult(mark in text, method='full')
+    finally:
+        if fp is not pdf:
+            fp.close()
+
+
+def find_mark_many(pdfs, pages=4, processes=None, chunksize=4):
+    """
+        Проверка многих pdf выписок параллельно в пуле процессов (по числу ядер, если processes не задан)
+        pdfs - последовательность путей к файлам или bytes
+        Возвращает список MarkResult в порядке входа
+    """
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(find_mark, pdfs, itertools.repeat(pages), chunksize=chunksize))
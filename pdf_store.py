@@ -0,0 +1,166 @@
+#*- coding: utf-8 -*-
+import os
+import re
+import shutil
+import json
+import tempfile
+import datetime
+
+from .extract import Extract
+
+
+class PdfStore(object):
+    """Хранилище pdf выписок ЕГРЮЛ/ЕГРИП на диске
+
+        Файл выписки: root/<ключ>/<дата выписки>.pdf, ключ - ОГРН или ИНН организации.
+        Рядом хранится разбор выписки <дата выписки>.json (extract.Extract), если она разбиралась целиком.
+        Выписка считается свежей, если ей не больше max_age дней, иначе загружается заново.
+
+        root - каталог хранилища
+        max_age - срок годности выписки в днях
+    """
+
+    _CHUNK = 64 * 1024
+
+    def __init__(self, root, max_age=30):
+        self.root = root
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, key):
+        key = re.sub(r'[^0-9A-Za-z_-]', '_', str(key).strip())
+        return os.path.join(self.root, key)
+
+    def path(self, key, date=None):
+        """
+            Путь к файлу выписки по ключу и дате (по умолчанию сегодня)
+        """
+        date = date or datetime.date.today()
+        return os.path.join(self._dir(key), date.isoformat() + '.pdf')
+
+    def dates(self, key):
+        """
+            Даты сохраненных выписок по ключу, от новой к старой
+        """
+        try:
+            names = os.listdir(self._dir(key))
+        except FileNotFoundError:
+            return []
+        result = []
+        for name in names:
+            if name.endswith('.pdf'):
+                try:
+                    result.append(datetime.date.fromisoformat(name[:-4]))
+                except ValueError:
+                    continue
+        return sorted(result, reverse=True)
+
+    def find(self, key, max_age=None):
+        """
+            Путь к самой новой свежей выписке или None
+            max_age - срок годности в днях (по умолчанию self.max_age)
+        """
+        max_age = self.max_age if max_age is None else max_age
+        dates = self.dates(key)
+        if dates and (datetime.date.today() - dates[0]).days <= max_age:
+            return self.path(key, dates[0])
+        return None
+
+    def get(self, key):
+        """
+            Содержимое свежей выписки или None
+        """
+        path = self.find(key)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, key, data, date=None):
+        """
+            Сохраняет выписку, возвращает путь к файлу
+            data - bytes или итератор по частям файла (запись потоком, без сборки в память)
+            файл появляется в хранилище только после полной записи
+        """
+        path = self.path(key, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    for chunk in data:
+                        f.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._remove(self._parsed_path(path))  # разбор прежней выписки за ту же дату
+        return path
+
+    @staticmethod
+    def _parsed_path(path):
+        return path[:-len('.pdf')] + '.json'
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def extract(self, key, max_age=None):
+        """
+            Разобранная свежая выписка extract.Extract или None, если выписки нет
+            Сохраненный разбор берется из файла .json без чтения pdf; иначе pdf разбирается по мере обращения,
+            а после разбора последней страницы результат сохраняется рядом с pdf.
+            Файл pdf открыт до конца разбора: при чтении части разделов используйте with store.extract(key) as extract
+            или extract.close()
+        """
+        path = self.find(key, max_age)
+        if path is None:
+            return None
+        parsed = self._parsed_path(path)
+        try:
+            with open(parsed, encoding='utf-8') as f:
+                return Extract.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return Extract(path, on_complete=lambda extract: self._save_parsed(parsed, extract))
+
+    def _save_parsed(self, parsed, extract):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(parsed), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(extract.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp, parsed)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def copy_to(self, key, filename):
+        """
+            Копирует свежую выписку в указанный файл потоком, возвращает False если выписки нет
+        """
+        path = self.find(key)
+        if path is None:
+            return False
+        shutil.copyfile(path, filename)
+        return True
+
+    def prune(self, max_age=None):
+        """
+            Удаляет устаревшие выписки, возвращает количество удаленных файлов
+        """
+        max_age = self.max_age if max_age is None else max_age
+        today = datetime.date.today()
+        removed = 0
+        for key in os.listdir(self.root):
+            for date in self.dates(key):
+                if (today - date).days > max_age:
+                    path = self.path(key, date)
+                    os.unlink(path)
+                    self._remove(self._parsed_path(path))
+                    removed += 1
+        return removed
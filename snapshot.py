@@ -0,0 +1,111 @@
+#*- coding: utf-8 -*-
+import json
+import time
+import sqlite3
+import threading
+from typing import NamedTuple
+
+
+# поля записи rows ответа ФНС, которые сравниваются между проверками
+FIELDS = ('k', 'n', 'c', 'a', 'i', 'o', 'p', 'r', 'e', 'v', 'g')
+
+# изменения этих полей требуют повторной проверки выписки:
+# наименование, адрес, руководители, прекращение деятельности, недостоверность
+PDF_FIELDS = ('n', 'a', 'g', 'e', 'v')
+
+
+class SnapshotEntry(NamedTuple):
+    """Последние увиденные данные организации
+
+        row - поля FIELDS записи ответа ФНС
+        seen - время последнего запроса (time.time)
+        checked - время последней проверки выписки, None - не проверялась
+        is_valid_org - результат последней проверки выписки
+    """
+    row: dict
+    seen: float
+    checked: float = None
+    is_valid_org: bool = None
+
+
+class Change(NamedTuple):
+    """Результат повторной проверки одной организации FNS.recheck_many
+
+        query - нормализованный запрос (ИНН/ОГРН)
+        org - объект FNS с заполненными полями, None при ошибке
+        diff - изменившиеся поля {поле: (было, стало)}, для новой организации - все непустые поля
+        is_new - организации не было в снимке
+        rechecked - выписка загружалась и проверялась заново
+        error - исключение, если запрос завершился ошибкой
+    """
+    query: str
+    org: object = None
+    diff: dict = {}
+    is_new: bool = False
+    rechecked: bool = False
+    error: Exception = None
+
+
+def diff_rows(old, new, fields=FIELDS):
+    """
+        Изменившиеся поля двух записей ответа ФНС {поле: (было, стало)}, old = None - все непустые поля new
+    """
+    old = old or {}
+    diff = {}
+    for field in fields:
+        a, b = old.get(field, ''), new.get(field, '')
+        if a != b:
+            diff[field] = (a, b)
+    return diff
+
+
+class Snapshot(object):
+    """Снимок последних увиденных данных организаций в файле SQLite для инкрементальной повторной проверки
+
+        path - путь к файлу базы (':memory:' - в памяти)
+        Ключ - нормализованный ИНН/ОГРН (cache.normalize_query).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS snapshot '
+                           '(key TEXT PRIMARY KEY, row TEXT, seen REAL, checked REAL, is_valid_org INTEGER)')
+
+    def get(self, key):
+        """
+            SnapshotEntry по ключу или None
+        """
+        with self._lock:
+            r = self._conn.execute('SELECT row, seen, checked, is_valid_org FROM snapshot WHERE key = ?',
+                                   (key,)).fetchone()
+        if r is None:
+            return None
+        return SnapshotEntry(json.loads(r[0]), r[1], r[2], None if r[3] is None else bool(r[3]))
+
+    def put(self, key, row, checked=None, is_valid_org=None):
+        """
+            Сохраняет поля FIELDS записи row, время проверки выписки и ее результат
+        """
+        data = json.dumps({f: row[f] for f in FIELDS if f in row}, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?, ?)',
+                               (key, data, time.time(), checked,
+                                None if is_valid_org is None else int(is_valid_org)))
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM snapshot WHERE key = ?', (key,))
+
+    def keys(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute('SELECT key FROM snapshot')]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM snapshot').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,169 @@
+#*- coding: utf-8 -*-
+"""Ошибки ФНС на локальном сервере fake_nalog.FakeNalog: капча, ошибки HTTP, ответ не pdf, срок операции"""
+import os
+import json
+import asyncio
+
+import pytest
+
+from .. import cli
+from ..cache import MemoryCache
+from ..client import Client
+from ..errors import FNSError, FNSTimeoutError
+from ..fake_nalog import FakeNalog, sample_row
+from ..limiter import Scheduler
+from ..pdf_store import PdfStore
+from ..record import parse_row
+from ..transport import Deadline
+
+
+INN = '7707083893'
+
+
+def fast_scheduler():
+    # без пауз: капча и ошибки не замедляют тесты
+    return Scheduler(rate=1000, max_rate=1000, burst=100, cooldown=0.001, max_cooldown=0.001)
+
+
+@pytest.fixture
+def fake():
+    with FakeNalog() as server:
+        yield server
+
+
+def make_client(fake, **options):
+    return Client(base_url=fake.url, scheduler=fast_scheduler(), **options)
+
+
+def stored_files(root):
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+# ---------------- поиск
+
+def test_search_found(fake):
+    assert make_client(fake).info(INN).inn == INN
+
+
+def test_search_captcha_exhausted_raises_and_is_not_cached(fake):
+    fake.captcha_rate = 1.0
+    cache = MemoryCache()
+    client = make_client(fake, cache=cache)
+    with pytest.raises(FNSError):
+        client.search(INN, attempts=2)
+    assert cache.get(INN) is None
+
+
+@pytest.mark.parametrize('endpoint', ['search', 'search-result'])
+def test_search_http_error_raises(fake, endpoint):
+    fake.errors[endpoint] = 500
+    with pytest.raises(FNSError):
+        make_client(fake).search(INN, attempts=2)
+
+
+def test_search_wait_exhausted_raises(fake):
+    fake.wait_rounds = 5
+    client = make_client(fake)
+    client.scheduler.poll_delay = lambda attempt: 0.001
+    with pytest.raises(FNSError):
+        client.search(INN, attempts=2)
+
+
+def test_info_many_exhausted_is_error_not_empty_result(fake):
+    fake.captcha_rate = 1.0
+    results = list(make_client(fake).info_many([INN, INN], attempts=2))
+    assert len(results) == 1
+    assert results[0].indexes == (0, 1)
+    assert results[0].org is None
+    assert isinstance(results[0].error, FNSError)
+
+
+# ---------------- выписка
+
+def test_download_http_error_is_not_stored(fake, tmp_path):
+    fake.errors['vyp-download'] = 502
+    client = make_client(fake, pdf_store=PdfStore(str(tmp_path)))
+    with pytest.raises(FNSError):
+        client.doc_path(parse_row(sample_row(INN)))
+    assert stored_files(tmp_path) == []
+
+
+def test_download_not_pdf_is_not_stored(fake, tmp_path):
+    fake.pdf = b'<html>service unavailable</html>'
+    client = make_client(fake, pdf_store=PdfStore(str(tmp_path)))
+    with pytest.raises(FNSError):
+        client.doc_path(parse_row(sample_row(INN)))
+    assert stored_files(tmp_path) == []
+
+
+def test_doc_pdf_many_download_error_is_not_stored(fake, tmp_path):
+    fake.errors['vyp-download'] = 404
+    client = make_client(fake, pdf_store=PdfStore(str(tmp_path)))
+    orgs = [parse_row(sample_row(q)) for q in (INN, '7802182340')]
+    results = list(client.doc_pdf_many(orgs, delay=0.001))
+    assert len(results) == 2
+    assert all(isinstance(r.error, FNSError) and r.path is None for r in results)
+    assert stored_files(tmp_path) == []
+
+
+def test_doc_pdf_many_duplicate_tokens_share_result(fake):
+    client = make_client(fake)
+    results = list(client.doc_pdf_many(['DOC1', 'DOC2', 'DOC1'], delay=0.001))
+    assert sorted(r.doc_token for r in results) == ['DOC1', 'DOC1', 'DOC2']
+    assert all(r.error is None and r.pdf.startswith(b'%PDF') for r in results)
+
+
+# ---------------- планировщик
+
+def test_async_wait_past_deadline_does_not_reserve():
+    scheduler = Scheduler(rate=1, max_rate=1, burst=1)
+    url = 'https://egrul.nalog.ru'
+    scheduler.reserve(url)
+    before = scheduler.delay(url)
+
+    async def waits():
+        for _ in range(20):
+            with pytest.raises(FNSTimeoutError):
+                await scheduler.async_wait(url, deadline=Deadline(0.1))
+
+    asyncio.run(waits())
+    assert scheduler.delay(url) <= before
+    assert scheduler.stats()['egrul.nalog.ru']['requests'] == 1
+
+
+def test_async_search_deadline_leaves_no_reservation(fake):
+    pytest.importorskip('aiohttp')
+    from ..afns import AsyncFNS
+    scheduler = Scheduler(rate=1, max_rate=1, burst=1)
+
+    async def run():
+        async with AsyncFNS(base_url=fake.url, scheduler=scheduler) as afns:
+            await afns.search(INN)
+            results = await asyncio.gather(*(afns.search(INN, deadline=0.3) for _ in range(10)),
+                                           return_exceptions=True)
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, FNSTimeoutError) for r in results)
+    assert scheduler.delay(fake.url) < 1.5
+
+
+# ---------------- cli --checkpoint
+
+def test_cli_checkpoint_retries_exhausted_queries(fake, tmp_path, monkeypatch):
+    monkeypatch.setattr(Client, '_URL_BASE', fake.url)
+    queries, output, checkpoint = tmp_path / 'in.txt', tmp_path / 'out.jsonl', tmp_path / 'done.txt'
+    queries.write_text(INN + '\n')
+    argv = [str(queries), '-o', str(output), '--checkpoint', str(checkpoint), '--attempts', '1',
+            '--rate', '1000', '--max-rate', '1000', '-q']
+
+    fake.captcha_rate = 1.0
+    assert cli.main(argv) == 1
+    assert not output.exists() or output.read_text() == ''
+    assert checkpoint.read_text() == ''
+
+    fake.captcha_rate = 0.0
+    assert cli.main(argv) == 0
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(r['query'], r['inn'], r['error']) for r in rows] == [(INN, INN, '')]
+    assert checkpoint.read_text().split() == [INN]
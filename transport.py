@@ -0,0 +1,103 @@
+#*- coding: utf-8 -*-
+import time
+
+import requests
+import requests.adapters
+
+from .errors import FNSTimeoutError
+
+
+DEFAULT_POOL_SIZE = requests.adapters.DEFAULT_POOLSIZE
+DEFAULT_TIMEOUT = (10, 60)  # (соединение, чтение), с
+
+
+def make_session(pool_size=DEFAULT_POOL_SIZE, proxy=None):
+    """
+        requests.Session с пулом keep-alive соединений на pool_size соединений к одному хосту
+        proxy - словарь прокси в формате requests {'https': 'http://host:port'}
+        Одну сессию можно передать в FNS(session=...) и fl.FL(session=...), тогда оба сервиса
+        используют общие соединения.
+    """
+    session = requests.Session()
+    set_pool_size(session, pool_size)
+    if proxy:
+        set_proxy(session, proxy)
+    return session
+
+
+def set_pool_size(session, pool_size):
+    """
+        Заменяет адаптеры http/https сессии на адаптеры с пулом pool_size соединений,
+        если текущий пул меньше. Возвращает session
+    """
+    adapter = session.get_adapter('https://')
+    if getattr(adapter, '_pool_maxsize', 0) < pool_size:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    return session
+
+
+def set_proxy(session, proxy):
+    """
+        Все запросы сессии через прокси, без учета переменных окружения
+    """
+    session.proxies.update(proxy)
+    session.trust_env = False
+    return session
+
+
+class Deadline(object):
+    """Общий срок выполнения операции (info, get_doc_pdf, ...), включая все попытки и паузы
+
+        timeout - сколько секунд отводится на операцию, None - без ограничения
+        Перед каждым запросом и паузой проверяется остаток: если его не хватает,
+        сразу выбрасывается errors.FNSTimeoutError, без бесполезного ожидания.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.at = None if timeout is None else time.monotonic() + timeout
+
+    @classmethod
+    def of(cls, deadline):
+        """
+            Deadline из числа секунд, None или готового Deadline (вложенные вызовы используют срок внешней операции)
+        """
+        return deadline if isinstance(deadline, Deadline) else cls(deadline)
+
+    def remaining(self):
+        """
+            Остаток срока в секундах, None - без ограничения
+        """
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
+
+    def check(self, what='', need=0.0):
+        """
+            FNSTimeoutError, если до конца срока осталось не больше need секунд
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= need:
+            raise FNSTimeoutError('истек срок %.1f c%s' % (self.timeout, ' [%s]' % what if what else ''))
+
+    def sleep(self, seconds, what=''):
+        """
+            Пауза, которая должна закончиться до конца срока
+        """
+        self.check(what, seconds)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def request_timeout(self, timeout, what=''):
+        """
+            Таймаут одного запроса (число или кортеж (соединение, чтение)), ограниченный остатком срока
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        self.check(what)
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return remaining if timeout is None else min(timeout, remaining)